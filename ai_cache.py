@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+from sqlalchemy import delete, func, select, update
+
+from database import SessionLocal
+from metrics import CACHE_EVENTS
+from models import AICacheEntry
+
+logger = logging.getLogger(__name__)
+
+_STATS_LOCK = threading.Lock()
+_STATS: Dict[str, int] = {
+    "hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+    "bypassed": 0,
+    "errors": 0,
+}
+
+
+def _env_int(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        value = int(os.getenv(name, str(default)))
+    except Exception:
+        value = default
+    return max(minimum, value)
+
+
+def cache_enabled() -> bool:
+    return os.getenv("AI_CACHE_ENABLED", "true").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def _ttl_seconds() -> int:
+    return _env_int("AI_CACHE_TTL_SECONDS", 7 * 24 * 3600, minimum=1)
+
+
+def _max_entries() -> int:
+    return _env_int("AI_CACHE_MAX_ENTRIES", 5000, minimum=1)
+
+
+def _max_bytes() -> int:
+    return _env_int("AI_CACHE_MAX_BYTES", 50 * 1024 * 1024, minimum=1)
+
+
+_EXPORTED_EVENTS = {"hits": "hit", "misses": "miss", "bypassed": "bypass"}
+
+
+def _bump(name: str, amount: int = 1) -> None:
+    with _STATS_LOCK:
+        _STATS[name] = _STATS.get(name, 0) + amount
+    if name in _EXPORTED_EVENTS:
+        CACHE_EVENTS.labels("ai", _EXPORTED_EVENTS[name]).inc(amount)
+
+
+def record_bypass() -> None:
+    _bump("bypassed")
+
+
+def build_cache_key(
+    *,
+    kind: str,
+    model: str,
+    sys_prompt: str,
+    user_input: str,
+    max_steps: int,
+    image_bytes: bytes | None = None,
+    image_mime: str | None = None,
+) -> str:
+    # O prompt ja chega normalizado (_sanitize_text/_normalize_list); o casefold
+    # faz pedidos que so diferem em maiusculas/minusculas cairem na mesma entrada.
+    image_digest = hashlib.sha256(image_bytes).hexdigest() if image_bytes else ""
+    material = json.dumps(
+        {
+            "kind": kind,
+            "model": model,
+            "system": " ".join(sys_prompt.split()).casefold(),
+            "input": " ".join(user_input.split()).casefold(),
+            "max_steps": int(max_steps),
+            "image": image_digest,
+            "mime": (image_mime or "") if image_bytes else "",
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def get_cached(cache_key: str) -> Dict[str, Any] | None:
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        row = db.execute(
+            select(AICacheEntry.id, AICacheEntry.payload, AICacheEntry.expires_at).where(
+                AICacheEntry.cache_key == cache_key
+            )
+        ).first()
+        if row is None:
+            _bump("misses")
+            return None
+        if row.expires_at <= now:
+            db.execute(delete(AICacheEntry).where(AICacheEntry.id == row.id))
+            db.commit()
+            _bump("misses")
+            _bump("evictions")
+            return None
+        db.execute(
+            update(AICacheEntry)
+            .where(AICacheEntry.id == row.id)
+            .values(hits=AICacheEntry.hits + 1, last_hit_at=now)
+        )
+        db.commit()
+        _bump("hits")
+        return json.loads(row.payload)
+    except Exception:
+        db.rollback()
+        _bump("errors")
+        logger.exception("Falha ao ler cache de IA")
+        return None
+    finally:
+        db.close()
+
+
+def store(cache_key: str, *, kind: str, model: str, result: Dict[str, Any]) -> None:
+    now = datetime.utcnow()
+    payload = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+    size = len(payload.encode("utf-8"))
+    if size > _max_bytes():
+        return
+    db = SessionLocal()
+    try:
+        db.execute(delete(AICacheEntry).where(AICacheEntry.cache_key == cache_key))
+        db.add(
+            AICacheEntry(
+                cache_key=cache_key,
+                kind=kind,
+                model=model,
+                payload=payload,
+                size_bytes=size,
+                hits=0,
+                created_at=now,
+                last_hit_at=now,
+                expires_at=now + timedelta(seconds=_ttl_seconds()),
+            )
+        )
+        db.flush()
+        evicted = _evict(db, now)
+        db.commit()
+        _bump("stores")
+        if evicted:
+            _bump("evictions", evicted)
+    except Exception:
+        db.rollback()
+        _bump("errors")
+        logger.exception("Falha ao gravar cache de IA")
+    finally:
+        db.close()
+
+
+def _evict(db, now: datetime) -> int:
+    evicted = db.execute(delete(AICacheEntry).where(AICacheEntry.expires_at <= now)).rowcount or 0
+
+    count, total = db.execute(
+        select(func.count(AICacheEntry.id), func.coalesce(func.sum(AICacheEntry.size_bytes), 0))
+    ).one()
+    max_entries = _max_entries()
+    max_bytes = _max_bytes()
+    if count <= max_entries and total <= max_bytes:
+        return evicted
+
+    # LRU: remove as entradas menos usadas recentemente ate voltar ao limite.
+    victims: list[int] = []
+    rows = db.execute(
+        select(AICacheEntry.id, AICacheEntry.size_bytes).order_by(
+            AICacheEntry.last_hit_at.asc(), AICacheEntry.id.asc()
+        )
+    )
+    for entry_id, size in rows:
+        if count <= max_entries and total <= max_bytes:
+            break
+        victims.append(entry_id)
+        count -= 1
+        total -= size or 0
+    if victims:
+        db.execute(delete(AICacheEntry).where(AICacheEntry.id.in_(victims)))
+    return evicted + len(victims)
+
+
+def clear_cache() -> int:
+    db = SessionLocal()
+    try:
+        removed = db.execute(delete(AICacheEntry)).rowcount or 0
+        db.commit()
+        return removed
+    finally:
+        db.close()
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        stats: Dict[str, Any] = dict(_STATS)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    db = SessionLocal()
+    try:
+        entries, total_bytes, total_hits = db.execute(
+            select(
+                func.count(AICacheEntry.id),
+                func.coalesce(func.sum(AICacheEntry.size_bytes), 0),
+                func.coalesce(func.sum(AICacheEntry.hits), 0),
+            )
+        ).one()
+    finally:
+        db.close()
+    stats.update(
+        {
+            "enabled": cache_enabled(),
+            "entries": int(entries),
+            "size_bytes": int(total_bytes),
+            "stored_hits": int(total_hits),
+            "max_entries": _max_entries(),
+            "max_bytes": _max_bytes(),
+            "ttl_seconds": _ttl_seconds(),
+        }
+    )
+    return stats
+
+
+def reset_stats() -> None:
+    with _STATS_LOCK:
+        for key in _STATS:
+            _STATS[key] = 0
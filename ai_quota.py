@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import AIUsage, Company
+from plan_utils import get_plan_tier, normalize_plan_name
+
+logger = logging.getLogger(__name__)
+
+_Key = Tuple[int, str]
+
+# Contadores do processo: "pending" ja foi consumido mas ainda nao foi gravado
+# no banco; "reserved" esta com uma chamada a Gemini em andamento.
+_LOCK = threading.Lock()
+_PENDING: Dict[_Key, int] = {}
+_RESERVED: Dict[_Key, int] = {}
+_LAST_FLUSH = time.monotonic()
+_FLUSH_TASK: asyncio.Task | None = None
+
+
+class AIQuotaExceededError(RuntimeError):
+    def __init__(self, plan_name: str, limit: int, used: int):
+        super().__init__(
+            f"Plano {plan_name.capitalize()} permite no maximo {limit} geracoes de IA por mes."
+        )
+        self.plan_name = plan_name
+        self.limit = limit
+        self.used = used
+
+
+def _env_int(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        value = int(os.getenv(name, str(default)))
+    except Exception:
+        value = default
+    return max(minimum, value)
+
+
+def _flush_batch() -> int:
+    return _env_int("AI_USAGE_FLUSH_BATCH", 10, minimum=1)
+
+
+def _flush_interval() -> int:
+    return _env_int("AI_USAGE_FLUSH_INTERVAL", 5, minimum=1)
+
+
+def current_period(now: datetime | None = None) -> str:
+    return (now or datetime.utcnow()).strftime("%Y-%m")
+
+
+def company_ai_limit(db: Session, company_id: int) -> tuple[str, int | None]:
+    plan_raw = db.execute(select(Company.plan_name).where(Company.id == company_id)).scalar_one_or_none()
+    plan_name = normalize_plan_name(plan_raw)
+    return plan_name, get_plan_tier(plan_name).limits.ai_generations_per_month
+
+
+def _stored_usage(db: Session, company_id: int, period: str) -> int:
+    value = db.execute(
+        select(AIUsage.count).where(AIUsage.company_id == company_id, AIUsage.period == period)
+    ).scalar_one_or_none()
+    return int(value or 0)
+
+
+def get_usage(db: Session, company_id: int | None, period: str | None = None) -> int:
+    if not company_id:
+        return 0
+    period = period or current_period()
+    stored = _stored_usage(db, company_id, period)
+    with _LOCK:
+        return stored + _PENDING.get((company_id, period), 0)
+
+
+class AIQuotaReservation:
+    """Vaga reservada para uma geracao de IA.
+
+    A reserva entra na conta da cota enquanto a chamada esta em andamento, para
+    que requisicoes simultaneas da mesma empresa nao passem todas do limite.
+    """
+
+    def __init__(self, key: _Key | None):
+        self._key = key
+        self._done = key is None
+
+    def finish(self, consumed: bool) -> None:
+        if self._done:
+            return
+        self._done = True
+        key = self._key
+        with _LOCK:
+            remaining = _RESERVED.get(key, 0) - 1
+            if remaining > 0:
+                _RESERVED[key] = remaining
+            else:
+                _RESERVED.pop(key, None)
+            if consumed:
+                _PENDING[key] = _PENDING.get(key, 0) + 1
+
+    def release(self) -> None:
+        self.finish(consumed=False)
+
+
+def reserve_ai_generation(db: Session, company_id: int | None) -> AIQuotaReservation:
+    if not company_id:
+        return AIQuotaReservation(None)
+    plan_name, limit = company_ai_limit(db, company_id)
+    period = current_period()
+    key = (company_id, period)
+    if limit is None:
+        with _LOCK:
+            _RESERVED[key] = _RESERVED.get(key, 0) + 1
+        return AIQuotaReservation(key)
+
+    stored = _stored_usage(db, company_id, period)
+    with _LOCK:
+        used = stored + _PENDING.get(key, 0) + _RESERVED.get(key, 0)
+        if used >= limit:
+            raise AIQuotaExceededError(plan_name, limit, used)
+        _RESERVED[key] = _RESERVED.get(key, 0) + 1
+    return AIQuotaReservation(key)
+
+
+class PendingAIQuota:
+    """Cota reservada so quando a resposta nao vem do cache.
+
+    Passado como on_cache_miss das geracoes de IA: roda depois do cache e antes
+    da Gemini, entao empresa no limite ainda recebe o que ja esta em cache.
+    """
+
+    def __init__(self, db: Session, company_id: int | None):
+        self._db = db
+        self._company_id = company_id
+        self._reservation: AIQuotaReservation | None = None
+
+    async def __call__(self) -> None:
+        self._reservation = await asyncio.to_thread(reserve_ai_generation, self._db, self._company_id)
+
+    def finish(self, consumed: bool) -> None:
+        if self._reservation is not None:
+            self._reservation.finish(consumed)
+
+
+def needs_flush() -> bool:
+    with _LOCK:
+        pending = sum(_PENDING.values())
+    if not pending:
+        return False
+    return pending >= _flush_batch() or time.monotonic() - _LAST_FLUSH >= _flush_interval()
+
+
+def _apply_increment(db: Session, company_id: int, period: str, amount: int) -> None:
+    stmt = (
+        update(AIUsage)
+        .where(AIUsage.company_id == company_id, AIUsage.period == period)
+        .values(count=AIUsage.count + amount, updated_at=datetime.utcnow())
+    )
+    if db.execute(stmt).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.add(AIUsage(company_id=company_id, period=period, count=amount))
+    except IntegrityError:
+        # Outro worker criou a linha entre o UPDATE e o INSERT.
+        db.execute(stmt)
+
+
+def flush_usage() -> int:
+    global _LAST_FLUSH
+    with _LOCK:
+        batch = dict(_PENDING)
+        _PENDING.clear()
+        _LAST_FLUSH = time.monotonic()
+    if not batch:
+        return 0
+
+    db = SessionLocal()
+    try:
+        for (company_id, period), amount in batch.items():
+            _apply_increment(db, company_id, period, amount)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Falha ao gravar uso de IA; contagem mantida em memoria")
+        with _LOCK:
+            for key, amount in batch.items():
+                _PENDING[key] = _PENDING.get(key, 0) + amount
+        return 0
+    finally:
+        db.close()
+    return sum(batch.values())
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(_flush_interval())
+        if needs_flush():
+            await asyncio.to_thread(flush_usage)
+
+
+def start_usage_flusher() -> None:
+    global _FLUSH_TASK
+    if _FLUSH_TASK is None or _FLUSH_TASK.done():
+        _FLUSH_TASK = asyncio.get_running_loop().create_task(_flush_loop())
+
+
+async def stop_usage_flusher() -> None:
+    global _FLUSH_TASK
+    task, _FLUSH_TASK = _FLUSH_TASK, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, RuntimeError):
+            pass
+    await asyncio.to_thread(flush_usage)
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import json
 import logging
 import os
 import re
 import unicodedata
-import urllib.error
-import urllib.request
-from typing import Any, Dict, List
-
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+import ai_cache
+from gemini_client import (
+    GeminiConfigError,
+    GeminiConnectionError,
+    GeminiHTTPError,
+    gemini_model,
+    get_gemini_client,
+)
 from text_normalizer import normalize_text, normalize_list
 
 logger = logging.getLogger(__name__)
@@ -332,32 +340,14 @@ def _parse_error_message(body: str) -> str:
     return body.strip()
 
 
-def _call_gemini(payload: Dict[str, Any]) -> Dict[str, Any]:
-    api_key = (os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY") or "").strip()
-    if not api_key:
-        raise AIConfigError("GEMINI_API_KEY/GOOGLE_API_KEY nao configurada")
-
-    model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
-    base_url = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta")
-    url = f"{base_url}/models/{model}:generateContent"
-
-    data = json.dumps(payload).encode("utf-8")
-    headers = {
-        "Content-Type": "application/json",
-        "x-goog-api-key": api_key,
-    }
-    req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-    timeout = float(os.getenv("GEMINI_TIMEOUT", "30"))
+async def _call_gemini(payload: Dict[str, Any]) -> Dict[str, Any]:
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            body = resp.read().decode("utf-8")
-            return json.loads(body)
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8", errors="ignore")
-        logger.error("Gemini HTTP %s: %s", exc.code, detail)
-        raise AIResponseError(_parse_error_message(detail) or f"Gemini HTTP {exc.code}") from exc
-    except urllib.error.URLError as exc:
-        logger.error("Gemini connection error: %s", exc)
+        return await get_gemini_client().generate_content(payload)
+    except GeminiConfigError as exc:
+        raise AIConfigError(str(exc)) from exc
+    except GeminiHTTPError as exc:
+        raise AIResponseError(_parse_error_message(exc.body) or f"Gemini HTTP {exc.status_code}") from exc
+    except GeminiConnectionError as exc:
         raise AIResponseError("Gemini connection error") from exc
 
 
@@ -374,21 +364,74 @@ def _extract_gemini_text(payload: Dict[str, Any]) -> str:
     return ""
 
 
-def _call_gemini_with_fallback(payload: Dict[str, Any]) -> Dict[str, Any]:
+def _is_mime_unsupported(message: str) -> bool:
+    return "responseMimeType" in message or "mimeType" in message or "not supported" in message
+
+
+def _without_response_mime(payload: Dict[str, Any]) -> Dict[str, Any]:
+    payload = dict(payload)
+    gen = dict(payload.get("generationConfig") or {})
+    gen.pop("responseMimeType", None)
+    payload["generationConfig"] = gen
+    return payload
+
+
+async def _call_gemini_with_fallback(payload: Dict[str, Any]) -> Dict[str, Any]:
     try:
-        return _call_gemini(payload)
+        return await _call_gemini(payload)
     except AIResponseError as exc:
-        msg = str(exc)
-        if "responseMimeType" in msg or "mimeType" in msg or "not supported" in msg:
-            payload = dict(payload)
-            gen = dict(payload.get("generationConfig") or {})
-            gen.pop("responseMimeType", None)
-            payload["generationConfig"] = gen
-            return _call_gemini(payload)
+        if _is_mime_unsupported(str(exc)):
+            return await _call_gemini(_without_response_mime(payload))
         raise
 
 
-def generate_ai_steps(
+async def _stream_gemini(payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    try:
+        async with aclosing(get_gemini_client().stream_generate_content(payload)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+    except GeminiConfigError as exc:
+        raise AIConfigError(str(exc)) from exc
+    except GeminiHTTPError as exc:
+        raise AIResponseError(_parse_error_message(exc.body) or f"Gemini HTTP {exc.status_code}") from exc
+    except GeminiConnectionError as exc:
+        raise AIResponseError("Gemini connection error") from exc
+
+
+async def _stream_gemini_with_fallback(payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    emitted = False
+    try:
+        async with aclosing(_stream_gemini(payload)) as chunks:
+            async for chunk in chunks:
+                emitted = True
+                yield chunk
+    except AIResponseError as exc:
+        if emitted or not _is_mime_unsupported(str(exc)):
+            raise
+        async with aclosing(_stream_gemini(_without_response_mime(payload))) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+
+# Chamado quando a resposta nao esta em cache, antes da Gemini (ex.: reservar cota).
+CacheMissHook = Callable[[], Awaitable[None]]
+
+
+async def _cache_lookup(cache_key: str, use_cache: bool) -> Dict[str, Any] | None:
+    if not ai_cache.cache_enabled():
+        return None
+    if not use_cache:
+        ai_cache.record_bypass()
+        return None
+    return await asyncio.to_thread(ai_cache.get_cached, cache_key)
+
+
+async def _cache_store(cache_key: str, kind: str, model: str, result: Dict[str, Any]) -> None:
+    if ai_cache.cache_enabled():
+        await asyncio.to_thread(ai_cache.store, cache_key, kind=kind, model=model, result=result)
+
+
+async def generate_ai_steps(
     *,
     atividade: str,
     descricao: str,
@@ -396,6 +439,8 @@ def generate_ai_steps(
     energias: List[str] | None = None,
     contexto: Dict[str, Any] | None = None,
     max_steps: int = 6,
+    use_cache: bool = True,
+    on_cache_miss: CacheMissHook | None = None,
 ) -> Dict[str, Any]:
     ferramentas = _normalize_list(ferramentas, "ferramentas")
     energias = _normalize_list(energias, "energias")
@@ -412,6 +457,20 @@ def generate_ai_steps(
         max_steps,
     )
 
+    model = gemini_model()
+    cache_key = ai_cache.build_cache_key(
+        kind="steps",
+        model=model,
+        sys_prompt=sys_prompt,
+        user_input=user_input,
+        max_steps=max_steps,
+    )
+    cached = await _cache_lookup(cache_key, use_cache)
+    if cached is not None:
+        return {**cached, "cached": True}
+    if on_cache_miss is not None:
+        await on_cache_miss()
+
     retries = _max_retries()
     for attempt in range(1, retries + 1):
         current_prompt = sys_prompt if attempt == 1 else _reinforce_prompt(sys_prompt)
@@ -431,7 +490,7 @@ def generate_ai_steps(
             },
         }
 
-        response = _call_gemini_with_fallback(payload)
+        response = await _call_gemini_with_fallback(payload)
         output_text = _extract_gemini_text(response)
         if not output_text:
             raise AIResponseError("Gemini sem output_text")
@@ -466,15 +525,16 @@ def generate_ai_steps(
                 raise AITextInvalidEncodingError(_INVALID_ENCODING_MESSAGE)
             continue
 
-        return {"passos": normalized[:max_steps], "source": "gemini"}
+        result = {"passos": normalized[:max_steps], "source": "gemini"}
+        await _cache_store(cache_key, "steps", model, result)
+        return {**result, "cached": False}
 
 
-def generate_ai_steps_from_image(
-    *,
+def _prepare_image_steps_request(
     image_bytes: bytes | None,
     image_mime: str | None,
     descricao: str | None,
-    max_steps: int = 6,
+    max_steps: int,
 ) -> Dict[str, Any]:
     max_steps = max(1, min(int(max_steps), 12))
     use_image = bool(image_bytes)
@@ -490,6 +550,17 @@ def generate_ai_steps_from_image(
         use_image=use_image,
     )
 
+    model = gemini_model()
+    cache_key = ai_cache.build_cache_key(
+        kind="image_steps",
+        model=model,
+        sys_prompt=sys_prompt,
+        user_input=user_input,
+        max_steps=max_steps,
+        image_bytes=image_bytes if use_image else None,
+        image_mime=image_mime,
+    )
+
     parts: List[Dict[str, Any]] = [{"text": user_input}]
     if use_image:
         mime = image_mime or "image/jpeg"
@@ -505,24 +576,56 @@ def generate_ai_steps_from_image(
             }
         )
 
+    return {
+        "sys_prompt": sys_prompt,
+        "parts": parts,
+        "max_steps": max_steps,
+        "model": model,
+        "cache_key": cache_key,
+    }
+
+
+def _image_steps_payload(request: Dict[str, Any], attempt: int) -> Dict[str, Any]:
+    sys_prompt = request["sys_prompt"]
+    current_prompt = sys_prompt if attempt == 1 else _reinforce_prompt(sys_prompt)
+    return {
+        "system_instruction": {"parts": [{"text": current_prompt}]},
+        "contents": [
+            {
+                "role": "user",
+                "parts": request["parts"],
+            }
+        ],
+        "generationConfig": {
+            "temperature": 0.2,
+            "responseMimeType": "application/json",
+        },
+    }
+
+
+async def generate_ai_steps_from_image(
+    *,
+    image_bytes: bytes | None,
+    image_mime: str | None,
+    descricao: str | None,
+    max_steps: int = 6,
+    use_cache: bool = True,
+    on_cache_miss: CacheMissHook | None = None,
+) -> Dict[str, Any]:
+    request = _prepare_image_steps_request(image_bytes, image_mime, descricao, max_steps)
+    max_steps = request["max_steps"]
+
+    cached = await _cache_lookup(request["cache_key"], use_cache)
+    if cached is not None:
+        return {**cached, "cached": True}
+    if on_cache_miss is not None:
+        await on_cache_miss()
+
     retries = _max_retries()
     for attempt in range(1, retries + 1):
-        current_prompt = sys_prompt if attempt == 1 else _reinforce_prompt(sys_prompt)
-        payload = {
-            "system_instruction": {"parts": [{"text": current_prompt}]},
-            "contents": [
-                {
-                    "role": "user",
-                    "parts": parts,
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.2,
-                "responseMimeType": "application/json",
-            },
-        }
+        payload = _image_steps_payload(request, attempt)
 
-        response = _call_gemini_with_fallback(payload)
+        response = await _call_gemini_with_fallback(payload)
         output_text = _extract_gemini_text(response)
         if not output_text:
             raise AIResponseError("Gemini sem output_text")
@@ -559,4 +662,141 @@ def generate_ai_steps_from_image(
                 raise AITextInvalidEncodingError(_INVALID_ENCODING_MESSAGE)
             continue
 
-        return {"steps": normalized}
+        result = {"steps": normalized}
+        await _cache_store(request["cache_key"], "image_steps", request["model"], result)
+        return {**result, "cached": False}
+
+
+class _StepStreamExtractor:
+    """Extrai objetos de passo completos de um JSON que chega em pedacos.
+
+    Um passo e qualquer objeto cujo pai imediato e a lista principal
+    ({"steps": [...]} ou [...] direto). Texto fora do JSON (cercas de markdown)
+    e ignorado.
+    """
+
+    def __init__(self) -> None:
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._capture_depth: int | None = None
+        self._current: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        found: List[Dict[str, Any]] = []
+        for ch in text:
+            if self._capture_depth is not None:
+                self._current.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if not self._stack and ch not in "{[":
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if (
+                    ch == "{"
+                    and self._capture_depth is None
+                    and self._stack
+                    and self._stack[-1] == "["
+                    and len(self._stack) <= 2
+                ):
+                    self._capture_depth = len(self._stack)
+                    self._current = ["{"]
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._capture_depth is not None and len(self._stack) == self._capture_depth:
+                    raw = "".join(self._current)
+                    self._capture_depth = None
+                    self._current = []
+                    try:
+                        obj = json.loads(raw)
+                    except json.JSONDecodeError as exc:
+                        logger.error("Falha ao decodificar passo da Gemini: %s", raw[:500])
+                        raise AIResponseError("JSON invalido da Gemini") from exc
+                    if isinstance(obj, dict):
+                        found.append(obj)
+        return found
+
+
+def _extract_chunk_text(payload: Dict[str, Any]) -> str:
+    # Sem strip: espacos nas bordas do chunk fazem parte do texto.
+    candidates = payload.get("candidates") or []
+    if not candidates:
+        return ""
+    content = (candidates[0] or {}).get("content") or {}
+    return "".join(str(part.get("text") or "") for part in content.get("parts") or [])
+
+
+async def stream_ai_steps_from_image(
+    *,
+    image_bytes: bytes | None,
+    image_mime: str | None,
+    descricao: str | None,
+    max_steps: int = 6,
+    use_cache: bool = True,
+    on_cache_miss: CacheMissHook | None = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Versao em streaming de generate_ai_steps_from_image.
+
+    Emite {"type": "step", "step": {...}} a cada passo validado e, no fim,
+    {"type": "done", "count": n, "cached": bool}.
+    """
+    request = _prepare_image_steps_request(image_bytes, image_mime, descricao, max_steps)
+    max_steps = request["max_steps"]
+
+    cached = await _cache_lookup(request["cache_key"], use_cache)
+    if cached is not None:
+        steps = cached.get("steps") or []
+        for step in steps:
+            yield {"type": "step", "step": step}
+        yield {"type": "done", "count": len(steps), "cached": True}
+        return
+    if on_cache_miss is not None:
+        await on_cache_miss()
+
+    retries = _max_retries()
+    for attempt in range(1, retries + 1):
+        payload = _image_steps_payload(request, attempt)
+        extractor = _StepStreamExtractor()
+        emitted: List[Dict[str, Any]] = []
+        invalid_encoding = False
+
+        async with aclosing(_stream_gemini_with_fallback(payload)) as chunks:
+            async for chunk in chunks:
+                for item in extractor.feed(_extract_chunk_text(chunk)):
+                    step = _normalize_structured_step(item)
+                    step["step_order"] = len(emitted) + 1
+                    if _has_replacement_char(item) or _has_replacement_char(step):
+                        invalid_encoding = True
+                        break
+                    _validate_structured_step(step, step["step_order"])
+                    emitted.append(step)
+                    yield {"type": "step", "step": step}
+                    if len(emitted) >= max_steps:
+                        break
+                if invalid_encoding or len(emitted) >= max_steps:
+                    break
+
+        if invalid_encoding:
+            logger.warning("IA retornou texto com U+FFFD (tentativa %s/%s)", attempt, retries)
+            # Passos ja enviados ao cliente nao podem ser refeitos.
+            if emitted or attempt >= retries:
+                raise AITextInvalidEncodingError(_INVALID_ENCODING_MESSAGE)
+            continue
+
+        if not emitted:
+            raise AIResponseError("Nenhum passo gerado pela Gemini")
+
+        result = {"steps": emitted}
+        await _cache_store(request["cache_key"], "image_steps", request["model"], result)
+        yield {"type": "done", "count": len(emitted), "cached": False}
+        return
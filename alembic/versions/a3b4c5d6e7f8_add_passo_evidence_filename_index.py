@@ -0,0 +1,44 @@
+"""add passo evidence filename index
+
+Revision ID: a3b4c5d6e7f8
+Revises: f2a3b4c5d6e7
+Create Date: 2026-03-14 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a3b4c5d6e7f8"
+down_revision: Union[str, Sequence[str], None] = "f2a3b4c5d6e7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# APRs duplicadas com evidencia compartilham o arquivo: remover evidencia
+# procura outro passo com o mesmo evidence_filename.
+INDEX_NAME = "ix_passos_evidence_filename"
+
+
+def _has_index(inspector) -> bool:
+    return any(index["name"] == INDEX_NAME for index in inspector.get_indexes("passos"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("passos") or _has_index(inspector):
+        return
+    op.create_index(INDEX_NAME, "passos", ["evidence_filename"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("passos") or not _has_index(inspector):
+        return
+    op.drop_index(INDEX_NAME, table_name="passos")
@@ -0,0 +1,119 @@
+"""apr json columns
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-03-06 00:00:00.000000
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7b8c9d0e1f2"
+down_revision: Union[str, Sequence[str], None] = "f6a7b8c9d0e1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = "ix_aprs_dangerous_energies_checklist"
+# (coluna, valor usado quando o texto legado estiver vazio ou nao for JSON)
+JSON_COLUMNS = (
+    ("hazards", "[]"),
+    ("controls", "[]"),
+    ("dangerous_energies_checklist", None),
+)
+BATCH_SIZE = 500
+
+
+def _broken_ids(bind, table, column) -> list[int]:
+    broken = []
+    for row_id, value in bind.execute(sa.select(table.c.id, column).where(column.is_not(None))):
+        try:
+            json.loads(value)
+        except (TypeError, ValueError):
+            broken.append(row_id)
+    return broken
+
+
+def normalize_legacy_json(bind, names) -> int:
+    """Troca texto vazio, JSON invalido (e NULL nas listas) pelo valor vazio; devolve quantas linhas.
+
+    Em Python para valer em qualquer banco: json_valid() so existe no SQLite
+    e o Postgres anterior ao 16 nao tem IS JSON.
+    """
+    empties = dict(JSON_COLUMNS)
+    table = sa.table("aprs", sa.column("id", sa.Integer), *[sa.column(name, sa.Text) for name in names])
+    fixed = 0
+    for name in names:
+        column = table.c[name]
+        broken = _broken_ids(bind, table, column)
+        for start in range(0, len(broken), BATCH_SIZE):
+            chunk = broken[start : start + BATCH_SIZE]
+            bind.execute(sa.update(table).where(table.c.id.in_(chunk)).values({name: empties[name]}))
+        fixed += len(broken)
+        if empties[name] is not None:
+            fixed += bind.execute(sa.update(table).where(column.is_(None)).values({name: empties[name]})).rowcount
+    return fixed
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("aprs"):
+        return
+    columns = {col["name"]: col for col in inspector.get_columns("aprs")}
+    # Ainda texto: o ORM (SQLite) e o cast para JSONB (Postgres) exigem JSON valido.
+    pending = [
+        name
+        for name, _ in JSON_COLUMNS
+        if name in columns and not isinstance(columns[name]["type"], postgresql.JSONB)
+    ]
+    normalize_legacy_json(bind, pending)
+    # SQLite guarda JSON como TEXT: o tipo da coluna no ORM basta. So o
+    # Postgres precisa converter para JSONB.
+    if bind.dialect.name != "postgresql":
+        return
+    for name in pending:
+        if name != "dangerous_energies_checklist":
+            op.execute(f"ALTER TABLE aprs ALTER COLUMN {name} DROP DEFAULT")
+        op.execute(f"ALTER TABLE aprs ALTER COLUMN {name} TYPE JSONB USING {name}::jsonb")
+        if name != "dangerous_energies_checklist":
+            op.execute(f"ALTER TABLE aprs ALTER COLUMN {name} SET DEFAULT '[]'::jsonb")
+
+    indexes = {index["name"] for index in inspector.get_indexes("aprs")}
+    if INDEX_NAME not in indexes:
+        op.create_index(
+            INDEX_NAME,
+            "aprs",
+            ["dangerous_energies_checklist"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={"dangerous_energies_checklist": "jsonb_path_ops"},
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("aprs"):
+        return
+    indexes = {index["name"] for index in inspector.get_indexes("aprs")}
+    if INDEX_NAME in indexes:
+        op.drop_index(INDEX_NAME, table_name="aprs")
+    columns = {col["name"]: col for col in inspector.get_columns("aprs")}
+    for name, _ in JSON_COLUMNS:
+        if name not in columns or not isinstance(columns[name]["type"], postgresql.JSONB):
+            continue
+        if name != "dangerous_energies_checklist":
+            op.execute(f"ALTER TABLE aprs ALTER COLUMN {name} DROP DEFAULT")
+        op.execute(f"ALTER TABLE aprs ALTER COLUMN {name} TYPE TEXT USING {name}::text")
+        if name != "dangerous_energies_checklist":
+            op.execute(f"ALTER TABLE aprs ALTER COLUMN {name} SET DEFAULT '[]'")
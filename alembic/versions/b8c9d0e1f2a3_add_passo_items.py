@@ -0,0 +1,190 @@
+"""add passo items
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-03-07 00:00:00.000000
+
+"""
+import re
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b8c9d0e1f2a3"
+down_revision: Union[str, Sequence[str], None] = "a7b8c9d0e1f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+# Copia congelada das regras de step_items/text_normalizer desta revisao: a
+# migracao nao importa o app, para nao mudar quando as regras mudarem.
+FIELDS = (
+    ("perigos", "hazard", re.compile(r";")),
+    ("riscos", "risk", re.compile(r";")),
+    ("medidas_controle", "control", re.compile(r"[;,]")),
+    ("epis", "epi", re.compile(r"[;,]")),
+    ("normas", "norm", re.compile(r"[;,]")),
+)
+_MOJIBAKE_MARKERS = (
+    "\u00c3",
+    "\u00c2",
+    "\ufffd",
+    "\u00e2\u20ac\u2122",
+    "\u00e2\u20ac\u0153",
+    "\u00e2\u20ac",
+    "\u00e2\u20ac\u2013",
+    "\u00e2\u20ac\u2014",
+    "\u00e2\u20ac\u2026",
+    "\u00e2\u20ac\u2018",
+    "\u00c2\u00ba",
+    "\u00c2\u00b0",
+)
+_MOJIBAKE_RE = re.compile("|".join(re.escape(m) for m in _MOJIBAKE_MARKERS))
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]")
+
+
+def _mojibake_score(text: str) -> int:
+    return text.count("\ufffd") + sum(text.count(marker) for marker in _MOJIBAKE_MARKERS)
+
+
+def _fix_mojibake(text: str) -> str:
+    if not _MOJIBAKE_RE.search(text):
+        return text
+    best, best_score = text, _mojibake_score(text)
+    for enc in ("latin-1", "cp1252"):
+        candidate = text.encode(enc, errors="ignore").decode("utf-8", errors="ignore")
+        score = _mojibake_score(candidate)
+        if score < best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def _normalize(value) -> str:
+    """normalize_text(value, keep_newlines=False)."""
+    if value is None:
+        return ""
+    text = str(value)
+    if text.strip().lower() in {"nan", "none", "null"}:
+        return ""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _fix_mojibake(text)
+    text = unicodedata.normalize("NFKC", text)
+    text = _CONTROL_CHARS.sub("", text).replace("\ufffd", "")
+    text = re.sub(r"[ \t\u00A0]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _key(value) -> str:
+    return _normalize(value).lower()
+
+
+def _split(separator, value) -> list[str]:
+    text = _normalize(value)
+    if not text:
+        return []
+    return [item for item in (_normalize(part) for part in separator.split(text)) if item]
+
+
+def _catalog(bind, table: str, column: str) -> dict:
+    lookup = {}
+    for row_id, name in bind.execute(sa.text(f"SELECT id, {column} FROM {table}")).all():
+        if _key(name):
+            lookup[_key(name)] = (row_id, name)
+    return lookup
+
+
+def step_item_rows(bind):
+    """Linhas de passo_items para os passos existentes, como o before_flush desta revisao gerava."""
+    inspector = sa.inspect(bind)
+    hazards = _catalog(bind, "perigos", "perigo") if inspector.has_table("perigos") else {}
+    epis = _catalog(bind, "epis", "epi") if inspector.has_table("epis") else {}
+    columns = ", ".join(field for field, _, _ in FIELDS)
+    for passo in bind.execute(sa.text(f"SELECT id, {columns} FROM passos")).mappings():
+        for field, kind, separator in FIELDS:
+            seen = set()
+            position = 0
+            for label in _split(separator, passo[field]):
+                perigo_id = epi_id = None
+                if kind == "hazard" and _key(label) in hazards:
+                    perigo_id, label = hazards[_key(label)]
+                elif kind == "epi" and _key(label) in epis:
+                    epi_id, label = epis[_key(label)]
+                if kind == "hazard":
+                    if label in seen:
+                        continue
+                    seen.add(label)
+                yield {
+                    "passo_id": passo["id"],
+                    "kind": kind,
+                    "position": position,
+                    "label": label,
+                    "perigo_id": perigo_id,
+                    "epi_id": epi_id,
+                }
+                position += 1
+
+
+def _backfill(bind) -> None:
+    items_table = sa.table(
+        "passo_items",
+        sa.column("passo_id", sa.Integer),
+        sa.column("kind", sa.String),
+        sa.column("position", sa.Integer),
+        sa.column("label", sa.Text),
+        sa.column("perigo_id", sa.Integer),
+        sa.column("epi_id", sa.Integer),
+    )
+    pending = []
+    for row in step_item_rows(bind):
+        pending.append(row)
+        if len(pending) >= BATCH_SIZE:
+            op.bulk_insert(items_table, pending)
+            pending = []
+    if pending:
+        op.bulk_insert(items_table, pending)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("passo_items"):
+        return
+
+    op.create_table(
+        "passo_items",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("passo_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("label", sa.Text(), nullable=False),
+        sa.Column("perigo_id", sa.Integer(), nullable=True),
+        sa.Column("epi_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["passo_id"], ["passos.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["perigo_id"], ["perigos.id"], ondelete="SET NULL"),
+        sa.ForeignKeyConstraint(["epi_id"], ["epis.id"], ondelete="SET NULL"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_passo_items_passo_kind", "passo_items", ["passo_id", "kind", "position"], unique=False)
+    op.create_index("ix_passo_items_kind_epi", "passo_items", ["kind", "epi_id"], unique=False)
+    op.create_index("ix_passo_items_perigo_id", "passo_items", ["perigo_id"], unique=False)
+
+    if inspector.has_table("passos"):
+        _backfill(bind)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("passo_items"):
+        return
+    op.drop_index("ix_passo_items_perigo_id", table_name="passo_items")
+    op.drop_index("ix_passo_items_kind_epi", table_name="passo_items")
+    op.drop_index("ix_passo_items_passo_kind", table_name="passo_items")
+    op.drop_table("passo_items")
@@ -0,0 +1,49 @@
+"""add catalog versions
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2026-03-09 00:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c9d0e1f2a3b4"
+down_revision: Union[str, Sequence[str], None] = "b8c9d0e1f2a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CATALOGS = ("epis", "perigos")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("catalog_versions"):
+        return
+
+    table = op.create_table(
+        "catalog_versions",
+        sa.Column("name", sa.String(length=50), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    # Linhas prontas: o primeiro bump e um UPDATE, sem corrida de INSERT.
+    now = datetime.utcnow()
+    op.bulk_insert(table, [{"name": name, "version": 1, "updated_at": now} for name in CATALOGS])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("catalog_versions"):
+        return
+    op.drop_table("catalog_versions")
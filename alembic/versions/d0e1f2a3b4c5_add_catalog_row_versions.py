@@ -0,0 +1,71 @@
+"""add catalog row versions and tombstones
+
+Revision ID: d0e1f2a3b4c5
+Revises: c9d0e1f2a3b4
+Create Date: 2026-03-10 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d0e1f2a3b4c5"
+down_revision: Union[str, Sequence[str], None] = "c9d0e1f2a3b4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CATALOG_TABLES = ("epis", "perigos")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table in CATALOG_TABLES:
+        if not inspector.has_table(table):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        if "row_version" not in columns:
+            # Linhas existentes ficam na versao 0: ja estao em qualquer snapshot.
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.add_column(sa.Column("row_version", sa.Integer(), nullable=False, server_default="0"))
+        indexes = {index["name"] for index in inspector.get_indexes(table)}
+        if f"ix_{table}_row_version" not in indexes:
+            op.create_index(f"ix_{table}_row_version", table, ["row_version"], unique=False)
+
+    if not inspector.has_table("catalog_tombstones"):
+        op.create_table(
+            "catalog_tombstones",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("catalog", sa.String(length=50), nullable=False),
+            sa.Column("item_id", sa.Integer(), nullable=False),
+            sa.Column("row_version", sa.Integer(), nullable=False),
+            sa.Column("deleted_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(
+            "ix_catalog_tombstones_catalog_version",
+            "catalog_tombstones",
+            ["catalog", "row_version"],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("catalog_tombstones"):
+        op.drop_index("ix_catalog_tombstones_catalog_version", table_name="catalog_tombstones")
+        op.drop_table("catalog_tombstones")
+    for table in CATALOG_TABLES:
+        if not inspector.has_table(table):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        if "row_version" in columns:
+            op.drop_index(f"ix_{table}_row_version", table_name=table)
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_column("row_version")
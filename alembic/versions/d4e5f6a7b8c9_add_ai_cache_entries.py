@@ -0,0 +1,56 @@
+"""add ai cache entries
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2026-03-02 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d4e5f6a7b8c9"
+down_revision: Union[str, Sequence[str], None] = "c3d4e5f6a7b8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("ai_cache_entries"):
+        return
+
+    op.create_table(
+        "ai_cache_entries",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("cache_key", sa.String(length=64), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("model", sa.String(length=100), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("hits", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("last_hit_at", sa.DateTime(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_ai_cache_entries_cache_key", "ai_cache_entries", ["cache_key"], unique=True)
+    op.create_index("ix_ai_cache_entries_last_hit_at", "ai_cache_entries", ["last_hit_at"], unique=False)
+    op.create_index("ix_ai_cache_entries_expires_at", "ai_cache_entries", ["expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("ai_cache_entries"):
+        return
+    op.drop_index("ix_ai_cache_entries_expires_at", table_name="ai_cache_entries")
+    op.drop_index("ix_ai_cache_entries_last_hit_at", table_name="ai_cache_entries")
+    op.drop_index("ix_ai_cache_entries_cache_key", table_name="ai_cache_entries")
+    op.drop_table("ai_cache_entries")
@@ -0,0 +1,42 @@
+"""add apr events history index
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-03-05 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f6a7b8c9d0e1"
+down_revision: Union[str, Sequence[str], None] = "e5f6a7b8c9d0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = "ix_apr_events_apr_id_criado_em"
+
+
+def _has_index(inspector) -> bool:
+    return any(index["name"] == INDEX_NAME for index in inspector.get_indexes("apr_events"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("apr_events") or _has_index(inspector):
+        return
+    op.create_index(INDEX_NAME, "apr_events", ["apr_id", "criado_em"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("apr_events") or not _has_index(inspector):
+        return
+    op.drop_index(INDEX_NAME, table_name="apr_events")
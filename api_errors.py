@@ -39,3 +39,11 @@ def missing_fields_error(fields: list[str]) -> ApiError:
 
 def validation_error(message: str, field: Optional[str] = None, status_code: int = 400) -> ApiError:
     return ApiError(status_code=status_code, code="validation_error", message=message, field=field)
+
+
+def ai_quota_error(message: str) -> ApiError:
+    return ApiError(status_code=429, code="ai_quota_exceeded", message=message, field="plan")
+
+
+def plan_feature_error(message: str) -> ApiError:
+    return ApiError(status_code=403, code="plan_feature_unavailable", message=message, field="plan")
@@ -2,11 +2,10 @@ from __future__ import annotations
 
 from datetime import datetime
 from pathlib import Path
-import re
 from typing import Any, Iterable
 
-from consolidation.pdf import gerar_pdf_apr
 from api_errors import ApiError, missing_fields_error
+from metrics import PDF_RENDERS
 from risk_engine import is_risk_item_valid
 from text_normalizer import normalize_text
 
@@ -29,11 +28,8 @@ def _sanitize_text(value: Any) -> str:
     return normalized if normalized is not None else ""
 
 
-def _split_list(value: str) -> list[str]:
-    if not value:
-        return []
-    parts = re.split(r"[;,]", str(value))
-    return [_sanitize_text(p) for p in parts if str(p).strip()]
+def _step_items(passo: Any, kind: str) -> list[str]:
+    return [_sanitize_text(label) for label in passo.item_labels(kind)]
 
 
 def _has_any(values: Iterable[str]) -> bool:
@@ -73,8 +69,8 @@ def validate_apr_for_pdf(apr: Any, passos: list[Any], risk_items: list[Any] | No
         )
 
     for p in passos:
-        perigos = _split_list(getattr(p, "perigos", ""))
-        medidas = _split_list(getattr(p, "medidas_controle", ""))
+        perigos = p.item_labels("hazard")
+        medidas = p.item_labels("control")
         ordem = getattr(p, "ordem", None)
         prefix = f"Passo {ordem}" if ordem is not None else "Passo"
         if len(perigos) < 1:
@@ -155,11 +151,11 @@ def build_apr_document(apr: Any, passos: list[Any], risk_items: list[Any] | None
                     {
                         "ordem": p.ordem,
                         "descricao": _sanitize_text(p.descricao),
-                        "perigos": _split_list(p.perigos),
-                        "riscos": _split_list(p.riscos),
-                        "medidas_controle": _split_list(p.medidas_controle),
-                        "epis": _split_list(p.epis),
-                        "normas": _split_list(p.normas),
+                        "perigos": _step_items(p, "hazard"),
+                        "riscos": _step_items(p, "risk"),
+                        "medidas_controle": _step_items(p, "control"),
+                        "epis": _step_items(p, "epi"),
+                        "normas": _step_items(p, "norm"),
                         "technical_evidence": (
                             {
                                 "type": getattr(p, "evidence_type", None) or "image",
@@ -188,5 +184,9 @@ def write_apr_pdf(apr: Any, passos: list[Any], filename: str, risk_items: list[A
     exports_dir = base_dir / "exports"
     exports_dir.mkdir(parents=True, exist_ok=True)
     path = exports_dir / filename
+    # ReportLab so carrega no primeiro PDF (ou no warm-up), nao no import do app.
+    from consolidation.pdf import gerar_pdf_apr
+
     gerar_pdf_apr(documento, str(path))
+    PDF_RENDERS.inc()
     return path
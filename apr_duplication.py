@@ -0,0 +1,150 @@
+"""Duplicacao de APR feita no banco.
+
+A APR nova entra pelo ORM (uma linha, precisa do id). Passos, passo_items e
+riscos saem de INSERT ... SELECT a partir da origem, casando passo antigo e
+novo pela ordem (unica por APR). Os riscos sao copiados como estao, inclusive
+probabilidade/severidade ajustadas a mao: nao ha rebuild depois da copia.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import and_, insert, literal, null, select
+from sqlalchemy.orm import Session, aliased
+
+import change_feed
+from models import APR, Passo, PassoItem, RiskItem
+
+_APR_FIELDS = (
+    "titulo",
+    "risco",
+    "descricao",
+    "hazards_json",
+    "controls_json",
+    "worksite",
+    "sector",
+    "responsible",
+    "activity_id",
+    "activity_name",
+    "date",
+    "source_hashes",
+    "template_version",
+    "dangerous_energies_checklist_json",
+)
+_STEP_TEXT_FIELDS = ("descricao", "perigos", "riscos", "medidas_controle", "epis", "normas")
+_EVIDENCE_FIELDS = ("evidence_type", "evidence_filename", "evidence_caption", "evidence_uploaded_at")
+
+
+def _copy_steps(
+    db: Session, source_id: int, target_id: int, company_id: int, now: datetime, include_evidence: bool
+) -> None:
+    evidence = [getattr(Passo, name) for name in _EVIDENCE_FIELDS] if include_evidence else [null()] * 4
+    columns = ["apr_id", "company_id", "ordem", *_STEP_TEXT_FIELDS, *_EVIDENCE_FIELDS, "criado_em", "atualizado_em"]
+    rows = (
+        select(
+            literal(target_id),
+            literal(company_id),
+            Passo.ordem,
+            *[getattr(Passo, name) for name in _STEP_TEXT_FIELDS],
+            *evidence,
+            literal(now),
+            literal(now),
+        )
+        .where(Passo.apr_id == source_id)
+        .order_by(Passo.ordem)
+    )
+    db.execute(insert(Passo.__table__).from_select(columns, rows))
+
+
+def _step_map(source_id: int, target_id: int):
+    target = aliased(Passo)
+    return (
+        select(Passo.id.label("old_id"), target.id.label("new_id"))
+        .join(target, and_(target.apr_id == target_id, target.ordem == Passo.ordem))
+        .where(Passo.apr_id == source_id)
+        .subquery()
+    )
+
+
+def _copy_step_items(db: Session, step_map) -> None:
+    rows = (
+        select(
+            step_map.c.new_id,
+            PassoItem.kind,
+            PassoItem.position,
+            PassoItem.label,
+            PassoItem.perigo_id,
+            PassoItem.epi_id,
+        )
+        .join(step_map, step_map.c.old_id == PassoItem.passo_id)
+        .order_by(PassoItem.id)
+    )
+    columns = ["passo_id", "kind", "position", "label", "perigo_id", "epi_id"]
+    db.execute(insert(PassoItem.__table__).from_select(columns, rows))
+
+
+def _copy_risk_items(
+    db: Session, source_id: int, target_id: int, company_id: int, now: datetime, step_map
+) -> None:
+    rows = (
+        select(
+            literal(target_id),
+            literal(company_id),
+            step_map.c.new_id,
+            RiskItem.hazard_id,
+            RiskItem.risk_description,
+            RiskItem.probability,
+            RiskItem.severity,
+            RiskItem.score,
+            RiskItem.risk_level,
+            literal(now),
+        )
+        .join(step_map, step_map.c.old_id == RiskItem.step_id)
+        .where(RiskItem.apr_id == source_id)
+        .order_by(RiskItem.id)
+    )
+    columns = [
+        "apr_id",
+        "company_id",
+        "step_id",
+        "hazard_id",
+        "risk_description",
+        "probability",
+        "severity",
+        "score",
+        "risk_level",
+        "updated_at",
+    ]
+    db.execute(insert(RiskItem.__table__).from_select(columns, rows))
+
+
+def duplicate_apr(
+    db: Session,
+    source: APR,
+    *,
+    company_id: int,
+    user_id: int | None,
+    include_evidence: bool = False,
+) -> APR:
+    """Copia a APR com passos e riscos na transacao corrente; o commit fica com quem chama.
+
+    Com include_evidence os passos novos apontam para os mesmos arquivos de
+    evidencia (nada e copiado no disco); quem apaga arquivo deve checar se
+    outro passo ainda o referencia.
+    """
+    copy = APR(
+        **{name: getattr(source, name) for name in _APR_FIELDS},
+        company_id=company_id,
+        user_id=user_id,
+        status="rascunho",
+    )
+    db.add(copy)
+    db.flush()
+
+    now = datetime.utcnow()
+    _copy_steps(db, source.id, copy.id, company_id, now, include_evidence)
+    step_map = _step_map(source.id, copy.id)
+    _copy_step_items(db, step_map)
+    _copy_risk_items(db, source.id, copy.id, company_id, now, step_map)
+    change_feed.record_apr_children(db, copy.id, company_id)
+    return copy
@@ -2,14 +2,16 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List
+import math
 import re
 
-import pandas as pd
-
 from excel_contract import validate_atividades_df
 from text_normalizer import normalize_text, normalize_list
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 @dataclass
 class ActivityRow:
@@ -34,7 +36,7 @@ _CACHE: dict[str, Any] = {
 
 
 def _norm_id(value: Any) -> str | None:
-    if value is None or (isinstance(value, float) and pd.isna(value)):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
         return None
     if isinstance(value, (int, float)):
         if float(value).is_integer():
@@ -43,7 +45,7 @@ def _norm_id(value: Any) -> str | None:
 
 
 def _split_list(value: Any, field: str) -> List[str]:
-    if value is None or (isinstance(value, float) and pd.isna(value)):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
         return []
     if isinstance(value, list):
         return [v for v in normalize_list(value, origin="excel", field=field) if v]
@@ -59,6 +61,9 @@ def _split_list(value: Any, field: str) -> List[str]:
 
 
 def _load_df(path: Path) -> pd.DataFrame:
+    # Import tardio: so a primeira leitura da planilha paga o custo do pandas.
+    import pandas as pd
+
     df = pd.read_excel(path)
     validate_atividades_df(df)
     df.columns = [str(c).strip().lower() for c in df.columns]
@@ -136,9 +141,21 @@ def _sort_key(value: Any) -> tuple:
         return (1, str(value))
 
 
+def _activities_path() -> Path:
+    return Path(__file__).resolve().parent / "atividades_passos_apr_modelo_validado.xlsx"
+
+
+def activities_version() -> str | None:
+    """Marcador da planilha (mtime + tamanho) sem ler o arquivo; None se nao existe."""
+    try:
+        stat = _activities_path().stat()
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
 def _get_cache() -> dict[str, Any]:
-    base_dir = Path(__file__).resolve().parent
-    path = base_dir / "atividades_passos_apr_modelo_validado.xlsx"
+    path = _activities_path()
     if not path.exists():
         return {"activities": [], "by_id": {}}
 
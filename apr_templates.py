@@ -0,0 +1,267 @@
+"""Biblioteca de modelos de APR por empresa.
+
+O modelo fica guardado ja compilado: cada passo com os passo_items resolvidos
+no catalogo e os riscos com hazard_id e probabilidade/severidade (padrao do
+perigo ou definidas no modelo, marcadas como manual). Aplicar vira tres INSERT
+em lote (passos, itens, riscos) sem rebuild por passo; o score e recalculado na
+propria insercao. O documento guarda a versao dos catalogos de EPIs/perigos em
+que foi compilado e e recompilado uma vez quando ela muda.
+
+Os scores do modelo sao so os valores iniciais da APR: como um PATCH em
+risk-items, valem ate o proximo rebuild dos riscos (editar um passo,
+finalizar), que volta ao padrao do perigo no catalogo. RiskItem nao guarda
+quais valores eram manuais.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+import change_feed
+from catalog_sync import current_version
+from entity_normalizer import normalized_key
+from models import APR, APRTemplate, Passo, PassoItem, RiskItem
+from risk_engine import build_risk_rows, compute_risk_score, load_hazards
+from step_items import build_step_items, catalog_lookups
+
+STEP_FIELDS = ("descricao", "perigos", "riscos", "medidas_controle", "epis", "normas")
+_ITEM_FIELDS = ("kind", "position", "label", "perigo_id", "epi_id")
+_SUMMARY_COLUMNS = (
+    APRTemplate.id,
+    APRTemplate.name,
+    APRTemplate.description,
+    APRTemplate.activity_id,
+    APRTemplate.activity_name,
+    APRTemplate.step_count,
+    APRTemplate.risk_count,
+    APRTemplate.updated_at,
+)
+
+
+def _catalog_marker(db: Session) -> str:
+    version = current_version(db)
+    return f"{version.epis}.{version.hazards}"
+
+
+def steps_from_input(steps) -> list[dict]:
+    """Converte TemplateStepIn na entrada de compile_template (ordem pelo step_order)."""
+    result = []
+    for step in sorted(steps, key=lambda item: item.step_order):
+        risks, scores = [], {}
+        for risk in step.risks:
+            if isinstance(risk, str):
+                risks.append(risk)
+                continue
+            risks.append(risk.description)
+            if risk.probability is not None or risk.severity is not None:
+                scores[normalized_key(risk.description)] = (risk.probability, risk.severity)
+        result.append(
+            {
+                "descricao": step.description,
+                "perigos": "; ".join(step.hazards),
+                "riscos": "; ".join(risks),
+                "medidas_controle": "; ".join(step.measures),
+                "epis": "; ".join(step.epis),
+                "normas": "; ".join(step.regulations),
+                "scores": scores,
+            }
+        )
+    return result
+
+
+def steps_from_apr(db: Session, apr_id: int) -> list[dict]:
+    """Passos de uma APR como entrada de compile_template, com os scores atuais dos riscos."""
+    passos = db.execute(
+        select(Passo.id, *[getattr(Passo, name) for name in STEP_FIELDS])
+        .where(Passo.apr_id == apr_id)
+        .order_by(Passo.ordem)
+    ).all()
+    scores: dict[int, dict] = {}
+    for row in db.execute(
+        select(RiskItem.step_id, RiskItem.risk_description, RiskItem.probability, RiskItem.severity)
+        .where(RiskItem.apr_id == apr_id)
+        .order_by(RiskItem.id)
+    ):
+        scores.setdefault(row.step_id, {})[normalized_key(row.risk_description)] = (row.probability, row.severity)
+    return [
+        {**{name: getattr(row, name) for name in STEP_FIELDS}, "scores": scores.get(row.id, {})}
+        for row in passos
+    ]
+
+
+def _steps_from_compiled(compiled: dict) -> list[dict]:
+    return [
+        {
+            **{name: step[name] for name in STEP_FIELDS},
+            "scores": {
+                normalized_key(risk["risk_description"]): (risk["probability"], risk["severity"])
+                for risk in step["risks"]
+                if risk.get("manual")
+            },
+        }
+        for step in compiled.get("steps", [])
+    ]
+
+
+def compile_template(db: Session, steps: list[dict], energies: dict | None) -> dict:
+    hazards, epis = catalog_lookups(db)
+    built = []
+    for step in steps:
+        fields = {name: step.get(name) or "" for name in STEP_FIELDS}
+        built.append((fields, build_step_items(SimpleNamespace(**fields), hazards=hazards, epis=epis), step))
+    hazard_by_id = load_hazards(
+        db, (item.perigo_id for _, items, _ in built for item in items if item.kind == "hazard")
+    )
+
+    compiled_steps = []
+    for ordem, (fields, items, step) in enumerate(built, start=1):
+        scores = step.get("scores") or {}
+        risks = []
+        for row in build_risk_rows(items, hazard_by_id):
+            given_probability, given_severity = scores.get(normalized_key(row["risk_description"]), (None, None))
+            probability = row["probability"] if given_probability is None else int(given_probability)
+            severity = row["severity"] if given_severity is None else int(given_severity)
+            risks.append(
+                {
+                    "risk_description": row["risk_description"],
+                    "hazard_id": row["hazard_id"],
+                    "probability": probability,
+                    "severity": severity,
+                    "manual": (probability, severity) != (row["probability"], row["severity"]),
+                }
+            )
+        compiled_steps.append(
+            {
+                "ordem": ordem,
+                **fields,
+                "items": [{name: getattr(item, name) for name in _ITEM_FIELDS} for item in items],
+                "risks": risks,
+            }
+        )
+    return {"catalogs": _catalog_marker(db), "energies": energies, "steps": compiled_steps}
+
+
+def store_compiled(template: APRTemplate, compiled: dict) -> None:
+    template.compiled = compiled
+    template.step_count = len(compiled["steps"])
+    template.risk_count = sum(len(step["risks"]) for step in compiled["steps"])
+
+
+def fresh_compiled(db: Session, template: APRTemplate) -> dict:
+    """Documento compilado do modelo, recompilado (e regravado) se os catalogos mudaram."""
+    compiled = template.compiled or {}
+    if compiled.get("catalogs") == _catalog_marker(db):
+        return compiled
+    compiled = compile_template(db, _steps_from_compiled(compiled), compiled.get("energies"))
+    store_compiled(template, compiled)
+    return compiled
+
+
+def template_out(template: APRTemplate) -> dict:
+    compiled = template.compiled or {}
+    return {
+        **{column.key: getattr(template, column.key) for column in _SUMMARY_COLUMNS},
+        "dangerous_energies_checklist": compiled.get("energies"),
+        "steps": [
+            {**{name: step[name] for name in ("ordem", *STEP_FIELDS)}, "risks": step["risks"]}
+            for step in compiled.get("steps", [])
+        ],
+    }
+
+
+def summary_marker(db: Session, company_id: int) -> tuple:
+    count, latest = db.execute(
+        select(func.count(APRTemplate.id), func.max(APRTemplate.updated_at)).where(
+            APRTemplate.company_id == company_id
+        )
+    ).one()
+    return count, latest.isoformat() if latest else ""
+
+
+def list_summaries(db: Session, company_id: int) -> list[dict]:
+    # Sem cache em memoria: o ETag (summary_marker) ja evita a consulta para o cliente que repete.
+    rows = db.execute(
+        select(*_SUMMARY_COLUMNS).where(APRTemplate.company_id == company_id).order_by(APRTemplate.name)
+    ).mappings()
+    return [dict(row) for row in rows]
+
+
+def apply_template(db: Session, apr: APR, template: APRTemplate, *, replace: bool) -> dict[str, int]:
+    """Grava os passos do modelo na APR; sem replace entram depois do ultimo passo existente.
+
+    Os scores manuais do modelo entram como valores iniciais (ver docstring do modulo).
+    """
+    compiled = fresh_compiled(db, template)
+    steps = compiled.get("steps", [])
+
+    if replace:
+        db.execute(delete(RiskItem).where(RiskItem.apr_id == apr.id))
+        db.execute(
+            delete(PassoItem).where(PassoItem.passo_id.in_(select(Passo.id).where(Passo.apr_id == apr.id)))
+        )
+        db.execute(delete(Passo).where(Passo.apr_id == apr.id))
+        offset = 0
+    else:
+        offset = db.execute(select(func.max(Passo.ordem)).where(Passo.apr_id == apr.id)).scalar() or 0
+
+    created = invalid = 0
+    if steps:
+        now = datetime.utcnow()
+        db.execute(
+            insert(Passo.__table__),
+            [
+                {
+                    "apr_id": apr.id,
+                    "company_id": apr.company_id,
+                    "ordem": step["ordem"] + offset,
+                    **{name: step[name] for name in STEP_FIELDS},
+                    "criado_em": now,
+                    "atualizado_em": now,
+                }
+                for step in steps
+            ],
+        )
+        step_ids = dict(
+            db.execute(select(Passo.ordem, Passo.id).where(Passo.apr_id == apr.id, Passo.ordem > offset)).all()
+        )
+        items = [
+            {**item, "passo_id": step_ids[step["ordem"] + offset]} for step in steps for item in step["items"]
+        ]
+        if items:
+            db.execute(insert(PassoItem.__table__), items)
+
+        risks = []
+        for step in steps:
+            for risk in step["risks"]:
+                score, level = compute_risk_score(risk["probability"], risk["severity"])
+                invalid += level == "invalid"
+                risks.append(
+                    {
+                        "apr_id": apr.id,
+                        "company_id": apr.company_id,
+                        "step_id": step_ids[step["ordem"] + offset],
+                        "hazard_id": risk["hazard_id"],
+                        "risk_description": risk["risk_description"],
+                        "probability": risk["probability"],
+                        "severity": risk["severity"],
+                        "score": score,
+                        "risk_level": level,
+                        "updated_at": now,
+                    }
+                )
+        if risks:
+            db.execute(insert(RiskItem.__table__), risks)
+        created = len(risks)
+        change_feed.record_apr_children(db, apr.id, apr.company_id, step_ids=list(step_ids.values()))
+
+    if template.activity_id:
+        apr.activity_id = template.activity_id
+    if template.activity_name:
+        apr.activity_name = template.activity_name
+        apr.titulo = template.activity_name
+    if compiled.get("energies") is not None:
+        apr.dangerous_energies_checklist = compiled["energies"]
+    return {"steps": len(steps), "created": created, "invalid": invalid}
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from typing import AsyncIterator
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from database import DATABASE_REPLICA_URL, DATABASE_URL, TimedAsyncQueuePool, env_flag, env_int
+
+
+def to_async_url(url: str) -> str:
+    """Troca o driver sync pelo equivalente asyncio (asyncpg/aiosqlite)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgresql"):
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        # asyncpg nao entende libpq "sslmode"; o dialeto aceita "ssl".
+        params = []
+        for key, value in parse_qsl(query, keep_blank_values=True):
+            params.append(("ssl", value) if key == "sslmode" else (key, value))
+        return urlunsplit(("postgresql+asyncpg", netloc, path, urlencode(params), fragment))
+    return url
+
+
+def _async_engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {} if ":memory:" in url else {"poolclass": TimedAsyncQueuePool}
+
+    statement_timeout = env_int("DB_STATEMENT_TIMEOUT_MS", 30000)
+    idle_in_tx_timeout = env_int("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", 60000)
+    server_settings = {}
+    if statement_timeout:
+        server_settings["statement_timeout"] = str(statement_timeout)
+    if idle_in_tx_timeout:
+        server_settings["idle_in_transaction_session_timeout"] = str(idle_in_tx_timeout)
+    # Pool proprio, somado ao sync: o teto por processo e por banco e
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW + DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW.
+    # O padrao e menor porque so as leituras quentes e a auth usam asyncpg.
+    return {
+        "poolclass": TimedAsyncQueuePool,
+        "pool_size": env_int("DB_ASYNC_POOL_SIZE", 5, minimum=1),
+        "max_overflow": env_int("DB_ASYNC_MAX_OVERFLOW", 5),
+        "pool_timeout": env_int("DB_POOL_TIMEOUT", 10, minimum=1),
+        "pool_recycle": env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING"),
+        "pool_use_lifo": True,
+        "connect_args": {
+            "timeout": env_int("DB_CONNECT_TIMEOUT", 10, minimum=1),
+            "server_settings": server_settings,
+            # 0 para poolers em modo transacao (pgbouncer/Supavisor).
+            "statement_cache_size": env_int("DB_ASYNC_STATEMENT_CACHE_SIZE", 100),
+        },
+    }
+
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_async_engine_options(ASYNC_DATABASE_URL))
+
+# expire_on_commit=False: o objeto devolvido pela rota e serializado fora da
+# sessao e nao pode disparar lazy load (proibido em asyncio).
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+ASYNC_DATABASE_REPLICA_URL = to_async_url(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+async_replica_engine = (
+    create_async_engine(ASYNC_DATABASE_REPLICA_URL, **_async_engine_options(ASYNC_DATABASE_REPLICA_URL))
+    if ASYNC_DATABASE_REPLICA_URL
+    else None
+)
+AsyncReplicaSessionLocal = (
+    async_sessionmaker(async_replica_engine, expire_on_commit=False, autoflush=False)
+    if async_replica_engine
+    else None
+)
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engines() -> None:
+    await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import APREvent, User
+from rbac import normalize_role
+
+_BUFFER_KEY = "audit_events"
+
+
+def actor_payload(user: User | None) -> dict | None:
+    if not user:
+        return None
+    return {
+        "id": user.id,
+        "email": user.email,
+        "name": user.name,
+        "role": normalize_role(user.role),
+    }
+
+
+def _pending(db: Session) -> List[Dict[str, Any]]:
+    return db.info.setdefault(_BUFFER_KEY, [])
+
+
+def record_event(
+    db: Session,
+    apr_id: int,
+    company_id: int | None,
+    event_name: str,
+    payload: dict | None = None,
+    *,
+    actor: User | None = None,
+) -> None:
+    """Enfileira um evento de auditoria na sessao.
+
+    Nada e consultado aqui: o company_id vem de quem chama. Os eventos ficam na
+    sessao e sao gravados com um unico INSERT em lote no proximo commit (ou em
+    flush_events), com o payload serializado uma vez so.
+    """
+    data = dict(payload) if payload else {}
+    actor_data = actor_payload(actor)
+    if actor_data:
+        data["actor"] = actor_data
+    _pending(db).append(
+        {
+            "apr_id": apr_id,
+            "company_id": company_id,
+            "event": event_name,
+            "payload": json.dumps(data, ensure_ascii=False) if data else None,
+            "criado_em": datetime.utcnow(),
+        }
+    )
+
+
+def flush_events(db: Session) -> int:
+    rows = db.info.pop(_BUFFER_KEY, None)
+    if not rows:
+        return 0
+    db.execute(insert(APREvent), rows)
+    return len(rows)
+
+
+def _write_pending_events(session: Session) -> None:
+    flush_events(session)
+
+
+def _discard_pending_events(session: Session) -> None:
+    session.info.pop(_BUFFER_KEY, None)
+
+
+SESSION_LISTENERS = (
+    ("before_commit", _write_pending_events),
+    ("after_rollback", _discard_pending_events),
+)
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from fastapi import Depends, Header
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 
+from async_database import get_async_db
 from database import SessionLocal
 from models import User
 from api_errors import ApiError
@@ -29,15 +31,7 @@ def _extract_token(authorization: str | None, x_api_token: str | None) -> str |
     return None
 
 
-def get_current_user(
-    authorization: str | None = Header(default=None),
-    x_api_token: str | None = Header(default=None, alias="X-API-Token"),
-    db: Session = Depends(get_db),
-) -> User:
-    token = _extract_token(authorization, x_api_token)
-    if not token:
-        raise ApiError(status_code=401, code="auth_required", message="Token nao informado", field="authorization")
-
+def _resolve_api_token(token: str) -> str:
     try:
         api_token, _expired = resolve_api_token_from_session(token)
     except ValueError as exc:
@@ -45,8 +39,10 @@ def get_current_user(
         if message in {"session_expired", "session_refresh_expired"}:
             raise ApiError(status_code=401, code="token_expired", message="Sessao expirada", field="authorization")
         raise ApiError(status_code=401, code="invalid_token", message="Token invalido", field="authorization")
+    return api_token
+
 
-    user = db.execute(select(User).where(User.api_token == api_token)).scalar_one_or_none()
+def _active_user(user: User | None) -> User:
     if not user or not user.is_active:
         raise ApiError(status_code=401, code="invalid_token", message="Token invalido", field="authorization")
     normalized_role = normalize_role(user.role)
@@ -54,6 +50,39 @@ def get_current_user(
     return user
 
 
+def get_current_user(
+    authorization: str | None = Header(default=None),
+    x_api_token: str | None = Header(default=None, alias="X-API-Token"),
+    db: Session = Depends(get_db),
+) -> User:
+    token = _extract_token(authorization, x_api_token)
+    if not token:
+        raise ApiError(status_code=401, code="auth_required", message="Token nao informado", field="authorization")
+    api_token = _resolve_api_token(token)
+    return _active_user(db.execute(select(User).where(User.api_token == api_token)).scalar_one_or_none())
+
+
+async def get_current_user_async(
+    authorization: str | None = Header(default=None),
+    x_api_token: str | None = Header(default=None, alias="X-API-Token"),
+    db: AsyncSession = Depends(get_async_db),
+) -> User:
+    """Mesmo contrato de get_current_user, sem ocupar thread do threadpool.
+
+    Usa a mesma AsyncSession da rota (dependencia cacheada por request).
+    """
+    token = _extract_token(authorization, x_api_token)
+    if not token:
+        raise ApiError(status_code=401, code="auth_required", message="Token nao informado", field="authorization")
+    api_token = _resolve_api_token(token)
+    result = await db.execute(select(User).where(User.api_token == api_token))
+    user = _active_user(result.scalar_one_or_none())
+    # O papel normalizado vale so para a request: fora da sessao o commit da
+    # rota nao o grava no banco.
+    db.expunge(user)
+    return user
+
+
 def get_current_user_optional(
     authorization: str | None = Header(default=None),
     x_api_token: str | None = Header(default=None, alias="X-API-Token"),
@@ -62,23 +91,38 @@ def get_current_user_optional(
     token = _extract_token(authorization, x_api_token)
     if not token:
         return None
-    try:
-        api_token, _expired = resolve_api_token_from_session(token)
-    except ValueError as exc:
-        message = str(exc)
-        if message in {"session_expired", "session_refresh_expired"}:
-            raise ApiError(status_code=401, code="token_expired", message="Sessao expirada", field="authorization")
-        raise ApiError(status_code=401, code="invalid_token", message="Token invalido", field="authorization")
-
-    user = db.execute(select(User).where(User.api_token == api_token)).scalar_one_or_none()
-    if not user or not user.is_active:
-        raise ApiError(status_code=401, code="invalid_token", message="Token invalido", field="authorization")
-    normalized_role = normalize_role(user.role)
-    user.role = normalized_role if normalized_role in VALID_ROLES else ROLE_VISUALIZADOR
-    return user
+    api_token = _resolve_api_token(token)
+    return _active_user(db.execute(select(User).where(User.api_token == api_token)).scalar_one_or_none())
 
 
-def require_admin(user: User = Depends(get_current_user)) -> User:
+def ensure_admin(user: User) -> User:
     if not is_admin(user.role):
         raise ApiError(status_code=403, code="forbidden", message="Acesso restrito a admin", field="role")
     return user
+
+
+def require_admin(user: User = Depends(get_current_user)) -> User:
+    return ensure_admin(user)
+
+
+def resolve_admin_from_headers(headers) -> User | None:
+    """Admin autenticado pelos headers ASGI crus (middlewares, fora do Depends).
+
+    Mesmas regras de get_current_user + require_admin; None em vez de erro.
+    """
+    values = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in headers}
+    token = _extract_token(values.get("authorization"), values.get("x-api-token"))
+    if not token:
+        return None
+    db = SessionLocal()
+    try:
+        api_token = _resolve_api_token(token)
+        user = ensure_admin(
+            _active_user(db.execute(select(User).where(User.api_token == api_token)).scalar_one_or_none())
+        )
+        db.expunge(user)
+        return user
+    except ApiError:
+        return None
+    finally:
+        db.close()
@@ -0,0 +1 @@
+"""Benchmarks dos caminhos quentes da API (ver `python -m benchmarks --help`)."""
@@ -0,0 +1,126 @@
+"""CLI dos benchmarks.
+
+    python -m benchmarks run --out bench/baseline.json
+    python -m benchmarks run --scenarios apr_detail,step_update --out bench/atual.json
+    python -m benchmarks compare bench/baseline.json bench/atual.json --threshold 0.2
+
+`run` usa um banco proprio (--database-url, padrao sqlite:///./benchmark.db) e
+ignora o DATABASE_URL do ambiente: o gerador cria empresas e APRs sinteticas,
+nunca aponte para producao. `compare` sai com codigo 1 se houver regressao.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+DEFAULT_DATABASE_URL = "sqlite:///./benchmark.db"
+
+
+def _run(args: argparse.Namespace) -> int:
+    # Antes de importar o app: database.py le DATABASE_URL no import.
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SQL_QUERY_BUDGET", "0")
+    if args.fresh and args.database_url.startswith("sqlite:///"):
+        Path(args.database_url[len("sqlite:///"):]).unlink(missing_ok=True)
+    logging.getLogger("main").setLevel(logging.WARNING)
+    logging.getLogger("query_stats").setLevel(logging.ERROR)
+
+    from fastapi.testclient import TestClient
+
+    from benchmarks.datagen import DatasetSpec
+    from benchmarks.runner import run_benchmarks
+    from database import SessionLocal
+    from main import app
+
+    spec = DatasetSpec(
+        companies=args.companies,
+        users_per_company=args.users,
+        aprs_per_company=args.aprs,
+        steps_per_apr=args.steps,
+        risks_per_step=args.risks,
+        evidence_ratio=args.evidence_ratio,
+        hazards=args.hazards,
+        epis=args.epis,
+        seed=args.seed,
+    )
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()] if args.scenarios else None
+    with TestClient(app) as client:
+        result = run_benchmarks(
+            client,
+            SessionLocal,
+            spec,
+            scenarios=scenarios,
+            iterations=args.iterations,
+            warmup=args.warmup,
+        )
+
+    payload = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(payload + "\n", encoding="utf-8")
+    else:
+        print(payload)
+    for name, stats in result["results"].items():
+        print(
+            f"{name:<24} p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms "
+            f"queries={stats['queries']} erros={stats['errors']}",
+            file=sys.stderr,
+        )
+    return 1 if any(stats["errors"] for stats in result["results"].values()) else 0
+
+
+def _compare(args: argparse.Namespace) -> int:
+    from benchmarks.compare import compare_results, format_report, load_results
+
+    comparisons = compare_results(
+        load_results(args.baseline),
+        load_results(args.current),
+        threshold=args.threshold,
+        metric=args.metric,
+        min_delta_ms=args.min_delta_ms,
+    )
+    print(format_report(comparisons))
+    return 1 if any(item.regression for item in comparisons) else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Gera o dataset e roda os cenarios")
+    run.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    run.add_argument("--fresh", action="store_true", help="Apaga o banco SQLite antes de gerar")
+    run.add_argument("--out", help="Arquivo JSON de saida (padrao: stdout)")
+    run.add_argument("--scenarios", help="Lista separada por virgula (padrao: todos)")
+    run.add_argument("--iterations", type=int, default=30)
+    run.add_argument("--warmup", type=int, default=3)
+    run.add_argument("--companies", type=int, default=3)
+    run.add_argument("--users", type=int, default=3)
+    run.add_argument("--aprs", type=int, default=40, help="APRs por empresa")
+    run.add_argument("--steps", type=int, default=8, help="Passos por APR")
+    run.add_argument("--risks", type=int, default=3, help="Riscos por passo")
+    run.add_argument("--evidence-ratio", type=float, default=0.25)
+    run.add_argument("--hazards", type=int, default=2000, help="Tamanho do catalogo de perigos")
+    run.add_argument("--epis", type=int, default=1000, help="Tamanho do catalogo de EPIs")
+    run.add_argument("--seed", type=int, default=1234)
+    run.set_defaults(handler=_run)
+
+    cmp = sub.add_parser("compare", help="Compara dois resultados e falha em regressao")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.2, help="Piora relativa tolerada (0.2 = 20%%)")
+    cmp.add_argument("--metric", default="p50_ms", choices=["mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+    cmp.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignora variacoes menores (ruido)")
+    cmp.set_defaults(handler=_compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Compara dois resultados JSON do runner e aponta regressoes."""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class Comparison:
+    scenario: str
+    metric: str
+    baseline: float
+    current: float
+    regression: bool
+    reason: str | None = None
+
+    @property
+    def change(self) -> float:
+        if not self.baseline:
+            return 0.0
+        return (self.current - self.baseline) / self.baseline
+
+
+def load_results(path: str | Path) -> dict:
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def compare_results(
+    baseline: dict,
+    current: dict,
+    *,
+    threshold: float = 0.2,
+    metric: str = "p50_ms",
+    min_delta_ms: float = 1.0,
+) -> list[Comparison]:
+    """Regressao: metrica pior que baseline*(1+threshold) e acima do ruido
+    (min_delta_ms), mais queries que antes, ou erros onde nao havia."""
+    comparisons: list[Comparison] = []
+    for name, before in baseline.get("results", {}).items():
+        after = current.get("results", {}).get(name)
+        if after is None:
+            continue
+        base_value = float(before.get(metric) or 0.0)
+        cur_value = float(after.get(metric) or 0.0)
+        reason = None
+        if after.get("errors") and not before.get("errors"):
+            reason = f"{after['errors']} erros"
+        elif (before.get("queries") is not None and after.get("queries") is not None
+              and after["queries"] > before["queries"]):
+            reason = f"queries {before['queries']} -> {after['queries']}"
+        elif base_value and cur_value > base_value * (1 + threshold) and cur_value - base_value >= min_delta_ms:
+            reason = f"{metric} +{(cur_value - base_value) / base_value:.0%}"
+        comparisons.append(
+            Comparison(
+                scenario=name,
+                metric=metric,
+                baseline=base_value,
+                current=cur_value,
+                regression=reason is not None,
+                reason=reason,
+            )
+        )
+    return comparisons
+
+
+def format_report(comparisons: list[Comparison]) -> str:
+    lines = [f"{'cenario':<24} {'baseline':>10} {'atual':>10} {'variacao':>9}  status"]
+    for item in comparisons:
+        status = f"REGRESSAO ({item.reason})" if item.regression else "ok"
+        lines.append(
+            f"{item.scenario:<24} {item.baseline:>10.2f} {item.current:>10.2f} {item.change:>+9.1%}  {status}"
+        )
+    return "\n".join(lines)
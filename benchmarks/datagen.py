@@ -0,0 +1,242 @@
+"""Gerador de dados sinteticos (tenants, APRs, passos, riscos e catalogos).
+
+Reprodutivel: o mesmo DatasetSpec (inclusive seed) gera os mesmos textos e a
+mesma distribuicao de perigos/EPIs/evidencias. Escreve direto no banco via
+ORM, entao passa pelos mesmos listeners (passo_items, auditoria) das rotas.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from uuid import uuid4
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from auth_utils import generate_token, hash_password
+from http_cache import claim_catalog_versions
+from models import APR, EPI, Company, Passo, Perigo, User
+from risk_engine import rebuild_risk_items_for_apr
+
+HAZARD_PREFIX = "Perigo sintetico"
+EPI_PREFIX = "EPI sintetico"
+EVIDENCE_FILENAME = "benchmark_evidence.jpg"
+EVIDENCE_DIR = Path("uploads") / "step_evidence"
+
+_VERBS = ["Isolar", "Montar", "Inspecionar", "Desmontar", "Soldar", "Icar", "Limpar", "Energizar"]
+_OBJECTS = ["andaime", "painel eletrico", "tubulacao", "estrutura metalica", "bomba", "valvula"]
+_CONTROLS = ["Sinalizar a area", "Bloquear e etiquetar", "Permissao de trabalho", "Ventilacao forcada"]
+_NORMS = ["NR-6", "NR-10", "NR-12", "NR-18", "NR-33", "NR-35"]
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    companies: int = 3
+    users_per_company: int = 3
+    aprs_per_company: int = 40
+    steps_per_apr: int = 8
+    hazards_per_step: int = 2
+    risks_per_step: int = 3
+    evidence_ratio: float = 0.25
+    final_ratio: float = 0.5
+    hazards: int = 2000
+    epis: int = 1000
+    seed: int = 1234
+
+
+@dataclass
+class Tenant:
+    company_id: int
+    user_id: int
+    token: str
+    responsible: str
+    final_apr_ids: list[int] = field(default_factory=list)
+    draft_apr_ids: list[int] = field(default_factory=list)
+
+
+@dataclass
+class Dataset:
+    spec: DatasetSpec
+    tenants: list[Tenant]
+    hazard_names: list[str]
+    epi_names: list[str]
+
+
+def hazard_name(n: int) -> str:
+    # Largura fixa: nenhum nome e prefixo de outro (o risk_engine casa por substring).
+    return f"{HAZARD_PREFIX} {n:05d}"
+
+
+def epi_name(n: int) -> str:
+    return f"{EPI_PREFIX} {n:05d}"
+
+
+def ensure_catalogs(db: Session, spec: DatasetSpec) -> tuple[list[str], list[str]]:
+    rng = random.Random(spec.seed)
+    hazards = [hazard_name(n) for n in range(1, spec.hazards + 1)]
+    epis = [epi_name(n) for n in range(1, spec.epis + 1)]
+
+    existing = set(db.execute(select(Perigo.perigo).where(Perigo.perigo.like(f"{HAZARD_PREFIX}%"))).scalars())
+    rows = [
+        {
+            "perigo": name,
+            "consequencias": f"Consequencia de {name.lower()}",
+            "salvaguardas": rng.choice(_CONTROLS),
+            "default_probability": rng.randint(1, 5),
+            "default_severity": rng.randint(1, 5),
+        }
+        for name in hazards
+        if name not in existing
+    ]
+    if rows:
+        # INSERT em lote nao passa pelo flush: sobe a versao do catalogo aqui.
+        version = claim_catalog_versions(db, {"perigos"})["perigos"]
+        db.execute(insert(Perigo), [{**row, "row_version": version} for row in rows])
+
+    existing = set(db.execute(select(EPI.epi).where(EPI.epi.like(f"{EPI_PREFIX}%"))).scalars())
+    rows = [
+        {"epi": name, "descricao": f"Descricao de {name.lower()}", "normas": "NR-6"}
+        for name in epis
+        if name not in existing
+    ]
+    if rows:
+        version = claim_catalog_versions(db, {"epis"})["epis"]
+        db.execute(insert(EPI), [{**row, "row_version": version} for row in rows])
+    db.commit()
+    return hazards, epis
+
+
+def ensure_evidence_file() -> None:
+    path = EVIDENCE_DIR / EVIDENCE_FILENAME
+    if path.exists():
+        return
+    from PIL import Image
+
+    EVIDENCE_DIR.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (640, 480), (180, 120, 60)).save(path, "JPEG", quality=80)
+
+
+def _step(rng: random.Random, spec: DatasetSpec, ordem: int, hazards: list[str], epis: list[str]) -> Passo:
+    step_hazards = rng.sample(hazards, k=min(spec.hazards_per_step, len(hazards)))
+    # Cada risco cita um perigo do passo, entao o rebuild sempre resolve o score.
+    risks = [f"{rng.choice(step_hazards)}: lesao {n + 1}" for n in range(spec.risks_per_step)]
+    passo = Passo(
+        ordem=ordem,
+        descricao=f"{rng.choice(_VERBS)} {rng.choice(_OBJECTS)} (etapa {ordem})",
+        perigos="; ".join(step_hazards),
+        riscos="; ".join(risks),
+        medidas_controle="; ".join(rng.sample(_CONTROLS, k=2)),
+        epis="; ".join(rng.sample(epis, k=min(3, len(epis)))),
+        normas="; ".join(rng.sample(_NORMS, k=2)),
+    )
+    if rng.random() < spec.evidence_ratio:
+        passo.evidence_type = "image"
+        passo.evidence_filename = EVIDENCE_FILENAME
+        passo.evidence_caption = f"Evidencia da etapa {ordem}"
+    return passo
+
+
+def create_aprs(
+    db: Session,
+    tenant: Tenant,
+    spec: DatasetSpec,
+    count: int,
+    *,
+    hazards: list[str],
+    epis: list[str],
+    status: str = "rascunho",
+    rng: random.Random | None = None,
+) -> list[int]:
+    rng = rng or random.Random(spec.seed + tenant.company_id)
+    aprs = []
+    for n in range(count):
+        apr = APR(
+            titulo=f"APR sintetica {n + 1}",
+            risco=rng.choice(["Baixo", "Medio", "Alto"]),
+            descricao="Gerada pelo benchmark",
+            worksite=f"Obra {rng.randint(1, 50)}",
+            sector=f"Setor {rng.randint(1, 10)}",
+            responsible=tenant.responsible,
+            activity_id=f"act-bench-{rng.randint(1, 20)}",
+            activity_name="Atividade sintetica",
+            date=date(2026, 1, 1) + timedelta(days=rng.randint(0, 365)),
+            status=status,
+            company_id=tenant.company_id,
+            user_id=tenant.user_id,
+            hazards=[{"name": name} for name in rng.sample(hazards, k=min(3, len(hazards)))],
+        )
+        for ordem in range(1, spec.steps_per_apr + 1):
+            step = _step(rng, spec, ordem, hazards, epis)
+            step.company_id = tenant.company_id
+            apr.passos.append(step)
+        db.add(apr)
+        aprs.append(apr)
+    db.flush()
+    for apr in aprs:
+        rebuild_risk_items_for_apr(db, apr.id)
+    db.commit()
+    return [apr.id for apr in aprs]
+
+
+def generate(db: Session, spec: DatasetSpec) -> Dataset:
+    rng = random.Random(spec.seed)
+    hazards, epis = ensure_catalogs(db, spec)
+    if spec.evidence_ratio > 0:
+        ensure_evidence_file()
+
+    # Hash barato: o custo do PBKDF2 nao e o que se mede aqui.
+    password_hash = hash_password("Benchmark123!", iterations=1000)
+    run_tag = uuid4().hex[:8]
+    tenants: list[Tenant] = []
+    for c in range(spec.companies):
+        company = Company(name=f"Benchmark {run_tag} {c + 1}", plan_name="enterprise")
+        db.add(company)
+        db.flush()
+        users = [
+            User(
+                email=f"bench.{run_tag}.{c + 1}.{u + 1}@example.com",
+                name=f"Tecnico {u + 1}",
+                password_hash=password_hash,
+                role="admin" if u == 0 else "tecnico",
+                company_id=company.id,
+                api_token=generate_token(),
+            )
+            for u in range(max(1, spec.users_per_company))
+        ]
+        db.add_all(users)
+        db.commit()
+
+        tenant = Tenant(
+            company_id=company.id,
+            user_id=users[0].id,
+            token=users[0].api_token,
+            responsible=f"Engenheiro {c + 1}",
+        )
+        finals = int(spec.aprs_per_company * spec.final_ratio)
+        tenant.final_apr_ids = create_aprs(
+            db, tenant, spec, finals, hazards=hazards, epis=epis, status="final", rng=rng
+        )
+        tenant.draft_apr_ids = create_aprs(
+            db, tenant, spec, spec.aprs_per_company - finals, hazards=hazards, epis=epis, rng=rng
+        )
+        tenants.append(tenant)
+    return Dataset(spec=spec, tenants=tenants, hazard_names=hazards, epi_names=epis)
+
+
+def write_epi_workbook(path: Path, rows: int, *, tag: str) -> Path:
+    """Planilha no contrato de importacao de EPIs com nomes novos (tag)."""
+    import pandas as pd
+
+    frame = pd.DataFrame(
+        {
+            "id": list(range(1, rows + 1)),
+            "epi": [f"{EPI_PREFIX} import {tag} {n:05d}" for n in range(1, rows + 1)],
+            "descricao": [f"Importado {n}" for n in range(1, rows + 1)],
+            "normas": ["NR-6"] * rows,
+        }
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    frame.to_excel(path, index=False)
+    return path
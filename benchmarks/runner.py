@@ -0,0 +1,381 @@
+"""Cenarios de benchmark dos caminhos quentes e execucao com saida em JSON.
+
+Cada cenario roda in-process (TestClient, sem rede) contra o banco configurado
+em DATABASE_URL. O tempo medido inclui auth, roteamento, serializacao e banco;
+nao inclui uvicorn/TLS. O numero de queries vem do header Server-Timing (HTTP)
+ou do contador de query_stats (chamadas diretas).
+"""
+from __future__ import annotations
+
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+from uuid import uuid4
+
+from benchmarks.datagen import Dataset, DatasetSpec, create_aprs, generate, write_epi_workbook
+
+RESULT_VERSION = 1
+LARGE_APR_STEPS = 200
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _queries_from_header(response) -> int | None:
+    header = response.headers.get("server-timing", "")
+    if 'desc="' not in header:
+        return None
+    try:
+        return int(header.split('desc="', 1)[1].split(" ", 1)[0])
+    except ValueError:
+        return None
+
+
+class BenchmarkContext:
+    def __init__(self, client, dataset: Dataset, session_factory, workdir: Path) -> None:
+        self.client = client
+        self.dataset = dataset
+        self.session_factory = session_factory
+        self.workdir = workdir
+        self.last_queries: int | None = None
+        self.state: dict = {}
+
+    def tenant(self, i: int):
+        tenants = self.dataset.tenants
+        return tenants[i % len(tenants)]
+
+    def request(self, method: str, url: str, tenant, *, expected: int = 200, **kwargs):
+        headers = {"X-API-Token": tenant.token}
+        response = self.client.request(method, url, headers=headers, **kwargs)
+        if response.status_code != expected:
+            raise RuntimeError(f"{method} {url} -> {response.status_code}: {response.text[:200]}")
+        self.last_queries = _queries_from_header(response)
+        return response
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Chamada direta (sem HTTP) contando as queries no mesmo contexto."""
+        import query_stats
+
+        stats, token = query_stats.start_request()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            query_stats.finish_request(token)
+            self.last_queries = stats.count
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    description: str
+    run: Callable[[BenchmarkContext, int], None]
+    prepare: Callable[[BenchmarkContext, int], None] | None = None
+
+
+# -------- cenarios --------
+def _auth(ctx: BenchmarkContext, i: int) -> None:
+    ctx.request("GET", "/auth/me", ctx.tenant(i))
+
+
+def _apr_detail(ctx: BenchmarkContext, i: int) -> None:
+    tenant = ctx.tenant(i)
+    apr_ids = tenant.final_apr_ids + tenant.draft_apr_ids
+    ctx.request("GET", f"/v1/aprs/{apr_ids[i // len(ctx.dataset.tenants) % len(apr_ids)]}", tenant)
+
+
+def _prepare_steps(ctx: BenchmarkContext, iterations: int) -> None:
+    targets = []
+    for tenant in ctx.dataset.tenants:
+        for apr_id in tenant.draft_apr_ids:
+            detail = ctx.request("GET", f"/v1/aprs/{apr_id}", tenant).json()
+            targets.append((tenant, apr_id, [p["id"] for p in detail["passos"]]))
+    if not targets:
+        raise RuntimeError("dataset sem APRs em rascunho")
+    ctx.state["step_targets"] = targets
+    ctx.state["next_ordem"] = {apr_id: len(ids) + 1 for _, apr_id, ids in targets}
+
+
+def _step_add(ctx: BenchmarkContext, i: int) -> None:
+    tenant, apr_id, _ = ctx.state["step_targets"][i % len(ctx.state["step_targets"])]
+    ordem = ctx.state["next_ordem"][apr_id]
+    ctx.state["next_ordem"][apr_id] += 1
+    hazard = ctx.dataset.hazard_names[i % len(ctx.dataset.hazard_names)]
+    ctx.request(
+        "POST",
+        f"/v1/aprs/{apr_id}/passos",
+        tenant,
+        json={
+            "ordem": ordem,
+            "descricao": f"Passo adicionado {ordem}",
+            "perigos": hazard,
+            "riscos": f"{hazard}: lesao",
+            "medidas_controle": "Sinalizar a area",
+            "epis": ctx.dataset.epi_names[i % len(ctx.dataset.epi_names)],
+            "normas": "NR-18",
+        },
+    )
+
+
+def _step_update(ctx: BenchmarkContext, i: int) -> None:
+    tenant, apr_id, passo_ids = ctx.state["step_targets"][i % len(ctx.state["step_targets"])]
+    passo_id = passo_ids[i % len(passo_ids)]
+    hazards = ctx.dataset.hazard_names
+    first, second = hazards[i % len(hazards)], hazards[(i + 7) % len(hazards)]
+    ctx.request(
+        "PATCH",
+        f"/v1/aprs/{apr_id}/passos/{passo_id}",
+        tenant,
+        json={"perigos": f"{first}; {second}", "riscos": f"{first}: queda; {second}: corte"},
+    )
+
+
+def _prepare_finalize(ctx: BenchmarkContext, iterations: int) -> None:
+    # Finalizar consome a APR; cada iteracao precisa de um rascunho novo.
+    queue = []
+    db = ctx.session_factory()
+    try:
+        for n, tenant in enumerate(ctx.dataset.tenants):
+            count = -(-iterations // len(ctx.dataset.tenants))
+            ids = create_aprs(
+                db,
+                tenant,
+                ctx.dataset.spec,
+                count,
+                hazards=ctx.dataset.hazard_names,
+                epis=ctx.dataset.epi_names,
+            )
+            queue.extend((tenant, apr_id) for apr_id in ids)
+    finally:
+        db.close()
+    ctx.state["finalize_queue"] = queue
+
+
+def _finalize(ctx: BenchmarkContext, i: int) -> None:
+    tenant, apr_id = ctx.state["finalize_queue"][i]
+    ctx.request(
+        "POST",
+        f"/v1/aprs/{apr_id}/finalize",
+        tenant,
+        json={"responsible_confirm": tenant.responsible},
+    )
+
+
+def _pdf(ctx: BenchmarkContext, i: int) -> None:
+    tenant = ctx.tenant(i)
+    apr_ids = tenant.final_apr_ids
+    if not apr_ids:
+        raise RuntimeError("dataset sem APRs finalizadas")
+    ctx.request("GET", f"/v1/aprs/{apr_ids[i % len(apr_ids)]}/pdf", tenant)
+
+
+def _prepare_activities(ctx: BenchmarkContext, iterations: int) -> None:
+    activities = ctx.request("GET", "/v1/activities", ctx.tenant(0)).json()
+    if not activities:
+        raise RuntimeError("planilha de atividades vazia")
+    ctx.state["activity_ids"] = [activity["id"] for activity in activities]
+
+
+def _activity_suggestions(ctx: BenchmarkContext, i: int) -> None:
+    ids = ctx.state["activity_ids"]
+    ctx.request("GET", f"/v1/activities/{ids[i % len(ids)]}/suggestions", ctx.tenant(i))
+
+
+def _catalog_search(ctx: BenchmarkContext, i: int) -> None:
+    # Termo com muitos resultados e termo seletivo, alternados.
+    term = "sintetico" if i % 2 == 0 else f"{(i * 37) % 1000:03d}"
+    ctx.request("GET", "/v1/perigos", ctx.tenant(i), params={"search": term, "limit": 50})
+
+
+def _prepare_import(ctx: BenchmarkContext, iterations: int) -> None:
+    rows = max(50, ctx.dataset.spec.epis // 10)
+    ctx.state["workbooks"] = [
+        write_epi_workbook(ctx.workdir / f"epis_{n}.xlsx", rows, tag=uuid4().hex[:8]) for n in range(iterations)
+    ]
+
+
+def _excel_import(ctx: BenchmarkContext, i: int) -> None:
+    from importar_excel import importar_epis
+
+    db = ctx.session_factory()
+    try:
+        ctx.call(importar_epis, db, str(ctx.state["workbooks"][i]))
+    finally:
+        db.close()
+
+
+def _prepare_large_apr(ctx: BenchmarkContext, iterations: int) -> None:
+    if "large_apr" in ctx.state:
+        return
+    import schemas
+    from models import APR
+
+    tenant = ctx.tenant(0)
+    db = ctx.session_factory()
+    try:
+        spec = replace(ctx.dataset.spec, steps_per_apr=LARGE_APR_STEPS)
+        (apr_id,) = create_aprs(db, tenant, spec, 1, hazards=ctx.dataset.hazard_names, epis=ctx.dataset.epi_names)
+        # Validado uma vez aqui: os cenarios de serializacao medem so o encode.
+        detail = schemas.APRDetail.model_validate(db.get(APR, apr_id))
+    finally:
+        db.close()
+    ctx.state["large_apr"] = (tenant, apr_id, detail)
+
+
+def _large_apr_detail(ctx: BenchmarkContext, i: int) -> None:
+    tenant, apr_id, _ = ctx.state["large_apr"]
+    ctx.request("GET", f"/v1/aprs/{apr_id}", tenant)
+
+
+def _large_apr_serialize(ctx: BenchmarkContext, i: int) -> None:
+    # Mesmo caminho da rota com response_model: pydantic direto para bytes.
+    import schemas
+
+    _, _, detail = ctx.state["large_apr"]
+    ctx.call(schemas.APRDetail.__pydantic_serializer__.to_json, detail)
+
+
+def _large_apr_serialize_stdlib(ctx: BenchmarkContext, i: int) -> None:
+    # Referencia: jsonable_encoder + json stdlib (JSONResponse do Starlette).
+    from fastapi.encoders import jsonable_encoder
+    from starlette.responses import JSONResponse
+
+    _, _, detail = ctx.state["large_apr"]
+    ctx.call(lambda: JSONResponse(jsonable_encoder(detail)).body)
+
+
+def _large_apr_serialize_dict(ctx: BenchmarkContext, i: int) -> None:
+    # Rotas sem response_model: jsonable_encoder + UTF8JSONResponse (orjson).
+    from fastapi.encoders import jsonable_encoder
+    from json_response import UTF8JSONResponse
+
+    _, _, detail = ctx.state["large_apr"]
+    ctx.call(lambda: UTF8JSONResponse(jsonable_encoder(detail)).body)
+
+
+SCENARIOS: dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("auth_resolution", "GET /auth/me (token -> usuario)", _auth),
+        Scenario("apr_detail", "GET /v1/aprs/{id}", _apr_detail),
+        Scenario("step_add", "POST passo + rebuild de riscos", _step_add, _prepare_steps),
+        Scenario("step_update", "PATCH passo + rebuild de riscos", _step_update, _prepare_steps),
+        Scenario("finalize", "POST /v1/aprs/{id}/finalize", _finalize, _prepare_finalize),
+        Scenario("pdf_render", "GET /v1/aprs/{id}/pdf", _pdf),
+        Scenario("activity_suggestions", "GET /v1/activities/{id}/suggestions", _activity_suggestions, _prepare_activities),
+        Scenario("catalog_search", "GET /v1/perigos?search=", _catalog_search),
+        Scenario("excel_import", "importar_epis de uma planilha nova", _excel_import, _prepare_import),
+        Scenario("apr_detail_200", "GET /v1/aprs/{id} com 200 passos", _large_apr_detail, _prepare_large_apr),
+        Scenario("apr_serialize_200", "APRDetail de 200 passos -> JSON (response_model)", _large_apr_serialize, _prepare_large_apr),
+        Scenario("apr_serialize_200_dict", "APRDetail de 200 passos -> jsonable_encoder + orjson", _large_apr_serialize_dict, _prepare_large_apr),
+        Scenario("apr_serialize_200_stdlib", "APRDetail de 200 passos -> jsonable_encoder + json stdlib", _large_apr_serialize_stdlib, _prepare_large_apr),
+    )
+}
+
+
+def _run_scenario(ctx: BenchmarkContext, scenario: Scenario, iterations: int, warmup: int) -> dict:
+    total = iterations + warmup
+    if scenario.prepare:
+        scenario.prepare(ctx, total)
+    timings: list[float] = []
+    queries: list[int] = []
+    errors: list[str] = []
+    for i in range(total):
+        ctx.last_queries = None
+        started = time.perf_counter()
+        try:
+            scenario.run(ctx, i)
+        except Exception as exc:  # noqa: BLE001 - erro vira dado do resultado
+            errors.append(str(exc)[:200])
+            continue
+        elapsed = (time.perf_counter() - started) * 1000
+        if i < warmup:
+            continue
+        timings.append(elapsed)
+        if ctx.last_queries is not None:
+            queries.append(ctx.last_queries)
+    return {
+        "description": scenario.description,
+        "iterations": len(timings),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "mean_ms": round(statistics.fmean(timings), 3) if timings else 0.0,
+        "p50_ms": round(statistics.median(timings), 3) if timings else 0.0,
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "p99_ms": round(_percentile(timings, 99), 3),
+        "min_ms": round(min(timings), 3) if timings else 0.0,
+        "max_ms": round(max(timings), 3) if timings else 0.0,
+        "queries": int(statistics.median(queries)) if queries else None,
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(
+    client,
+    session_factory,
+    spec: DatasetSpec,
+    *,
+    scenarios: list[str] | None = None,
+    iterations: int = 30,
+    warmup: int = 3,
+    dataset: Dataset | None = None,
+) -> dict:
+    names = scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"cenarios desconhecidos: {', '.join(unknown)}")
+
+    started = time.perf_counter()
+    if dataset is None:
+        db = session_factory()
+        try:
+            dataset = generate(db, spec)
+        finally:
+            db.close()
+    generation_s = time.perf_counter() - started
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="apr-bench-") as workdir:
+        ctx = BenchmarkContext(client, dataset, session_factory, Path(workdir))
+        for name in names:
+            results[name] = _run_scenario(ctx, SCENARIOS[name], iterations, warmup)
+
+    bind = session_factory.kw.get("bind") if hasattr(session_factory, "kw") else None
+    return {
+        "version": RESULT_VERSION,
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "database": bind.dialect.name if bind is not None else None,
+            "dataset": asdict(spec),
+            "dataset_generation_s": round(generation_s, 3),
+            "iterations": iterations,
+            "warmup": warmup,
+        },
+        "results": results,
+    }
@@ -0,0 +1,178 @@
+"""Snapshot e delta dos catalogos (EPIs, perigos, atividades) para uso offline.
+
+A versao de sincronizacao e "<epis>.<perigos>.<atividades>": os dois primeiros
+sao os contadores de catalog_versions (cada linha alterada guarda o seu em
+row_version) e o ultimo identifica a planilha de atividades. O snapshot fica
+pronto em memoria (JSON e gzip) ate a versao mudar.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from apr_flow import activities_version, get_activity_suggestions, list_activities
+from excel_contract import SCHEMA_VERSION, build_catalogs
+from json_response import dumps
+from metrics import CACHE_EVENTS
+from models import EPI, CatalogTombstone, CatalogVersion, Perigo
+
+
+@dataclass(frozen=True)
+class SyncVersion:
+    epis: int
+    hazards: int
+    activities: str
+
+    def __str__(self) -> str:
+        return f"{self.epis}.{self.hazards}.{self.activities}"
+
+
+def parse_version(value: str | None) -> SyncVersion | None:
+    parts = (value or "").strip().split(".")
+    if len(parts) != 3 or not parts[2]:
+        return None
+    try:
+        epis, hazards = int(parts[0]), int(parts[1])
+    except ValueError:
+        return None
+    if epis < 0 or hazards < 0:
+        return None
+    return SyncVersion(epis, hazards, parts[2])
+
+
+def _activities_tag() -> str:
+    marker = activities_version()
+    return hashlib.sha1(marker.encode("ascii")).hexdigest()[:8] if marker else "0"
+
+
+def current_version(db: Session) -> SyncVersion:
+    counters = dict(
+        db.execute(
+            select(CatalogVersion.name, CatalogVersion.version).where(CatalogVersion.name.in_(("epis", "perigos")))
+        ).all()
+    )
+    return SyncVersion(counters.get("epis", 0), counters.get("perigos", 0), _activities_tag())
+
+
+def _epi_items(db: Session, since: int | None = None) -> list[dict]:
+    stmt = select(EPI.id, EPI.epi, EPI.descricao, EPI.normas).order_by(EPI.id)
+    if since is not None:
+        stmt = stmt.where(EPI.row_version > since)
+    return [
+        {"id": row.id, "name": row.epi, "descricao": row.descricao, "normas": row.normas}
+        for row in db.execute(stmt)
+    ]
+
+
+def _hazard_items(db: Session, since: int | None = None) -> list[dict]:
+    stmt = select(
+        Perigo.id,
+        Perigo.perigo,
+        Perigo.default_severity,
+        Perigo.default_probability,
+        Perigo.consequencias,
+        Perigo.salvaguardas,
+    ).order_by(Perigo.id)
+    if since is not None:
+        stmt = stmt.where(Perigo.row_version > since)
+    return [
+        {
+            "id": row.id,
+            "name": row.perigo,
+            "default_severity": row.default_severity,
+            "default_probability": row.default_probability,
+            "consequencias": row.consequencias,
+            "salvaguardas": row.salvaguardas,
+        }
+        for row in db.execute(stmt)
+    ]
+
+
+def _activity_items() -> list[dict]:
+    # Passos sugeridos junto: offline o app nao chama /suggestions por atividade.
+    items = []
+    for activity in list_activities():
+        suggestions = get_activity_suggestions(activity["id"]) or {}
+        items.append({**activity, "steps": suggestions.get("steps", [])})
+    return items
+
+
+def _deleted_ids(db: Session, catalog: str, since: int) -> list[int]:
+    stmt = (
+        select(CatalogTombstone.item_id)
+        .where(CatalogTombstone.catalog == catalog, CatalogTombstone.row_version > since)
+        .order_by(CatalogTombstone.item_id)
+    )
+    return list(dict.fromkeys(db.scalars(stmt)))
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: SyncVersion
+    body: bytes
+    gzip_body: bytes
+
+
+_snapshot: Snapshot | None = None
+_snapshot_lock = threading.Lock()
+
+
+def build_snapshot(db: Session, version: SyncVersion) -> Snapshot:
+    # A versao e lida antes dos dados: o snapshot pode vir um pouco mais novo
+    # que a versao anunciada (o proximo delta repete essas linhas), nunca mais velho.
+    document = {
+        "version": str(version),
+        "schema_version": SCHEMA_VERSION,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "catalogs": build_catalogs(_epi_items(db), _hazard_items(db), _activity_items()),
+    }
+    body = dumps(document)
+    return Snapshot(version=version, body=body, gzip_body=gzip.compress(body, compresslevel=9, mtime=0))
+
+
+def get_snapshot(db: Session, version: SyncVersion | None = None) -> Snapshot:
+    """Snapshot da versao (atual, se omitida), montado uma vez por versao."""
+    global _snapshot
+    version = version or current_version(db)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        CACHE_EVENTS.labels("catalog_snapshot", "hit").inc()
+        return snapshot
+    with _snapshot_lock:
+        snapshot = _snapshot
+        if snapshot is None or snapshot.version != version:
+            CACHE_EVENTS.labels("catalog_snapshot", "miss").inc()
+            snapshot = _snapshot = build_snapshot(db, version)
+        return snapshot
+
+
+def clear_snapshot() -> None:
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+def build_delta(db: Session, since: SyncVersion) -> dict:
+    current = current_version(db)
+    if since.epis > current.epis or since.hazards > current.hazards:
+        # Versao do cliente e de outro banco (restore, ambiente trocado): baixa tudo de novo.
+        return {"version": str(current), "since": str(since), "full_sync_required": True, "catalogs": None}
+    catalogs = {
+        "epis": {
+            "upserts": _epi_items(db, since.epis) if since.epis < current.epis else [],
+            "deleted": _deleted_ids(db, "epis", since.epis) if since.epis < current.epis else [],
+        },
+        "hazards": {
+            "upserts": _hazard_items(db, since.hazards) if since.hazards < current.hazards else [],
+            "deleted": _deleted_ids(db, "perigos", since.hazards) if since.hazards < current.hazards else [],
+        },
+        # Atividades vem de uma planilha sem versao por linha: mudou, vai a lista inteira.
+        "activities": {"items": _activity_items()} if since.activities != current.activities else None,
+    }
+    return {"version": str(current), "since": str(since), "full_sync_required": False, "catalogs": catalogs}
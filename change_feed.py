@@ -0,0 +1,403 @@
+"""Feed de mudancas por empresa (APR, Passo, RiskItem) para sincronizacao incremental.
+
+Cada escrita vira uma linha em change_log com seq crescente (upsert ou delete).
+O feed devolve o estado atual das entidades alteradas depois do cursor, com
+uma entrada por entidade. As linhas sao gravadas no before_commit, mas o seq
+sai antes do commit terminar: duas transacoes podem ficar visiveis fora de
+ordem. Por isso linhas mais novas que CHANGE_FEED_SETTLE_SECONDS ficam para a
+proxima leitura, e um cursor ja entregue nunca pula uma linha atrasada.
+
+Retencao: linhas com mais de CHANGE_LOG_RETENTION_DAYS sao apagadas por
+prune_change_log; a mais nova apagada de cada empresa fica como marcador
+(op "pruned") e um cursor abaixo dele recebe full_sync_required.
+
+Volume por edicao: editar um passo gera um upsert do passo e, se os riscos
+derivados mudarem, o rebuild da APR reescreve todos eles (um delete e um upsert
+por risco da APR). Edicao que nao muda os riscos nao gera linha de risco.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from itertools import chain
+
+from sqlalchemy import DateTime, delete, func, insert, literal, select, union_all, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, lazyload
+from sqlalchemy.sql.expression import FunctionElement
+
+import schemas
+from database import SessionLocal
+from models import APR, ChangeLogEntry, Passo, RiskItem
+
+logger = logging.getLogger(__name__)
+
+ENTITIES = {APR: "apr", Passo: "passo", RiskItem: "risk_item"}
+_SCHEMAS = {"apr": schemas.APROut, "passo": schemas.PassoOut, "risk_item": schemas.RiskItemOut}
+_MODELS = {name: model for model, name in ENTITIES.items()}
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+PRUNED = "pruned"
+_PRUNE_TASK: asyncio.Task | None = None
+
+
+def settle_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("CHANGE_FEED_SETTLE_SECONDS", "2")))
+    except ValueError:
+        return 2.0
+
+
+def _env_int(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        value = int(os.getenv(name, str(default)))
+    except Exception:
+        value = default
+    return max(minimum, value)
+
+
+def retention_days() -> int:
+    """0 desliga a limpeza."""
+    return _env_int("CHANGE_LOG_RETENTION_DAYS", 30)
+
+
+def _prune_interval() -> int:
+    return _env_int("CHANGE_LOG_PRUNE_INTERVAL", 3600, minimum=60)
+
+
+class _db_clock(FunctionElement):
+    """Hora do banco no momento do statement (created_at e horizonte no mesmo relogio).
+
+    now() no Postgres e o inicio da transacao: uma transacao longa gravaria
+    created_at velho demais para a janela de acomodacao.
+    """
+
+    type = DateTime()
+    inherit_cache = True
+
+
+class _db_horizon(FunctionElement):
+    """Hora do banco menos N segundos (_db_horizon(segundos))."""
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(_db_clock)
+def _compile_clock(element, compiler, **kw) -> str:
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(_db_clock, "postgresql")
+def _compile_clock_pg(element, compiler, **kw) -> str:
+    # UTC sem fuso, como os demais DateTime (datetime.utcnow) do schema.
+    return "timezone('utc', clock_timestamp())"
+
+
+@compiles(_db_horizon)
+def _compile_horizon(element, compiler, **kw) -> str:
+    # Mesmo formato de CURRENT_TIMESTAMP no SQLite, para a comparacao de texto valer.
+    seconds = compiler.process(element.clauses, **kw)
+    return f"datetime('now', '-' || {seconds} || ' seconds')"
+
+
+@compiles(_db_horizon, "postgresql")
+def _compile_horizon_pg(element, compiler, **kw) -> str:
+    seconds = compiler.process(element.clauses, **kw)
+    return f"timezone('utc', clock_timestamp()) - make_interval(secs => {seconds})"
+
+
+def _apr_id(obj) -> int | None:
+    return obj.id if isinstance(obj, APR) else obj.apr_id
+
+
+_BUFFER_KEY = "apr_change_log"
+
+
+def _buffer(session: Session, changes) -> None:
+    # Como audit.record_event: acumula na sessao e grava um INSERT so no commit,
+    # em vez de um por flush (o rebuild de riscos faz varios flushes).
+    if changes:
+        session.info.setdefault(_BUFFER_KEY, []).extend(changes)
+
+
+def flush_changes(session: Session) -> int:
+    changes = session.info.pop(_BUFFER_KEY, None)
+    if not changes:
+        return 0
+    connection = session.connection()
+    missing = {apr_id for _, _, apr_id, company_id, _ in changes if company_id is None and apr_id}
+    companies = (
+        dict(connection.execute(select(APR.id, APR.company_id).where(APR.id.in_(missing))).all())
+        if missing
+        else {}
+    )
+    rows = []
+    for entity, entity_id, apr_id, company_id, op in changes:
+        company_id = company_id if company_id is not None else companies.get(apr_id)
+        if company_id is None:
+            continue  # APR sem empresa (legado): fora de qualquer feed
+        rows.append(
+            {
+                "company_id": company_id,
+                "entity": entity,
+                "entity_id": entity_id,
+                "apr_id": apr_id,
+                "op": op,
+            }
+        )
+    if rows:
+        connection.execute(insert(ChangeLogEntry).values(created_at=_db_clock()), rows)
+    return len(rows)
+
+
+def record_apr_children(
+    session: Session, apr_id: int, company_id: int, *, step_ids: list[int] | None = None
+) -> None:
+    """Registra como upsert passos e riscos gravados por INSERT em lote (fora do flush).
+
+    Sem step_ids vale tudo da APR; com step_ids, so esses passos e os riscos deles.
+    """
+    passos = select(literal("passo").label("entity"), Passo.id).where(Passo.apr_id == apr_id)
+    risks = select(literal("risk_item").label("entity"), RiskItem.id).where(RiskItem.apr_id == apr_id)
+    if step_ids is not None:
+        passos = passos.where(Passo.id.in_(step_ids))
+        risks = risks.where(RiskItem.step_id.in_(step_ids))
+    stmt = union_all(passos, risks)
+    rows = session.execute(stmt).all()
+    _buffer(session, [(entity, entity_id, apr_id, company_id, "upsert") for entity, entity_id in rows])
+
+
+def _record_flush(session: Session, flush_context) -> None:
+    changes = []
+    for obj in chain(session.new, session.dirty, session.deleted):
+        entity = ENTITIES.get(type(obj))
+        if entity is None:
+            continue
+        if obj in session.deleted:
+            op = "delete"
+        elif obj in session.new or session.is_modified(obj, include_collections=False):
+            op = "upsert"
+        else:
+            continue
+        changes.append((entity, obj.id, _apr_id(obj), obj.company_id, op))
+    _buffer(session, changes)
+
+
+def _delete_rows(rows, entity: str) -> list[tuple]:
+    return [(entity, row.id, row.apr_id, row.company_id, "delete") for row in rows]
+
+
+def _record_bulk_delete(state):
+    # delete(Passo)/delete(RiskItem) em massa nao passa pelo flush: os ids vem do
+    # proprio DELETE (RETURNING) ou, sem suporte no dialeto, de um SELECT antes.
+    if not state.is_delete or state.bind_mapper is None:
+        return None
+    model = state.bind_mapper.class_
+    entity = ENTITIES.get(model)
+    if entity is None or model is APR:
+        return None
+    session = state.session
+    where = state.statement.whereclause
+    columns = (model.id, model.apr_id, model.company_id)
+    changes = []
+    if model is Passo:
+        # Riscos apagados em cascata pelo banco nao aparecem no RETURNING.
+        passo_ids = select(Passo.id)
+        if where is not None:
+            passo_ids = passo_ids.where(where)
+        risks = session.execute(
+            select(RiskItem.id, RiskItem.apr_id, RiskItem.company_id).where(RiskItem.step_id.in_(passo_ids))
+        ).all()
+        changes.extend(_delete_rows(risks, "risk_item"))
+
+    result = None
+    if session.get_bind(mapper=state.bind_mapper).dialect.delete_returning:
+        # Os DELETE do app nao pedem RETURNING: o resultado vira as linhas apagadas.
+        frozen = state.invoke_statement(statement=state.statement.returning(*columns)).freeze()
+        rows = frozen().all()
+        result = frozen()
+    else:
+        stmt = select(*columns)
+        if where is not None:
+            stmt = stmt.where(where)
+        rows = session.execute(stmt).all()
+    changes.extend(_delete_rows(rows, entity))
+    _buffer(session, changes)
+    return result
+
+
+def _write_pending_changes(session: Session) -> None:
+    # O flush final do commit roda depois deste evento: antecipa para nao perder mudancas.
+    session.flush()
+    flush_changes(session)
+
+
+def _discard_pending_changes(session: Session) -> None:
+    session.info.pop(_BUFFER_KEY, None)
+
+
+SESSION_LISTENERS = (
+    ("after_flush", _record_flush),
+    ("do_orm_execute", _record_bulk_delete),
+    ("before_commit", _write_pending_changes),
+    ("after_rollback", _discard_pending_changes),
+)
+
+
+def head_cursor(db: Session, company_id: int, horizon) -> int:
+    return (
+        db.execute(
+            select(func.max(ChangeLogEntry.seq)).where(
+                ChangeLogEntry.company_id == company_id, ChangeLogEntry.created_at <= horizon
+            )
+        ).scalar_one()
+        or 0
+    )
+
+
+def _load(db: Session, entity: str, ids: list[int]) -> dict[int, dict]:
+    if not ids:
+        return {}
+    model = _MODELS[entity]
+    # Sem relacionamentos: o feed manda cada entidade achatada.
+    objs = db.execute(select(model).where(model.id.in_(ids)).options(lazyload("*"))).scalars()
+    schema = _SCHEMAS[entity]
+    return {obj.id: schema.model_validate(obj).model_dump(mode="json") for obj in objs}
+
+
+def _full_sync(db: Session, company_id: int, horizon) -> dict:
+    # O cliente baixa tudo pelas listagens e segue deste cursor.
+    return {
+        "cursor": head_cursor(db, company_id, horizon),
+        "has_more": False,
+        "full_sync_required": True,
+        "changes": [],
+    }
+
+
+def read_feed(db: Session, company_id: int, cursor: int | None, limit: int = DEFAULT_LIMIT) -> dict:
+    limit = min(max(limit, 1), MAX_LIMIT)
+    horizon = _db_horizon(settle_seconds())
+    if cursor is None:
+        return _full_sync(db, company_id, horizon)
+
+    entries = (
+        db.execute(
+            select(ChangeLogEntry)
+            .where(
+                ChangeLogEntry.company_id == company_id,
+                ChangeLogEntry.seq > cursor,
+                ChangeLogEntry.created_at <= horizon,
+            )
+            .order_by(ChangeLogEntry.seq)
+            .limit(limit + 1)
+        )
+        .scalars()
+        .all()
+    )
+    if entries and entries[0].op == PRUNED:
+        # O marcador e a linha retida mais antiga da empresa: o que vinha
+        # entre o cursor e ele ja foi apagado pela retencao.
+        return _full_sync(db, company_id, horizon)
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Uma entrada por entidade: vale a ultima operacao da pagina.
+    latest: dict[tuple[str, int], ChangeLogEntry] = {}
+    for entry in entries:
+        latest.pop((entry.entity, entry.entity_id), None)
+        latest[(entry.entity, entry.entity_id)] = entry
+
+    upserts: dict[str, list[int]] = {}
+    for (entity, entity_id), entry in latest.items():
+        if entry.op == "upsert":
+            upserts.setdefault(entity, []).append(entity_id)
+    current = {entity: _load(db, entity, ids) for entity, ids in upserts.items()}
+
+    changes = []
+    for (entity, entity_id), entry in latest.items():
+        data = current.get(entity, {}).get(entity_id) if entry.op == "upsert" else None
+        changes.append(
+            {
+                "seq": entry.seq,
+                "entity": entity,
+                "id": entity_id,
+                "apr_id": entry.apr_id,
+                # Sumiu depois do upsert: o delete vem numa pagina seguinte; ja avisa aqui.
+                "op": "upsert" if data is not None else "delete",
+                "data": data,
+            }
+        )
+    return {
+        "cursor": entries[-1].seq if entries else cursor,
+        "has_more": has_more,
+        "full_sync_required": False,
+        "changes": changes,
+    }
+
+
+def prune_change_log(db: Session, days: int | None = None) -> int:
+    """Apaga linhas mais velhas que `days` dias; devolve quantas saiu.
+
+    A mais nova das apagaveis de cada empresa vira o marcador PRUNED (e o
+    marcador anterior sai), entao read_feed ainda sabe ate onde houve corte.
+    """
+    days = retention_days() if days is None else days
+    if days <= 0:
+        return 0
+    cutoff = _db_horizon(days * 86400)
+    markers = (
+        select(func.max(ChangeLogEntry.seq))
+        .where(ChangeLogEntry.created_at < cutoff)
+        .group_by(ChangeLogEntry.company_id)
+    )
+    db.execute(update(ChangeLogEntry).where(ChangeLogEntry.seq.in_(markers)).values(op=PRUNED))
+    removed = db.execute(
+        delete(ChangeLogEntry).where(ChangeLogEntry.created_at < cutoff, ChangeLogEntry.op != PRUNED)
+    ).rowcount
+    # Marcadores antigos: so o mais novo de cada empresa importa.
+    stale = db.execute(
+        delete(ChangeLogEntry).where(ChangeLogEntry.op == PRUNED, ChangeLogEntry.seq.not_in(markers))
+    ).rowcount
+    return (removed or 0) + (stale or 0)
+
+
+def run_prune() -> int:
+    db = SessionLocal()
+    try:
+        removed = prune_change_log(db)
+        db.commit()
+        return removed
+    except Exception:
+        db.rollback()
+        logger.exception("Falha ao limpar change_log")
+        return 0
+    finally:
+        db.close()
+
+
+async def _prune_loop() -> None:
+    while True:
+        await asyncio.sleep(_prune_interval())
+        removed = await asyncio.to_thread(run_prune)
+        if removed:
+            logger.info("change_log: %s linhas removidas pela retencao", removed)
+
+
+def start_pruner() -> None:
+    global _PRUNE_TASK
+    if retention_days() and (_PRUNE_TASK is None or _PRUNE_TASK.done()):
+        _PRUNE_TASK = asyncio.get_running_loop().create_task(_prune_loop())
+
+
+async def stop_pruner() -> None:
+    global _PRUNE_TASK
+    task, _PRUNE_TASK = _PRUNE_TASK, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, RuntimeError):
+            pass
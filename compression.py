@@ -0,0 +1,217 @@
+"""Compressao negociada (br/gzip) das respostas, com suporte a streaming."""
+from __future__ import annotations
+
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli e opcional; sem ele so gzip
+    brotli = None
+
+# Formatos que ja chegam comprimidos: recomprimir so gasta CPU.
+_SKIP_PREFIXES = ("image/", "video/", "audio/", "font/woff")
+_SKIP_TYPES = {
+    "application/pdf",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/octet-stream",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+_NO_BODY_STATUS = {204, 304}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _header(headers, name: bytes) -> str | None:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def negotiate(accept_encoding: str | None, *, brotli_available: bool | None = None) -> str | None:
+    """Escolhe "br" ou "gzip" a partir do Accept-Encoding (respeita q=0)."""
+    if not accept_encoding:
+        return None
+    if brotli_available is None:
+        brotli_available = brotli is not None
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    star = weights.get("*", 0.0)
+    candidates = (["br"] if brotli_available else []) + ["gzip"]
+    best = None
+    for name in candidates:
+        q = weights.get(name, star)
+        if q > 0 and (best is None or q > best[1]):
+            best = (name, q)
+    return best[0] if best else None
+
+
+def is_compressible(content_type: str | None) -> bool:
+    if not content_type:
+        return False
+    media = content_type.split(";", 1)[0].strip().lower()
+    return media not in _SKIP_TYPES and not media.startswith(_SKIP_PREFIXES)
+
+
+class _GzipEncoder:
+    def __init__(self, level: int) -> None:
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self, quality: int) -> None:
+        self._obj = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class CompressionMiddleware:
+    """Comprime respostas acima de COMPRESSION_MIN_SIZE conforme o Accept-Encoding.
+
+    Pula PDFs, imagens, planilhas e respostas que ja tem Content-Encoding ou
+    Cache-Control: no-transform. Respostas em streaming (NDJSON) sao comprimidas
+    pedaco a pedaco com flush, para cada linha chegar sem esperar o fim.
+    Os bytes sem compressao ficam em scope["apr.response_bytes"] para o log.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int | None = None,
+        gzip_level: int | None = None,
+        brotli_quality: int | None = None,
+        enabled: bool | None = None,
+    ):
+        self.app = app
+        self.minimum_size = _env_int("COMPRESSION_MIN_SIZE", 1024) if minimum_size is None else minimum_size
+        self.gzip_level = _env_int("COMPRESSION_GZIP_LEVEL", 6) if gzip_level is None else gzip_level
+        self.brotli_quality = _env_int("COMPRESSION_BROTLI_QUALITY", 4) if brotli_quality is None else brotli_quality
+        if enabled is None:
+            enabled = os.getenv("COMPRESSION_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+        self.enabled = enabled
+
+    def _encoder(self, encoding: str):
+        if encoding == "br":
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(_header(scope.get("headers") or [], b"accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+        raw_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal start_message, encoder, passthrough, raw_bytes
+            kind = message["type"]
+            if kind == "http.response.start":
+                headers = message.get("headers") or []
+                length = _header(headers, b"content-length")
+                cache_control = (_header(headers, b"cache-control") or "").lower()
+                if (
+                    int(message.get("status", 200)) in _NO_BODY_STATUS
+                    or _header(headers, b"content-encoding") is not None
+                    or "no-transform" in cache_control
+                    or not is_compressible(_header(headers, b"content-type"))
+                    or (length is not None and length.isdigit() and int(length) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                # Segura o inicio: o tamanho so e conhecido no primeiro pedaco do corpo.
+                start_message = message
+                return
+            if kind != "http.response.body" or passthrough:
+                if start_message is not None and encoder is None and not passthrough:
+                    # Ex.: http.response.pathsend (arquivo enviado pelo servidor).
+                    passthrough = True
+                    await send(start_message)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            raw_bytes += len(body)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = self._encoder(encoding)
+                headers = [
+                    (key, value)
+                    for key, value in start_message.get("headers") or []
+                    if key.lower() != b"content-length"
+                ]
+                headers.append((b"content-encoding", encoding.encode("ascii")))
+                vary = _header(headers, b"vary")
+                if vary is None:
+                    headers.append((b"vary", b"Accept-Encoding"))
+                elif "accept-encoding" not in vary.lower():
+                    headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+                    headers.append((b"vary", f"{vary}, Accept-Encoding".encode("latin-1")))
+                if not more_body:
+                    compressed = encoder.compress(body) + encoder.finish()
+                    headers.append((b"content-length", str(len(compressed)).encode("ascii")))
+                    start_message["headers"] = headers
+                    scope["apr.response_bytes"] = raw_bytes
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                start_message["headers"] = headers
+                await send(start_message)
+
+            if more_body:
+                chunk = encoder.compress(body) + encoder.flush()
+            else:
+                chunk = encoder.compress(body) + encoder.finish()
+                scope["apr.response_bytes"] = raw_bytes
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
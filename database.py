@@ -1,6 +1,9 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, exc
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from env_loader import load_environment
 
 load_environment()
@@ -15,6 +18,21 @@ def _normalize_database_url(raw_url: str) -> str:
     return url
 
 
+def env_int(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        value = int(os.getenv(name, str(default)))
+    except Exception:
+        value = default
+    return max(minimum, value)
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
+
+
 raw_database_url = os.getenv("DATABASE_URL", "").strip()
 if not raw_database_url:
     raise RuntimeError(
@@ -24,9 +42,142 @@ if not raw_database_url:
 
 DATABASE_URL = _normalize_database_url(raw_database_url)
 
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+class TimedQueuePool(QueuePool):
+    """QueuePool que mede quanto cada checkout esperou por uma conexao.
+
+    Estatisticas por pool (primario e replica separados); dispose() recria o
+    pool e zera os contadores.
+    """
+
+    def __init__(self, creator, *args, max_overflow: int = 10, **kwargs):
+        super().__init__(creator, *args, max_overflow=max_overflow, **kwargs)
+        self.configured_max_overflow = max_overflow
+        self._stats_lock = threading.Lock()
+        self._stats = {"checkouts": 0, "timeouts": 0, "wait_total_ms": 0.0, "wait_max_ms": 0.0}
+
+    def _record_wait(self, elapsed: float, *, timed_out: bool = False) -> None:
+        elapsed_ms = elapsed * 1000
+        with self._stats_lock:
+            self._stats["checkouts"] += 1
+            self._stats["wait_total_ms"] += elapsed_ms
+            self._stats["wait_max_ms"] = max(self._stats["wait_max_ms"], elapsed_ms)
+            if timed_out:
+                self._stats["timeouts"] += 1
+
+    def wait_stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self._record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self._record_wait(time.perf_counter() - started)
+        return connection
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """Versao asyncio (async_database.py) com as mesmas estatisticas de espera."""
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args, pool_pre_ping=True)
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        options = {"connect_args": {"check_same_thread": False}}
+        if ":memory:" not in url:
+            options["poolclass"] = TimedQueuePool
+        return options
+
+    # Sem pre-ping por padrao: cada checkout pagaria um round-trip. Conexoes
+    # mortas sao evitadas com recycle abaixo do idle timeout do servidor/pooler,
+    # keepalive TCP e LIFO (as conexoes paradas no fundo da fila expiram sozinhas).
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": env_int("DB_POOL_SIZE", 10, minimum=1),
+        "max_overflow": env_int("DB_MAX_OVERFLOW", 20),
+        "pool_timeout": env_int("DB_POOL_TIMEOUT", 10, minimum=1),
+        "pool_recycle": env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING"),
+        "pool_use_lifo": True,
+    }
+    if url.startswith("postgresql"):
+        connect_args = {
+            "connect_timeout": env_int("DB_CONNECT_TIMEOUT", 10, minimum=1),
+            "keepalives": 1,
+            "keepalives_idle": env_int("DB_KEEPALIVES_IDLE", 30, minimum=1),
+            "keepalives_interval": 10,
+            "keepalives_count": 3,
+        }
+        # 0 desliga; o pooler do Supabase em modo transacao nao aceita "options".
+        statement_timeout = env_int("DB_STATEMENT_TIMEOUT_MS", 30000)
+        idle_in_tx_timeout = env_int("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", 60000)
+        server_options = []
+        if statement_timeout:
+            server_options.append(f"-c statement_timeout={statement_timeout}")
+        if idle_in_tx_timeout:
+            server_options.append(f"-c idle_in_transaction_session_timeout={idle_in_tx_timeout}")
+        if server_options:
+            connect_args["options"] = " ".join(server_options)
+        options["connect_args"] = connect_args
+    return options
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Replica opcional para leituras; sem DATABASE_REPLICA_URL tudo vai ao primario.
+raw_replica_url = os.getenv("DATABASE_REPLICA_URL", "").strip()
+DATABASE_REPLICA_URL = _normalize_database_url(raw_replica_url) if raw_replica_url else None
+replica_engine = (
+    create_engine(DATABASE_REPLICA_URL, **_engine_options(DATABASE_REPLICA_URL))
+    if DATABASE_REPLICA_URL
+    else None
+)
+ReplicaSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else None
+)
+
 Base = declarative_base()
+
+
+def get_pool_metrics(target=None) -> dict:
+    pool = (target if target is not None else engine).pool
+    metrics = {"pool_class": type(pool).__name__}
+    if isinstance(pool, TimedQueuePool):
+        stats = pool.wait_stats()
+        checkouts = stats["checkouts"]
+        metrics.update(
+            {
+                "checkouts": checkouts,
+                "timeouts": stats["timeouts"],
+                "wait_avg_ms": round(stats["wait_total_ms"] / checkouts, 3) if checkouts else 0.0,
+                "wait_max_ms": round(stats["wait_max_ms"], 3),
+                "max_overflow": pool.configured_max_overflow,
+            }
+        )
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            }
+        )
+    return metrics
+
+
+def get_pools_metrics() -> dict:
+    """Primario e replica (None sem DATABASE_REPLICA_URL), sync e async, cada um com o seu pool."""
+    import async_database
+
+    async_replica = async_database.async_replica_engine
+    return {
+        "primary": get_pool_metrics(engine),
+        "replica": get_pool_metrics(replica_engine) if replica_engine is not None else None,
+        "async_primary": get_pool_metrics(async_database.async_engine.sync_engine),
+        "async_replica": get_pool_metrics(async_replica.sync_engine) if async_replica is not None else None,
+    }
@@ -259,6 +259,28 @@ def _file_meta(filename: str) -> Dict[str, Any]:
     }
 
 
+def build_catalogs(
+    epis: list | None = None,
+    hazards: list | None = None,
+    activities: list | None = None,
+) -> Dict[str, Any]:
+    """Secao "catalogs" do contrato; o snapshot offline preenche os items."""
+    return {
+        "epis": {
+            "fields": EPI_FIELDS,
+            "items": epis or [],
+        },
+        "hazards": {
+            "fields": PERIGO_FIELDS,
+            "items": hazards or [],
+        },
+        "activities": {
+            "fields": ATIVIDADES_FIELDS,
+            "items": activities or [],
+        },
+    }
+
+
 def get_contract() -> Dict[str, Any]:
     return {
         "schema_version": SCHEMA_VERSION,
@@ -268,20 +290,7 @@ def get_contract() -> Dict[str, Any]:
             "name": APP_NAME,
             "contract_name": CONTRACT_NAME,
         },
-        "catalogs": {
-            "epis": {
-                "fields": EPI_FIELDS,
-                "items": [],
-            },
-            "hazards": {
-                "fields": PERIGO_FIELDS,
-                "items": [],
-            },
-            "activities": {
-                "fields": ATIVIDADES_FIELDS,
-                "items": [],
-            },
-        },
+        "catalogs": build_catalogs(),
         "mappings": {
             "activity_to_hazards": [],
             "hazard_to_epis": [],
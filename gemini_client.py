@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict
+
+import httpx
+
+from metrics import AI_CALLS
+
+logger = logging.getLogger(__name__)
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class GeminiConfigError(RuntimeError):
+    pass
+
+
+class GeminiHTTPError(RuntimeError):
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"Gemini HTTP {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+class GeminiConnectionError(RuntimeError):
+    pass
+
+
+def _env_int(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        value = int(os.getenv(name, str(default)))
+    except Exception:
+        value = default
+    return max(minimum, value)
+
+
+def _env_float(name: str, default: float, minimum: float = 0.0) -> float:
+    try:
+        value = float(os.getenv(name, str(default)))
+    except Exception:
+        value = default
+    return max(minimum, value)
+
+
+def _api_key() -> str:
+    api_key = (os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY") or "").strip()
+    if not api_key:
+        raise GeminiConfigError("GEMINI_API_KEY/GOOGLE_API_KEY nao configurada")
+    return api_key
+
+
+def gemini_model() -> str:
+    return os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+
+def _base_url() -> str:
+    return os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+
+
+def _headers() -> Dict[str, str]:
+    return {
+        "Content-Type": "application/json",
+        "x-goog-api-key": _api_key(),
+    }
+
+
+def _backoff_delay(attempt: int) -> float:
+    base = _env_float("GEMINI_BACKOFF_BASE", 0.5)
+    cap = _env_float("GEMINI_BACKOFF_MAX", 8.0)
+    # Full jitter: espalha os retries de varios workers no tempo.
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class GeminiClient:
+    """Cliente async da Gemini com pool de conexoes e limite de chamadas simultaneas.
+
+    O pool e o semaforo ficam presos ao event loop que os criou; se o loop mudar
+    (ex.: TestClient abrindo outro portal) ambos sao recriados.
+    """
+
+    def __init__(self) -> None:
+        self._http: httpx.AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_state(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop or self._http.is_closed:
+            limits = httpx.Limits(
+                max_connections=_env_int("GEMINI_POOL_SIZE", 10, minimum=1),
+                max_keepalive_connections=_env_int("GEMINI_POOL_KEEPALIVE", 5, minimum=1),
+                keepalive_expiry=_env_float("GEMINI_POOL_KEEPALIVE_EXPIRY", 60.0),
+            )
+            self._http = httpx.AsyncClient(limits=limits)
+            self._semaphore = asyncio.Semaphore(_env_int("GEMINI_MAX_CONCURRENCY", 8, minimum=1))
+            self._loop = loop
+        assert self._semaphore is not None
+        return self._http, self._semaphore
+
+    async def generate_content(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            result = await self._generate_content(payload)
+        except Exception:
+            AI_CALLS.labels("generate", "error").inc()
+            raise
+        AI_CALLS.labels("generate", "ok").inc()
+        return result
+
+    async def _generate_content(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"{_base_url()}/models/{gemini_model()}:generateContent"
+        headers = _headers()
+        data = json.dumps(payload).encode("utf-8")
+        timeout = httpx.Timeout(_env_float("GEMINI_TIMEOUT", 30.0, minimum=0.1))
+        attempts = _env_int("GEMINI_HTTP_ATTEMPTS", 3, minimum=1)
+
+        http, semaphore = self._ensure_state()
+        for attempt in range(1, attempts + 1):
+            try:
+                async with semaphore:
+                    response = await http.post(url, content=data, headers=headers, timeout=timeout)
+            except (httpx.TimeoutException, httpx.TransportError) as exc:
+                logger.warning("Gemini connection error (tentativa %s/%s): %s", attempt, attempts, exc)
+                if attempt >= attempts:
+                    raise GeminiConnectionError("Gemini connection error") from exc
+                await asyncio.sleep(_backoff_delay(attempt))
+                continue
+
+            if response.status_code >= 400:
+                body = response.text
+                if response.status_code in _RETRYABLE_STATUS and attempt < attempts:
+                    logger.warning(
+                        "Gemini HTTP %s (tentativa %s/%s)", response.status_code, attempt, attempts
+                    )
+                    await asyncio.sleep(_backoff_delay(attempt))
+                    continue
+                logger.error("Gemini HTTP %s: %s", response.status_code, body)
+                raise GeminiHTTPError(response.status_code, body)
+
+            return response.json()
+
+        raise GeminiConnectionError("Gemini connection error")
+
+    async def stream_generate_content(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        outcome = "error"
+        try:
+            async with aclosing(self._stream_generate_content(payload)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            AI_CALLS.labels("stream", outcome).inc()
+
+    async def _stream_generate_content(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Chama streamGenerateContent (SSE) e devolve cada chunk JSON assim que chega.
+
+        Retries so acontecem antes do primeiro chunk; depois disso o erro sobe
+        para quem esta consumindo o stream.
+        """
+        url = f"{_base_url()}/models/{gemini_model()}:streamGenerateContent"
+        headers = _headers()
+        data = json.dumps(payload).encode("utf-8")
+        timeout = httpx.Timeout(_env_float("GEMINI_TIMEOUT", 30.0, minimum=0.1))
+        attempts = _env_int("GEMINI_HTTP_ATTEMPTS", 3, minimum=1)
+
+        http, semaphore = self._ensure_state()
+        for attempt in range(1, attempts + 1):
+            emitted = False
+            status_error: GeminiHTTPError | None = None
+            try:
+                async with semaphore:
+                    async with http.stream(
+                        "POST",
+                        url,
+                        params={"alt": "sse"},
+                        content=data,
+                        headers=headers,
+                        timeout=timeout,
+                    ) as response:
+                        if response.status_code >= 400:
+                            body = (await response.aread()).decode("utf-8", errors="replace")
+                            status_error = GeminiHTTPError(response.status_code, body)
+                        else:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                chunk = line[5:].strip()
+                                if not chunk or chunk == "[DONE]":
+                                    continue
+                                emitted = True
+                                yield json.loads(chunk)
+            except (httpx.TimeoutException, httpx.TransportError) as exc:
+                logger.warning("Gemini stream error (tentativa %s/%s): %s", attempt, attempts, exc)
+                if emitted or attempt >= attempts:
+                    raise GeminiConnectionError("Gemini connection error") from exc
+                await asyncio.sleep(_backoff_delay(attempt))
+                continue
+
+            if status_error is None:
+                return
+            if status_error.status_code in _RETRYABLE_STATUS and attempt < attempts:
+                logger.warning(
+                    "Gemini HTTP %s (tentativa %s/%s)", status_error.status_code, attempt, attempts
+                )
+                await asyncio.sleep(_backoff_delay(attempt))
+                continue
+            logger.error("Gemini HTTP %s: %s", status_error.status_code, status_error.body)
+            raise status_error
+
+    async def aclose(self) -> None:
+        if self._http is not None and not self._http.is_closed:
+            try:
+                await self._http.aclose()
+            except RuntimeError:
+                # Loop original ja encerrado; as conexoes morrem junto com ele.
+                pass
+        self._http = None
+        self._semaphore = None
+        self._loop = None
+
+
+_CLIENT = GeminiClient()
+
+
+def get_gemini_client() -> GeminiClient:
+    return _CLIENT
+
+
+async def close_gemini_client() -> None:
+    await _CLIENT.aclose()
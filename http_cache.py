@@ -0,0 +1,144 @@
+"""GET condicional (ETag / If-None-Match) com validadores baratos.
+
+O ETag sai de marcadores que custam uma query pequena (ou nenhuma), nunca do
+corpo: APR = atualizado_em da APR + contagem/max(atualizado_em) de passos e
+risk_items; catalogos = contador em catalog_versions (cada linha alterada
+guarda a versao em row_version); atividades = mtime da planilha. Assim um 304 nao carrega passos nem serializa nada.
+"""
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from itertools import chain
+
+from fastapi import Response
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import APR, EPI, CatalogTombstone, CatalogVersion, Passo, Perigo, RiskItem
+
+CACHE_CONTROL = "private, no-cache"
+
+# Modelo -> nome do contador em catalog_versions.
+CATALOGS = {EPI: "epis", Perigo: "perigos"}
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:24]
+    # Fraco: o mesmo recurso sai com ou sem gzip (bytes diferentes).
+    return f'W/"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(candidate) == wanted for candidate in if_none_match.split(","))
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(request_headers, etag: str) -> Response | None:
+    """Resposta 304 quando o If-None-Match do cliente ainda vale; senao None."""
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    return None
+
+
+# -------- APR --------
+def _per_apr(column, apr_fk):
+    return select(column).where(apr_fk == APR.id).scalar_subquery()
+
+
+def apr_validator_stmt(apr_id: int):
+    """Uma linha com company_id (checagem de acesso) e os marcadores da APR."""
+    return select(
+        APR.id,
+        APR.company_id,
+        APR.atualizado_em,
+        _per_apr(func.count(Passo.id), Passo.apr_id).label("passos"),
+        _per_apr(func.max(Passo.atualizado_em), Passo.apr_id).label("passos_at"),
+        _per_apr(func.count(RiskItem.id), RiskItem.apr_id).label("risks"),
+        _per_apr(func.max(RiskItem.updated_at), RiskItem.apr_id).label("risks_at"),
+    ).where(APR.id == apr_id)
+
+
+def apr_etag(row) -> str:
+    return make_etag("apr", row.id, row.atualizado_em, row.passos, row.passos_at, row.risks, row.risks_at)
+
+
+# -------- catalogos --------
+def catalog_version_stmt(name: str):
+    return select(CatalogVersion.version).where(CatalogVersion.name == name)
+
+
+def catalog_etag(name: str, version: int | None) -> str:
+    return make_etag("catalog", name, version or 0)
+
+
+_VERSIONS_KEY = "apr_catalog_versions"
+
+
+def claim_catalog_versions(session: Session, names: set[str]) -> dict[str, int]:
+    """Sobe o contador uma vez por transacao e devolve a versao desta transacao.
+
+    O UPDATE trava a linha do contador ate o commit, entao transacoes
+    concorrentes recebem versoes em ordem e o delta nunca pula linhas.
+    INSERT em lote fora do ORM chama direto e carimba row_version nas linhas.
+    """
+    claimed = session.info.setdefault(_VERSIONS_KEY, {})
+    table = CatalogVersion.__table__
+    for name in sorted(names - claimed.keys()):
+        connection = session.connection()
+        result = connection.execute(
+            update(table).where(table.c.name == name).values(version=table.c.version + 1)
+        )
+        if not result.rowcount:
+            connection.execute(insert(table).values(name=name, version=1, updated_at=datetime.utcnow()))
+        claimed[name] = connection.execute(select(table.c.version).where(table.c.name == name)).scalar_one()
+    return claimed
+
+
+def catalog_changes_pending(session: Session) -> bool:
+    """True se a transacao da sessao ja alterou algum catalogo (versao ainda nao commitada)."""
+    return bool(session.info.get(_VERSIONS_KEY))
+
+
+def _stamp_catalog_rows(session: Session, flush_context, instances) -> None:
+    changed: list[tuple[str, object]] = []
+    removed: list[tuple[str, object]] = []
+    for obj in chain(session.new, session.dirty, session.deleted):
+        name = CATALOGS.get(type(obj))
+        if name is None:
+            continue
+        if obj in session.deleted:
+            removed.append((name, obj))
+        elif obj in session.new or session.is_modified(obj):
+            changed.append((name, obj))
+    if not changed and not removed:
+        return
+    versions = claim_catalog_versions(session, {name for name, _ in changed + removed})
+    for name, obj in changed:
+        obj.row_version = versions[name]
+    for name, obj in removed:
+        session.add(CatalogTombstone(catalog=name, item_id=obj.id, row_version=versions[name]))
+
+
+def _release_catalog_versions(session: Session) -> None:
+    session.info.pop(_VERSIONS_KEY, None)
+
+
+SESSION_LISTENERS = (
+    ("before_flush", _stamp_catalog_rows),
+    ("after_commit", _release_catalog_versions),
+    ("after_rollback", _release_catalog_versions),
+)
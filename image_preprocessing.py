@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import io
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+_STATS_LOCK = threading.Lock()
+_STATS: Dict[str, int] = {
+    "processed": 0,
+    "passthrough": 0,
+    "rejected": 0,
+    "resized": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+}
+
+_MIME_BY_FORMAT = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "heic": "image/heic",
+    "heif": "image/heif",
+}
+
+
+# Sem passthrough quando o original traz estes (EXIF com GPS, orientacao etc.).
+_METADATA_KEYS = ("exif", "icc_profile", "xmp", "XML:com.adobe.xmp")
+
+
+class ImageRejectedError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    data: bytes
+    mime: str
+    original_bytes: int
+    width: int | None = None
+    height: int | None = None
+    resized: bool = False
+
+    @property
+    def final_bytes(self) -> int:
+        return len(self.data)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.final_bytes
+
+
+def _env_int(name: str, default: int, minimum: int = 1) -> int:
+    try:
+        value = int(os.getenv(name, str(default)))
+    except Exception:
+        value = default
+    return max(minimum, value)
+
+
+def _max_dimension() -> int:
+    return _env_int("AI_IMAGE_MAX_DIMENSION", 1536, minimum=64)
+
+
+def _jpeg_quality() -> int:
+    return min(95, _env_int("AI_IMAGE_JPEG_QUALITY", 85, minimum=30))
+
+
+def detect_image_format(data: bytes) -> str | None:
+    head = data[:16]
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in {b"heic", b"heix", b"hevc", b"hevx"}:
+            return "heic"
+        if brand in {b"mif1", b"msf1", b"heif"}:
+            return "heif"
+    return None
+
+
+def _bump(**values: int) -> None:
+    with _STATS_LOCK:
+        for key, amount in values.items():
+            _STATS[key] = _STATS.get(key, 0) + amount
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    if image.mode in {"RGBA", "LA"}:
+        return True
+    return image.mode == "P" and "transparency" in image.info
+
+
+def prepare_image_for_ai(data: bytes) -> PreparedImage:
+    """Valida pelos magic bytes, corrige orientacao, reduz e recomprime a imagem.
+
+    A saida nunca carrega EXIF/ICC/XMP: a imagem e regravada so com os pixels.
+    HEIC/HEIF seguem como vieram porque o Pillow nao decodifica esses formatos,
+    e tambem o original sem metadados que nao foi reduzido e nao ficaria menor.
+    """
+    fmt = detect_image_format(data)
+    if fmt is None:
+        _bump(rejected=1)
+        raise ImageRejectedError("Arquivo deve ser uma imagem JPEG, PNG ou WEBP")
+
+    if fmt in {"heic", "heif"}:
+        _bump(passthrough=1, bytes_in=len(data), bytes_out=len(data))
+        return PreparedImage(data=data, mime=_MIME_BY_FORMAT[fmt], original_bytes=len(data))
+
+    max_dim = _max_dimension()
+    try:
+        image = Image.open(io.BytesIO(data))
+        source_size = image.size
+        if fmt == "jpeg":
+            # Decodifica o JPEG ja reduzido (escala DCT), bem mais barato que
+            # abrir a foto inteira para depois redimensionar.
+            image.draft("RGB", (max_dim, max_dim))
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as exc:
+        _bump(rejected=1)
+        raise ImageRejectedError("Arquivo de imagem invalido ou corrompido") from exc
+
+    has_metadata = any(key in image.info for key in _METADATA_KEYS)
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > max_dim:
+        image.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+    resized = sorted(image.size) != sorted(source_size)
+
+    out = io.BytesIO()
+    if _has_alpha(image):
+        image.convert("RGBA").save(out, format="PNG", optimize=True)
+        mime = "image/png"
+    else:
+        image.convert("RGB").save(out, format="JPEG", quality=_jpeg_quality(), optimize=True)
+        mime = "image/jpeg"
+
+    if not resized and not has_metadata and out.tell() >= len(data):
+        # Recomprimir so piorou (ex.: JPEG ja otimizado, PNG pequeno): segue o original.
+        _bump(passthrough=1, bytes_in=len(data), bytes_out=len(data))
+        return PreparedImage(
+            data=data,
+            mime=_MIME_BY_FORMAT[fmt],
+            original_bytes=len(data),
+            width=image.size[0],
+            height=image.size[1],
+        )
+
+    prepared = PreparedImage(
+        data=out.getvalue(),
+        mime=mime,
+        original_bytes=len(data),
+        width=image.size[0],
+        height=image.size[1],
+        resized=resized,
+    )
+    _bump(
+        processed=1,
+        resized=1 if resized else 0,
+        bytes_in=prepared.original_bytes,
+        bytes_out=prepared.final_bytes,
+    )
+    logger.info(
+        "Imagem preparada para IA: %s -> %s bytes (%sx%s)",
+        prepared.original_bytes,
+        prepared.final_bytes,
+        prepared.width,
+        prepared.height,
+    )
+    return prepared
+
+
+def get_image_stats() -> Dict[str, int]:
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    return stats
@@ -1,10 +1,23 @@
-﻿import pandas as pd
+﻿from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 from models import EPI, Perigo
 from excel_contract import SCHEMA_VERSION, validate_epis_df, validate_perigos_df
 from text_normalizer import normalize_text
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def _read_excel(caminho_excel: str) -> pd.DataFrame:
+    # pandas so e carregado quando uma importacao roda (cold start do worker).
+    import pandas as pd
+
+    return pd.read_excel(caminho_excel)
+
 
 def _norm_cols(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
@@ -13,7 +26,7 @@ def _norm_cols(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def importar_epis(db: Session, caminho_excel: str) -> dict:
-    df = pd.read_excel(caminho_excel)
+    df = _read_excel(caminho_excel)
     validate_epis_df(df)
     df = _norm_cols(df)
 
@@ -43,7 +56,7 @@ def importar_epis(db: Session, caminho_excel: str) -> dict:
 
 
 def importar_perigos(db: Session, caminho_excel: str) -> dict:
-    df = pd.read_excel(caminho_excel)
+    df = _read_excel(caminho_excel)
     validate_perigos_df(df)
     df = _norm_cols(df)
 
@@ -0,0 +1,46 @@
+"""Resposta JSON padrao da API: orjson + "application/json; charset=utf-8"."""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson e dependencia do requirements
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json; charset=utf-8"
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        # NON_STR_KEYS: dicts com chave int (ex.: contagens por id) como no json stdlib.
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class UTF8JSONResponse(JSONResponse):
+    media_type = JSON_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class JSONRoute(APIRoute):
+    """Rotas com response_model serializam direto em bytes (pydantic dump_json),
+    sem passar pela response_class; aqui so acertamos o content-type delas."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def app(request):
+            response = await handler(request)
+            if response.media_type == "application/json":
+                response.media_type = JSON_MEDIA_TYPE
+                response.headers["content-type"] = JSON_MEDIA_TYPE
+            return response
+
+        return app
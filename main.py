@@ -1,10 +1,10 @@
 import os
 import logging
+import threading
 import time
 from uuid import uuid4
 
 from fastapi import FastAPI, Request, Response
-from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
@@ -12,7 +12,8 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 from env_loader import load_environment
 load_environment()
 
-from database import Base, SessionLocal, engine
+from database import Base, SessionLocal, engine, env_flag
+from async_database import dispose_async_engines
 from sqlalchemy import select
 from excel_contract import get_contract_cached
 from importar_excel import importar_epis, importar_perigos
@@ -22,6 +23,9 @@ from routes.v1 import router as v1_router
 from routes.aprs import router as aprs_router
 from routes.apr_mvp import router as apr_mvp_router
 from routes.activities import router as activities_router
+from routes.catalogs import router as catalogs_router
+from routes.changes import router as changes_router
+from routes.templates import router as templates_router
 from routes.shares import router as shares_router
 from routes.legacy_apr import router as legacy_apr_router
 from routes.auth import router as auth_router
@@ -31,36 +35,23 @@ from routes.admin_ui import router as admin_ui_router
 from routes.account import router as account_router
 from routes.seller_activation import router as seller_activation_router
 from api_errors import ApiError
+from json_response import UTF8JSONResponse
+from compression import CompressionMiddleware
+from read_routing import credential_key, is_write_request, pin_to_primary
+from metrics import PrometheusMiddleware, metrics_token, render_metrics, route_template
+from profiling import ProfiledRoute, ProfilingMiddleware
+from auth import resolve_admin_from_headers
+import ai_quota
+import change_feed
+import query_stats
+from gemini_client import close_gemini_client
 from auth_utils import hash_password, generate_token
-from models import User, Company
-
-class JSONCharsetMiddleware:
-    def __init__(self, app):
-        self.app = app
-
-    async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
-            await self.app(scope, receive, send)
-            return
-
-        async def send_wrapper(message):
-            if message["type"] == "http.response.start":
-                headers = list(message.get("headers", []))
-                content_type = None
-                for key, value in headers:
-                    if key.lower() == b"content-type":
-                        content_type = value.decode("latin-1")
-                        break
-
-                if content_type is None or content_type.lower().startswith("application/json"):
-                    if content_type is None or "charset" not in content_type.lower():
-                        headers = [(k, v) for (k, v) in headers if k.lower() != b"content-type"]
-                        headers.append((b"content-type", b"application/json; charset=utf-8"))
-                        message["headers"] = headers
-            await send(message)
-
-        await self.app(scope, receive, send_wrapper)
+from models import EPI, Perigo, User, Company
+from apr_flow import list_activities
+from session_events import register_listeners
 
+# Antes de qualquer sessao: passo_items, change_log, auditoria e versoes de catalogo.
+register_listeners()
 
 class RequestLoggingMiddleware:
     def __init__(self, app):
@@ -75,31 +66,73 @@ class RequestLoggingMiddleware:
         method = scope.get("method", "-")
         path = scope.get("path", "-")
         status_code = 500
+        sent_bytes = 0
+        content_encoding = None
         started = time.perf_counter()
+        stats, stats_token = query_stats.start_request()
 
         async def send_wrapper(message):
-            nonlocal status_code
-            if message["type"] == "http.response.start":
+            nonlocal status_code, sent_bytes, content_encoding
+            if message["type"] == "http.response.body":
+                sent_bytes += len(message.get("body", b""))
+            elif message["type"] == "http.response.start":
                 status_code = int(message.get("status", 500))
                 headers = list(message.get("headers", []))
+                for key, value in headers:
+                    if key.lower() == b"content-encoding":
+                        content_encoding = value.decode("latin-1")
                 headers.append((b"x-request-id", request_id.encode("utf-8")))
+                # Streaming: so conta as queries feitas ate o inicio da resposta.
+                headers.append((b"server-timing", stats.server_timing().encode("latin-1")))
                 message["headers"] = headers
             await send(message)
 
         try:
             await self.app(scope, receive, send_wrapper)
         finally:
+            query_stats.finish_request(stats_token)
             latency_ms = (time.perf_counter() - started) * 1000
+            route = route_template(scope)
             logger.info(
-                "request method=%s path=%s status=%s latency_ms=%.2f request_id=%s",
+                "request method=%s path=%s route=%s status=%s latency_ms=%.2f queries=%s db_ms=%.2f "
+                "bytes=%s raw_bytes=%s encoding=%s request_id=%s",
                 method,
                 path,
+                route,
                 status_code,
                 latency_ms,
+                stats.count,
+                stats.duration_ms,
+                sent_bytes,
+                # CompressionMiddleware anota o tamanho original; sem compressao e o mesmo.
+                scope.get("apr.response_bytes", sent_bytes),
+                content_encoding or "identity",
                 request_id,
             )
+            query_stats.check_budget(stats, method=method, route=route)
+
+class ReadYourWritesMiddleware:
+    """Depois de uma escrita bem-sucedida, fixa as leituras do cliente no primario."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method", "GET") in {"GET", "HEAD", "OPTIONS"}:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                if is_write_request(scope["method"], int(message.get("status", 500))):
+                    pin_to_primary(credential_key(scope.get("headers", [])))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
 
-app = FastAPI(title="APR Backend")
+app = FastAPI(title="APR Backend", default_response_class=UTF8JSONResponse)
+# Rotas declaradas aqui tambem aceitam X-Profile (ver profiling.py).
+app.router.route_class = ProfiledRoute
 
 def _parse_csv_env(env_name: str) -> list[str]:
     raw = os.getenv(env_name, "")
@@ -123,7 +156,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.add_middleware(JSONCharsetMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(ProfilingMiddleware, resolve_admin=resolve_admin_from_headers)
+app.add_middleware(PrometheusMiddleware)
+# Logo abaixo do log: ele ve os bytes comprimidos e le o tamanho original do scope.
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(RequestLoggingMiddleware)
 
 logger = logging.getLogger(__name__)
@@ -131,7 +168,7 @@ APP_VERSION = os.getenv("APP_VERSION", "2026.02.20")
 
 @app.exception_handler(ApiError)
 async def api_error_handler(request: Request, exc: ApiError):
-    return JSONResponse(status_code=exc.status_code, content=exc.to_dict())
+    return UTF8JSONResponse(status_code=exc.status_code, content=exc.to_dict())
 
 
 @app.exception_handler(RequestValidationError)
@@ -146,7 +183,7 @@ async def validation_error_handler(request: Request, exc: RequestValidationError
         if parts:
             field = ".".join(parts)
         message = err.get("msg") or message
-    return JSONResponse(
+    return UTF8JSONResponse(
         status_code=422,
         content={"code": "validation_error", "message": message, "field": field},
     )
@@ -155,7 +192,7 @@ async def validation_error_handler(request: Request, exc: RequestValidationError
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     if isinstance(exc.detail, dict) and {"code", "message", "field"}.issubset(exc.detail.keys()):
-        return JSONResponse(status_code=exc.status_code, content=exc.detail)
+        return UTF8JSONResponse(status_code=exc.status_code, content=exc.detail)
 
     if exc.status_code == 404:
         code = "not_found"
@@ -166,7 +203,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     else:
         code = "http_error"
 
-    return JSONResponse(
+    return UTF8JSONResponse(
         status_code=exc.status_code,
         content={"code": code, "message": str(exc.detail), "field": None},
     )
@@ -175,7 +212,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
     logger.exception("Erro inesperado na API")
-    return JSONResponse(
+    return UTF8JSONResponse(
         status_code=500,
         content={"code": "server_error", "message": "Erro interno", "field": None},
     )
@@ -188,6 +225,9 @@ app.include_router(apr_mvp_router)
 app.include_router(seller_activation_router)
 app.include_router(account_router)
 app.include_router(activities_router)
+app.include_router(catalogs_router)
+app.include_router(changes_router)
+app.include_router(templates_router)
 app.include_router(shares_router)
 app.include_router(legacy_apr_router)
 app.include_router(auth_router)
@@ -195,13 +235,26 @@ app.include_router(companies_router)
 app.include_router(invites_router)
 app.include_router(admin_ui_router)
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request: Request):
+    token = metrics_token()
+    if token:
+        auth_header = request.headers.get("authorization", "")
+        if not auth_header:
+            raise ApiError(status_code=401, code="auth_required", message="Token nao informado", field="authorization")
+        if auth_header != f"Bearer {token}":
+            raise ApiError(status_code=403, code="forbidden", message="Token de metricas invalido", field="authorization")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/contract")
 def contract_legacy(request: Request):
     # Compat: endpoint legado sem prefixo /v1
     contract, headers, not_modified = get_contract_cached(request.headers)
     if not_modified:
         return Response(status_code=304, headers=headers)
-    return JSONResponse(content=contract, headers=headers)
+    return UTF8JSONResponse(content=contract, headers=headers)
 
 
 @app.get("/schema")
@@ -210,33 +263,41 @@ def schema_legacy(request: Request):
     contract, headers, not_modified = get_contract_cached(request.headers)
     if not_modified:
         return Response(status_code=304, headers=headers)
-    return JSONResponse(content=contract, headers=headers)
+    return UTF8JSONResponse(content=contract, headers=headers)
 
-@app.on_event("startup")
-def seed_from_xlsx() -> None:
+
+def _import_catalog(db, path: str, importer, label: str) -> None:
+    if not os.path.exists(path):
+        print(f"Seed skip: arquivo nao encontrado: {path}")
+        return
+    try:
+        importer(db, path)
+    except Exception:
+        logger.exception("Seed skip: falha ao importar %s do arquivo %s", label, path)
+
+
+def _seed_catalogs() -> list[tuple]:
     base_dir = os.path.dirname(__file__)
-    epi_path = os.path.join(base_dir, "epis_apr_modelo_validado.xlsx")
-    perigo_path = os.path.join(base_dir, "perigos_apr_modelo_validado.xlsx")
+    return [
+        (os.path.join(base_dir, "epis_apr_modelo_validado.xlsx"), importar_epis, "EPIs", EPI),
+        (os.path.join(base_dir, "perigos_apr_modelo_validado.xlsx"), importar_perigos, "Perigos", Perigo),
+    ]
 
+
+@app.on_event("startup")
+def seed_from_xlsx() -> None:
     db = SessionLocal()
+    pending = []
     try:
         Base.metadata.create_all(bind=engine)
 
-        if os.path.exists(epi_path):
-            try:
-                importar_epis(db, epi_path)
-            except Exception:
-                logger.exception("Seed skip: falha ao importar EPIs do arquivo %s", epi_path)
-        else:
-            print(f"Seed skip: arquivo nao encontrado: {epi_path}")
-
-        if os.path.exists(perigo_path):
-            try:
-                importar_perigos(db, perigo_path)
-            except Exception:
-                logger.exception("Seed skip: falha ao importar Perigos do arquivo %s", perigo_path)
-        else:
-            print(f"Seed skip: arquivo nao encontrado: {perigo_path}")
+        # Catalogo vazio precisa existir antes de servir. Ja populado, a
+        # sincronizacao com a planilha (pandas) vai para o warm-up em background.
+        for path, importer, label, model in _seed_catalogs():
+            if db.execute(select(model.id).limit(1)).first() is None:
+                _import_catalog(db, path, importer, label)
+            else:
+                pending.append((path, importer, label))
 
         admin_email = os.getenv("ADMIN_EMAIL")
         admin_password = os.getenv("ADMIN_PASSWORD")
@@ -266,6 +327,61 @@ def seed_from_xlsx() -> None:
                 print("Seed admin criado:", admin_email)
     finally:
         db.close()
+    app.state.pending_catalog_sync = pending
+
+
+def _warm_up(pending: list) -> None:
+    started = time.perf_counter()
+    for path, importer, label in pending:
+        db = SessionLocal()
+        try:
+            _import_catalog(db, path, importer, label)
+        finally:
+            db.close()
+    try:
+        list_activities()
+    except Exception:
+        logger.exception("Warm-up: falha ao carregar a planilha de atividades")
+    try:
+        import consolidation.pdf  # noqa: F401
+    except Exception:
+        logger.exception("Warm-up: falha ao carregar o gerador de PDF")
+    logger.info("warm-up concluido em %.0fms", (time.perf_counter() - started) * 1000)
+
+
+@app.on_event("startup")
+def start_warm_up() -> None:
+    # Depois do seed: o worker ja responde enquanto pandas/ReportLab carregam.
+    if not env_flag("APP_WARMUP", True):
+        return
+    pending = getattr(app.state, "pending_catalog_sync", [])
+    threading.Thread(target=_warm_up, args=(pending,), name="apr-warm-up", daemon=True).start()
+
+
+@app.on_event("startup")
+async def start_ai_usage_meter() -> None:
+    ai_quota.start_usage_flusher()
+
+
+@app.on_event("startup")
+async def start_change_log_pruner() -> None:
+    change_feed.start_pruner()
+
+
+@app.on_event("shutdown")
+async def close_ai_clients() -> None:
+    await ai_quota.stop_usage_flusher()
+    await close_gemini_client()
+
+
+@app.on_event("shutdown")
+async def stop_change_log_pruner() -> None:
+    await change_feed.stop_pruner()
+
+
+@app.on_event("shutdown")
+async def close_async_database() -> None:
+    await dispose_async_engines()
 
 
 @app.get("/")
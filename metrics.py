@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    PlatformCollector,
+    ProcessCollector,
+    generate_latest,
+)
+
+# Registro proprio: reimportar o modulo (testes, reload) nao duplica series.
+REGISTRY = CollectorRegistry()
+ProcessCollector(registry=REGISTRY)
+PlatformCollector(registry=REGISTRY)
+
+UNMATCHED_ROUTE = "unmatched"
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "Requests HTTP por rota (template), metodo e status",
+    ["method", "route", "status"],
+    registry=REGISTRY,
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latencia das requests HTTP por rota (template)",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    registry=REGISTRY,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests HTTP em andamento por rota (template)",
+    ["method", "route"],
+    registry=REGISTRY,
+)
+PDF_RENDERS = Counter(
+    "apr_pdf_renders_total",
+    "PDFs de APR gerados",
+    registry=REGISTRY,
+)
+AI_CALLS = Counter(
+    "ai_gemini_calls_total",
+    "Chamadas ao Gemini por modo e resultado",
+    ["mode", "outcome"],
+    registry=REGISTRY,
+)
+RISK_REBUILDS = Counter(
+    "apr_risk_rebuilds_total",
+    "Reconstrucoes de risk_items de uma APR",
+    registry=REGISTRY,
+)
+CACHE_EVENTS = Counter(
+    "cache_events_total",
+    "Consultas a caches da aplicacao por resultado",
+    ["cache", "result"],
+    registry=REGISTRY,
+)
+
+
+def _iter_route_patterns(routes):
+    for route in routes:
+        # Routers incluidos (FastAPI recente) expoem as rotas efetivas ja com prefixo.
+        contexts = getattr(route, "effective_route_contexts", None)
+        if callable(contexts):
+            for context in contexts():
+                yield context.path_regex, context.path_format, context.methods
+            continue
+        nested = getattr(route, "routes", None)
+        if nested and not hasattr(route, "path_regex"):
+            yield from _iter_route_patterns(nested)
+            continue
+        path_regex = getattr(route, "path_regex", None)
+        if path_regex is not None:
+            yield path_regex, getattr(route, "path_format", route.path), getattr(route, "methods", None)
+
+
+_ROUTE_TABLES: dict[tuple[int, int], list] = {}
+
+
+def _route_table(app) -> list:
+    routes = getattr(app, "routes", ())
+    key = (id(app), len(routes))
+    table = _ROUTE_TABLES.get(key)
+    if table is None:
+        table = list(_iter_route_patterns(routes))
+        _ROUTE_TABLES.clear()
+        _ROUTE_TABLES[key] = table
+    return table
+
+
+def route_template(scope) -> str:
+    """Template da rota ("/v1/aprs/{apr_id}/pdf"), nunca o path com ids.
+
+    Casa as rotas antes do roteamento para o gauge de em-andamento; o
+    resultado fica no scope para o log de request reaproveitar.
+    """
+    cached = scope.get("apr.route_template")
+    if cached:
+        return cached
+    template = UNMATCHED_ROUTE
+    path = scope.get("path", "")
+    method = scope.get("method")
+    for path_regex, path_format, methods in _route_table(scope.get("app")):
+        if not path_regex.match(path):
+            continue
+        if not methods or method in methods or (method == "HEAD" and "GET" in methods):
+            template = path_format
+            break
+        if template == UNMATCHED_ROUTE:
+            # Path casa mas o metodo nao (405): ainda agrupa pelo template.
+            template = path_format
+    scope["apr.route_template"] = template
+    return template
+
+
+class PrometheusMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "-")
+        route = route_template(scope)
+        status_code = 500
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = int(message.get("status", 500))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+
+
+def metrics_token() -> str | None:
+    return os.getenv("METRICS_TOKEN", "").strip() or None
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,7 +1,9 @@
 from datetime import datetime
 import json
 from uuid import uuid4
-from sqlalchemy import Column, Integer, String, Text, UniqueConstraint, ForeignKey, DateTime, Date, Boolean
+from sqlalchemy import Column, Integer, String, Text, UniqueConstraint, ForeignKey, DateTime, Date, Boolean, Index, JSON
+from sqlalchemy import true, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from database import Base
 from plan_utils import DEFAULT_PLAN, normalize_plan_name
@@ -13,6 +15,8 @@ class EPI(Base):
     epi = Column(String, nullable=False)
     descricao = Column(Text)
     normas = Column(Text)
+    # Versao do catalogo (catalog_versions) em que a linha mudou por ultimo; base do delta offline.
+    row_version = Column(Integer, nullable=False, default=0, server_default="0", index=True)
 
     __table_args__ = (UniqueConstraint("epi", name="uq_epi"),)
 
@@ -26,10 +30,35 @@ class Perigo(Base):
     salvaguardas = Column(Text)
     default_severity = Column(Integer, nullable=False, default=0)
     default_probability = Column(Integer, nullable=False, default=0)
+    row_version = Column(Integer, nullable=False, default=0, server_default="0", index=True)
 
     __table_args__ = (UniqueConstraint("perigo", name="uq_perigo"),)
 
 
+class CatalogVersion(Base):
+    """Contador por catalogo ("epis", "perigos"); sobe a cada flush que altera o catalogo."""
+
+    __tablename__ = "catalog_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CatalogTombstone(Base):
+    """Linha de catalogo removida, para o delta avisar os clientes offline."""
+
+    __tablename__ = "catalog_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    catalog = Column(String(50), nullable=False)
+    item_id = Column(Integer, nullable=False)
+    row_version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_catalog_tombstones_catalog_version", "catalog", "row_version"),)
+
+
 class Company(Base):
     __tablename__ = "companies"
 
@@ -41,9 +70,11 @@ class Company(Base):
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    users = relationship("User", back_populates="company", lazy="selectin")
-    aprs = relationship("APR", back_populates="company", lazy="selectin")
-    invites = relationship("Invite", back_populates="company", lazy="selectin")
+    # Colecoes sem limite: selectin aqui puxava todas as APRs (com passos e
+    # itens) a cada autenticacao. Carregam so quando acessadas.
+    users = relationship("User", back_populates="company", lazy="select")
+    aprs = relationship("APR", back_populates="company", lazy="select")
+    invites = relationship("Invite", back_populates="company", lazy="select")
 
     @property
     def plan(self) -> str:
@@ -67,21 +98,69 @@ class User(Base):
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     company = relationship("Company", back_populates="users")
-    aprs = relationship("APR", back_populates="user", lazy="selectin")
+    aprs = relationship("APR", back_populates="user", lazy="select")
     invites_sent = relationship(
         "Invite",
         back_populates="inviter",
         foreign_keys="Invite.invited_by",
-        lazy="selectin",
+        lazy="select",
     )
     invites_accepted = relationship(
         "Invite",
         back_populates="acceptor",
         foreign_keys="Invite.accepted_by",
-        lazy="selectin",
+        lazy="select",
     )
 
 
+# JSONB no Postgres (indexavel com GIN), JSON nos demais; o driver decodifica
+# uma vez na carga da linha.
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
+
+DANGEROUS_ENERGY_KEYS = (
+    "hydraulic",
+    "residual",
+    "kinetic",
+    "mechanical",
+    "electrical",
+    "gravitational_potential",
+    "thermal",
+    "pneumatic",
+)
+
+
+def _normalize_energies(data) -> dict:
+    if hasattr(data, "model_dump"):
+        data = data.model_dump()
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except Exception:
+            data = None
+    if not isinstance(data, dict):
+        data = {}
+    return {key: bool(data.get(key, False)) for key in DANGEROUS_ENERGY_KEYS}
+
+
+def _normalize_dict_list(data) -> list[dict]:
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except Exception:
+            return []
+    if not isinstance(data, list):
+        return []
+    return [item for item in data if isinstance(item, dict)]
+
+
+def dangerous_energy_checked(energy: str, dialect_name: str):
+    """Filtro "energia marcada" que o banco resolve sem decodificar no Python."""
+    if dialect_name == "postgresql":
+        # @> usa o indice GIN ix_aprs_dangerous_energies_checklist.
+        return type_coerce(APR.dangerous_energies_checklist_json, JSONB).contains({energy: True})
+    return APR.dangerous_energies_checklist_json[energy].as_boolean() == true()
+
+
 class APR(Base):
     __tablename__ = "aprs"
 
@@ -91,8 +170,8 @@ class APR(Base):
     titulo = Column(String(255), nullable=False)
     risco = Column(String(50), nullable=False)
     descricao = Column(Text, nullable=True)
-    hazards_json = Column("hazards", Text, nullable=False, default="[]")
-    controls_json = Column("controls", Text, nullable=False, default="[]")
+    hazards_json = Column("hazards", JSONDocument, nullable=False, default=list)
+    controls_json = Column("controls", JSONDocument, nullable=False, default=list)
     worksite = Column(String(255), nullable=True)
     sector = Column(String(255), nullable=True)
     responsible = Column(String(255), nullable=True)
@@ -101,7 +180,7 @@ class APR(Base):
     date = Column(Date, nullable=True)
     source_hashes = Column(Text, nullable=True)
     template_version = Column(String(20), nullable=True)
-    dangerous_energies_checklist_json = Column("dangerous_energies_checklist", Text, nullable=True)
+    dangerous_energies_checklist_json = Column("dangerous_energies_checklist", JSONDocument, nullable=True)
 
     company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
@@ -127,117 +206,67 @@ class APR(Base):
     )
     company = relationship("Company", back_populates="aprs")
     user = relationship("User", back_populates="aprs")
+    # Historico e compartilhamentos crescem sem limite; so carregam sob demanda.
     events = relationship(
         "APREvent",
         back_populates="apr",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        lazy="select",
         order_by="APREvent.criado_em",
     )
     shares = relationship(
         "APRShare",
         back_populates="apr",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        lazy="select",
         order_by="APRShare.criado_em",
     )
 
+    __table_args__ = (
+        Index(
+            "ix_aprs_dangerous_energies_checklist",
+            "dangerous_energies_checklist",
+            postgresql_using="gin",
+            postgresql_ops={"dangerous_energies_checklist": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
+    def _decoded(self, name: str, raw, normalize):
+        # Cache por instancia, valido enquanto o valor da coluna for o mesmo objeto:
+        # carga nova ou setter trocam o objeto e invalidam a entrada.
+        cache = self.__dict__.setdefault("_decoded_cache", {})
+        hit = cache.get(name)
+        if hit is not None and hit[0] is raw:
+            return hit[1]
+        value = normalize(raw)
+        cache[name] = (raw, value)
+        return value
+
     @property
     def dangerous_energies_checklist(self) -> dict:
-        defaults = {
-            "hydraulic": False,
-            "residual": False,
-            "kinetic": False,
-            "mechanical": False,
-            "electrical": False,
-            "gravitational_potential": False,
-            "thermal": False,
-            "pneumatic": False,
-        }
-        raw = self.dangerous_energies_checklist_json
-        if not raw:
-            return dict(defaults)
-        try:
-            data = json.loads(raw)
-        except Exception:
-            return dict(defaults)
-        if hasattr(data, "model_dump"):
-            data = data.model_dump()
-        if not isinstance(data, dict):
-            return dict(defaults)
-        normalized = dict(defaults)
-        for key in defaults:
-            normalized[key] = bool(data.get(key, False))
-        return normalized
+        return self._decoded(
+            "dangerous_energies_checklist", self.dangerous_energies_checklist_json, _normalize_energies
+        )
 
     @dangerous_energies_checklist.setter
     def dangerous_energies_checklist(self, value) -> None:
-        defaults = {
-            "hydraulic": False,
-            "residual": False,
-            "kinetic": False,
-            "mechanical": False,
-            "electrical": False,
-            "gravitational_potential": False,
-            "thermal": False,
-            "pneumatic": False,
-        }
-        data = value
-        if hasattr(value, "model_dump"):
-            data = value.model_dump()
-        if isinstance(data, str):
-            try:
-                data = json.loads(data)
-            except Exception:
-                data = None
-        if not isinstance(data, dict):
-            data = {}
-        normalized = dict(defaults)
-        for key in defaults:
-            normalized[key] = bool(data.get(key, False))
-        self.dangerous_energies_checklist_json = json.dumps(normalized, ensure_ascii=False)
+        self.dangerous_energies_checklist_json = _normalize_energies(value)
 
     @property
     def hazards(self) -> list[dict]:
-        raw = self.hazards_json
-        if not raw:
-            return []
-        try:
-            data = json.loads(raw)
-        except Exception:
-            return []
-        if not isinstance(data, list):
-            return []
-        return [item for item in data if isinstance(item, dict)]
+        return self._decoded("hazards", self.hazards_json, _normalize_dict_list)
 
     @hazards.setter
     def hazards(self, value) -> None:
-        if not isinstance(value, list):
-            self.hazards_json = "[]"
-            return
-        normalized = [item for item in value if isinstance(item, dict)]
-        self.hazards_json = json.dumps(normalized, ensure_ascii=False)
+        self.hazards_json = _normalize_dict_list(value) if isinstance(value, list) else []
 
     @property
     def controls(self) -> list[dict]:
-        raw = self.controls_json
-        if not raw:
-            return []
-        try:
-            data = json.loads(raw)
-        except Exception:
-            return []
-        if not isinstance(data, list):
-            return []
-        return [item for item in data if isinstance(item, dict)]
+        return self._decoded("controls", self.controls_json, _normalize_dict_list)
 
     @controls.setter
     def controls(self, value) -> None:
-        if not isinstance(value, list):
-            self.controls_json = "[]"
-            return
-        normalized = [item for item in value if isinstance(item, dict)]
-        self.controls_json = json.dumps(normalized, ensure_ascii=False)
+        self.controls_json = _normalize_dict_list(value) if isinstance(value, list) else []
 
 
 class Passo(Base):
@@ -258,7 +287,7 @@ class Passo(Base):
     normas = Column(Text, nullable=False, default="")
 
     evidence_type = Column(String(20), nullable=True)
-    evidence_filename = Column(String(255), nullable=True)
+    evidence_filename = Column(String(255), nullable=True, index=True)
     evidence_caption = Column(Text, nullable=True)
     evidence_uploaded_at = Column(DateTime, nullable=True)
 
@@ -273,8 +302,20 @@ class Passo(Base):
         lazy="selectin",
     )
 
+    # Derivados de perigos/riscos/medidas_controle/epis/normas por step_items.
+    items = relationship(
+        "PassoItem",
+        back_populates="passo",
+        cascade="all, delete-orphan",
+        lazy="selectin",
+        order_by="[PassoItem.kind, PassoItem.position]",
+    )
+
     __table_args__ = (UniqueConstraint("apr_id", "ordem", name="uq_passo_apr_ordem"),)
 
+    def item_labels(self, kind: str) -> list[str]:
+        return [item.label for item in self.items if item.kind == kind]
+
     @property
     def technical_evidence(self):
         if not self.evidence_filename:
@@ -287,6 +328,25 @@ class Passo(Base):
         }
 
 
+class PassoItem(Base):
+    __tablename__ = "passo_items"
+
+    id = Column(Integer, primary_key=True)
+    passo_id = Column(Integer, ForeignKey("passos.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(20), nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    label = Column(Text, nullable=False)
+    perigo_id = Column(Integer, ForeignKey("perigos.id", ondelete="SET NULL"), nullable=True, index=True)
+    epi_id = Column(Integer, ForeignKey("epis.id", ondelete="SET NULL"), nullable=True)
+
+    passo = relationship("Passo", back_populates="items")
+
+    __table_args__ = (
+        Index("ix_passo_items_passo_kind", "passo_id", "kind", "position"),
+        Index("ix_passo_items_kind_epi", "kind", "epi_id"),
+    )
+
+
 class RiskItem(Base):
     __tablename__ = "risk_items"
 
@@ -309,6 +369,45 @@ class RiskItem(Base):
     hazard = relationship("Perigo")
 
 
+class APRTemplate(Base):
+    """Modelo de APR da empresa, guardado ja compilado (ver apr_templates)."""
+
+    __tablename__ = "apr_templates"
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    name = Column(String(255), nullable=False)
+    description = Column(Text, nullable=True)
+    activity_id = Column(String(64), nullable=True)
+    activity_name = Column(String(255), nullable=True)
+    # Resumo para a listagem, que nao le o documento compilado.
+    step_count = Column(Integer, nullable=False, default=0)
+    risk_count = Column(Integer, nullable=False, default=0)
+    compiled = Column(JSONDocument, nullable=False)
+
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (UniqueConstraint("company_id", "name", name="uq_apr_template_company_name"),)
+
+
+class ChangeLogEntry(Base):
+    """Sequencia monotonica de escritas em APR/Passo/RiskItem, lida pelo feed de sincronizacao."""
+
+    __tablename__ = "change_log"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    apr_id = Column(Integer, nullable=True)
+    op = Column(String(10), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_change_log_company_seq", "company_id", "seq"),)
+
+
 class APREvent(Base):
     __tablename__ = "apr_events"
 
@@ -321,6 +420,8 @@ class APREvent(Base):
 
     apr = relationship("APR", back_populates="events")
 
+    __table_args__ = (Index("ix_apr_events_apr_id_criado_em", "apr_id", "criado_em"),)
+
 
 class APRShare(Base):
     __tablename__ = "apr_shares"
@@ -357,3 +458,30 @@ class Invite(Base):
     company = relationship("Company", back_populates="invites")
     inviter = relationship("User", foreign_keys=[invited_by], back_populates="invites_sent")
     acceptor = relationship("User", foreign_keys=[accepted_by], back_populates="invites_accepted")
+
+
+class AICacheEntry(Base):
+    __tablename__ = "ai_cache_entries"
+
+    id = Column(Integer, primary_key=True)
+    cache_key = Column(String(64), nullable=False, unique=True, index=True)
+    kind = Column(String(20), nullable=False)
+    model = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_hit_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class AIUsage(Base):
+    __tablename__ = "ai_usage"
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
+    period = Column(String(7), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (UniqueConstraint("company_id", "period", name="uq_ai_usage_company_period"),)
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import cProfile
+import functools
+import inspect
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import uuid4
+
+from starlette.concurrency import run_in_threadpool
+
+from json_response import JSONRoute
+from metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+_PROFILE_ID_CHARS = set("0123456789abcdef-T")
+
+
+def _env_int(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        return max(minimum, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def profile_dir() -> Path:
+    return Path(os.getenv("PROFILE_DIR", "profiles"))
+
+
+def profile_keep() -> int:
+    return _env_int("PROFILE_KEEP", 20, minimum=1)
+
+
+def profile_rate_limit() -> int:
+    """Perfis por minuto no processo (0 desliga o modo de profiling)."""
+    return _env_int("PROFILE_RATE_LIMIT_PER_MINUTE", 6)
+
+
+class ProfileSession:
+    """Junta os perfis de cada thread do threadpool que atendeu a request."""
+
+    def __init__(self) -> None:
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{uuid4().hex[:8]}"
+        self.stats: pstats.Stats | None = None
+        self.handler_ms = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args, **kwargs):
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.handler_ms += elapsed
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+
+
+_active: ContextVar[ProfileSession | None] = ContextVar("apr_profile_session", default=None)
+
+
+def profiled(fn):
+    """Envolve um handler sync: roda sob cProfile quando a request pediu perfil.
+
+    O cProfile so enxerga a thread onde foi ligado; por isso o perfil e ligado
+    dentro da thread do threadpool, nao no middleware (event loop).
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        session = _active.get()
+        if session is None:
+            return fn(*args, **kwargs)
+        return session.run(fn, *args, **kwargs)
+
+    return wrapper
+
+
+class ProfiledRoute(JSONRoute):
+    """route_class dos routers: handlers sync passam a aceitar profiling."""
+
+    def __init__(self, path: str, endpoint, **kwargs) -> None:
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+class _RateLimiter:
+    def __init__(self) -> None:
+        self._hits: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def allow(self, limit: int, window: float = 60.0) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._hits and now - self._hits[0] > window:
+                self._hits.popleft()
+            if len(self._hits) >= limit:
+                return False
+            self._hits.append(now)
+            return True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hits.clear()
+
+
+rate_limiter = _RateLimiter()
+
+
+def _summary(stats: pstats.Stats, limit: int = 30) -> str:
+    buffer = io.StringIO()
+    stats.stream = buffer
+    stats.sort_stats("cumulative").print_stats(limit)
+    return buffer.getvalue()
+
+
+def save_profile(session: ProfileSession, meta: dict) -> dict:
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    meta = dict(meta, id=session.id, handler_ms=round(session.handler_ms, 3))
+    if session.stats is not None:
+        session.stats.dump_stats(str(directory / f"{session.id}.pstats"))
+        meta["summary"] = _summary(session.stats)
+    else:
+        # Handler async: roda no event loop, fora do alcance do cProfile por thread.
+        meta["summary"] = None
+    (directory / f"{session.id}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    _trim(directory, profile_keep())
+    return meta
+
+
+def _trim(directory: Path, keep: int) -> None:
+    # Buffer circular: o id comeca pelo horario, entao a ordem do nome e a cronologica.
+    metas = sorted(directory.glob("*.json"))
+    for old in metas[:-keep] if len(metas) > keep else []:
+        for path in (old, old.with_suffix(".pstats")):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _valid_id(profile_id: str) -> bool:
+    return bool(profile_id) and set(profile_id) <= _PROFILE_ID_CHARS
+
+
+def list_profiles() -> list[dict]:
+    items = []
+    for path in sorted(profile_dir().glob("*.json"), reverse=True):
+        try:
+            meta = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        meta.pop("summary", None)
+        items.append(meta)
+    return items
+
+
+def load_profile(profile_id: str) -> dict | None:
+    if not _valid_id(profile_id):
+        return None
+    path = profile_dir() / f"{profile_id}.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def profile_stats_path(profile_id: str) -> Path | None:
+    if not _valid_id(profile_id):
+        return None
+    path = profile_dir() / f"{profile_id}.pstats"
+    return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """Com "X-Profile: 1" de um admin, perfila a request e grava o resultado.
+
+    A resposta leva X-Profile-Id (ou X-Profile-Status quando nao perfilou).
+    """
+
+    def __init__(self, app, resolve_admin):
+        self.app = app
+        # (headers) -> User | None, sync: roda no threadpool so quando pedido.
+        self.resolve_admin = resolve_admin
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        flag = _header(scope, PROFILE_HEADER)
+        if not flag or flag.strip().lower() in {"0", "false", "no"}:
+            await self.app(scope, receive, send)
+            return
+
+        admin = await run_in_threadpool(self.resolve_admin, scope.get("headers") or [])
+        if admin is None:
+            await self.app(scope, receive, send)
+            return
+        limit = profile_rate_limit()
+        if not limit or not rate_limiter.allow(limit):
+            status = b"rate_limited" if limit else b"disabled"
+            await self.app(scope, receive, _with_header(send, b"x-profile-status", status))
+            return
+
+        session = ProfileSession()
+        token = _active.set(session)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = int(message.get("status", 500))
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", session.id.encode("ascii")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active.reset(token)
+            meta = {
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "route": route_template(scope),
+                "status": status_code,
+                "wall_ms": round((time.perf_counter() - started) * 1000, 3),
+                "user_id": getattr(admin, "id", None),
+            }
+            try:
+                await run_in_threadpool(save_profile, session, meta)
+            except Exception:
+                logger.exception("Falha ao gravar perfil %s", session.id)
+
+
+def _header(scope, name: str) -> str | None:
+    key = name.encode("latin-1")
+    for header, value in scope.get("headers") or []:
+        if header.lower() == key:
+            return value.decode("latin-1")
+    return None
+
+
+def _with_header(send, name: bytes, value: bytes):
+    async def send_wrapper(message):
+        if message["type"] == "http.response.start":
+            message["headers"] = list(message.get("headers", [])) + [(name, value)]
+        await send(message)
+
+    return send_wrapper
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Mesmo SQL repetido N vezes numa request e o sinal classico de N+1.
+N_PLUS_ONE_THRESHOLD = 5
+
+
+class QueryStats:
+    """Contagem de statements e tempo de banco de uma request."""
+
+    __slots__ = ("count", "duration_ms", "statements", "_lock")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration_ms = 0.0
+        self.statements: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, statement: str, elapsed_ms: float) -> None:
+        # Rotas sync rodam no threadpool; o objeto e compartilhado com a request.
+        with self._lock:
+            self.count += 1
+            self.duration_ms += elapsed_ms
+            self.statements[statement] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+        # Insercoes repetidas vem do flush da unit of work; N+1 e leitura.
+        with self._lock:
+            return [
+                (sql, n)
+                for sql, n in self.statements.most_common()
+                if n >= threshold and sql.lstrip()[:6].upper() == "SELECT"
+            ]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration_ms:.2f};desc="{self.count} queries"'
+
+
+# Ultimas requests acima do orcamento; a suite de testes falha se houver alguma.
+BUDGET_VIOLATIONS: deque[dict] = deque(maxlen=100)
+
+_current: ContextVar[QueryStats | None] = ContextVar("apr_query_stats", default=None)
+
+
+def start_request():
+    stats = QueryStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(token) -> None:
+    _current.reset(token)
+
+
+def current_stats() -> QueryStats | None:
+    return _current.get()
+
+
+def query_budget() -> int:
+    try:
+        return max(0, int(os.getenv("SQL_QUERY_BUDGET", "0")))
+    except ValueError:
+        return 0
+
+
+def check_budget(stats: QueryStats, *, method: str, route: str) -> bool:
+    """Loga requests acima do orcamento (SQL_QUERY_BUDGET, 0 desliga)."""
+    budget = query_budget()
+    repeated = stats.repeated()
+    if repeated:
+        sql, times = repeated[0]
+        logger.warning(
+            "possivel N+1 method=%s route=%s repeticoes=%s sql=%s",
+            method,
+            route,
+            times,
+            " ".join(sql.split())[:200],
+        )
+    if budget and stats.count > budget:
+        BUDGET_VIOLATIONS.append(
+            {"method": method, "route": route, "queries": stats.count, "budget": budget}
+        )
+        logger.warning(
+            "orcamento de queries excedido method=%s route=%s queries=%s budget=%s",
+            method,
+            route,
+            stats.count,
+            budget,
+        )
+        return True
+    return False
+
+
+# Escuta a classe Engine: cobre primario, replica e o sync_engine dos engines
+# asyncio (o SQLAlchemy propaga o contexto para o greenlet do driver).
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("apr_query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("apr_query_started")
+    if not started:
+        return
+    stats.add(statement, (time.perf_counter() - started.pop()) * 1000)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("apr_query_started"):
+        connection.info["apr_query_started"].pop()
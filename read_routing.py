@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from typing import AsyncIterator, Iterable, Iterator
+
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+import async_database
+import database
+
+_PIN_LOCK = threading.Lock()
+# credencial (hash) -> instante ate quando as leituras ficam no primario
+_PINNED_UNTIL: dict[str, float] = {}
+_SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def _pin_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("DB_REPLICA_PIN_SECONDS", "5")))
+    except Exception:
+        return 5.0
+
+
+def credential_key(headers: Iterable[tuple[bytes, bytes]]) -> str | None:
+    """Chave do cliente a partir do token enviado (sem resolver o usuario)."""
+    for name, value in headers:
+        if name.lower() in {b"authorization", b"x-api-token"} and value.strip():
+            return hashlib.sha256(value.strip()).hexdigest()
+    return None
+
+
+def pin_to_primary(key: str | None) -> None:
+    seconds = _pin_seconds()
+    if not key or not seconds:
+        return
+    now = time.monotonic()
+    with _PIN_LOCK:
+        _PINNED_UNTIL[key] = now + seconds
+        if len(_PINNED_UNTIL) > 10000:
+            for stale in [k for k, until in _PINNED_UNTIL.items() if until <= now]:
+                _PINNED_UNTIL.pop(stale, None)
+
+
+def is_pinned(key: str | None) -> bool:
+    if not key:
+        return False
+    with _PIN_LOCK:
+        until = _PINNED_UNTIL.get(key)
+    return until is not None and until > time.monotonic()
+
+
+def is_write_request(method: str, status_code: int) -> bool:
+    return method.upper() not in _SAFE_METHODS and status_code < 400
+
+
+def _use_primary(request: Request) -> bool:
+    if request.headers.get("x-read-consistency", "").strip().lower() == "strong":
+        return True
+    return is_pinned(credential_key(request.headers.raw))
+
+
+def read_session_factory(request: Request) -> sessionmaker:
+    """Replica so quando configurada e o cliente nao escreveu ha pouco.
+
+    O pin e por processo; com varias instancias o cliente pode pedir leitura
+    consistente explicitamente com o header X-Read-Consistency: strong.
+    """
+    if database.ReplicaSessionLocal is None or _use_primary(request):
+        return database.SessionLocal
+    return database.ReplicaSessionLocal
+
+
+def async_read_session_factory(request: Request) -> async_sessionmaker:
+    if async_database.AsyncReplicaSessionLocal is None or _use_primary(request):
+        return async_database.AsyncSessionLocal
+    return async_database.AsyncReplicaSessionLocal
+
+
+def get_read_db(request: Request) -> Iterator[Session]:
+    db = read_session_factory(request)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(
+    request: Request,
+    primary: AsyncSession = Depends(async_database.get_async_db),
+) -> AsyncIterator[AsyncSession]:
+    # No primario reaproveita a sessao da request (a mesma da autenticacao):
+    # duas conexoes por request esgotam o pool sob carga e travam ate o timeout.
+    factory = async_read_session_factory(request)
+    if factory is async_database.AsyncSessionLocal:
+        yield primary
+        return
+    async with factory() as db:
+        yield db
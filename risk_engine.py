@@ -1,39 +1,15 @@
 from __future__ import annotations
 
 from datetime import datetime
-import re
 from typing import Iterable
 
 from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
 
-from entity_normalizer import (
-    load_hazard_lookup,
-    normalize_hazard_list,
-    normalized_key as _norm_key,
-)
 from excel_contract import RISK_MATRIX
+from metrics import RISK_REBUILDS
 from models import Passo, Perigo, RiskItem
-from text_normalizer import normalize_text, normalize_list
-
-_LIST_RE = re.compile(r";")
-
-
-def _split_list(value, *, origin: str, field: str) -> list[str]:
-    if value is None:
-        return []
-    if isinstance(value, list):
-        return [v for v in normalize_list(value, origin=origin, field=field) if v]
-    text = normalize_text(value, keep_newlines=False, origin=origin, field=field) or ""
-    if not text:
-        return []
-    parts = _LIST_RE.split(text)
-    return [
-        normalize_text(p, keep_newlines=False, origin=origin, field=field) or ""
-        for p in parts
-        if str(p).strip()
-    ]
-
+import step_items
 
 
 def _safe_int(value) -> int:
@@ -99,87 +75,104 @@ def has_invalid_risk_items(items: Iterable[RiskItem]) -> bool:
     return any(not is_risk_item_valid(item) for item in items)
 
 
-def _resolve_hazard_id(
-    risk_description: str,
-    hazards: list[str],
-    hazard_lookup: dict[str, Perigo],
-) -> int | None:
-    if not hazards:
-        return None
-
-    known = []
-    for hazard in hazards:
-        key = _norm_key(hazard)
-        if not key:
-            continue
-        perigo = hazard_lookup.get(key)
-        if perigo:
-            known.append((hazard, perigo))
-
+def _resolve_hazard_id(risk_description: str, known: list[tuple[str, int]]) -> int | None:
+    """known: (nome, perigo_id) dos perigos do passo ja ligados ao catalogo."""
     if not known:
         return None
     if len(known) == 1:
-        return known[0][1].id
+        return known[0][1]
 
     risk_lower = (risk_description or "").lower()
-    matches = [p.id for name, p in known if name and name.lower() in risk_lower]
+    matches = [perigo_id for name, perigo_id in known if name and name.lower() in risk_lower]
     if len(matches) == 1:
         return matches[0]
     return None
 
 
+def load_hazards(db: Session, hazard_ids) -> dict[int, Perigo]:
+    ids = {hazard_id for hazard_id in hazard_ids if hazard_id}
+    if not ids:
+        return {}
+    return {h.id: h for h in db.execute(select(Perigo).where(Perigo.id.in_(ids))).scalars()}
+
+
+def build_risk_rows(items, hazard_by_id: dict[int, Perigo]) -> list[dict]:
+    """Riscos de um passo a partir dos seus itens (PassoItem ou equivalente), na ordem dos itens."""
+    # Sem repetir perigo: dois itens podem ter sido ligados ao mesmo cadastro.
+    known = list(
+        dict.fromkeys((item.label, item.perigo_id) for item in items if item.kind == "hazard" and item.perigo_id)
+    )
+    rows = []
+    for item in items:
+        if item.kind != "risk":
+            continue
+        hazard_id = _resolve_hazard_id(item.label, known)
+        hazard = hazard_by_id.get(hazard_id) if hazard_id else None
+        raw_probability = getattr(hazard, "default_probability", None) if hazard else None
+        raw_severity = getattr(hazard, "default_severity", None) if hazard else None
+        probability = _safe_int(raw_probability)
+        severity = _safe_int(raw_severity)
+        score, level = compute_risk_score(probability, severity)
+        rows.append(
+            {
+                "hazard_id": hazard_id,
+                "risk_description": item.label,
+                "probability": probability,
+                "severity": severity,
+                "score": score,
+                "risk_level": level,
+            }
+        )
+    return rows
+
+
+_RISK_FIELDS = ("hazard_id", "risk_description", "probability", "severity", "score", "risk_level")
+
+
 def rebuild_risk_items_for_apr(db: Session, apr_id: int) -> dict[str, int]:
     passos = (
         db.execute(select(Passo).where(Passo.apr_id == apr_id).order_by(Passo.ordem))
         .scalars()
         .all()
     )
-    hazards, hazard_lookup = load_hazard_lookup(db)
-    hazard_by_id = {h.id: h for h in hazards}
-
-    db.execute(delete(RiskItem).where(RiskItem.apr_id == apr_id))
-
-    created = 0
-    invalid = 0
+    # passo_items ja traz o perigo resolvido no catalogo (os sem vinculo sao
+    # conferidos de novo); so os perigos usados pela APR sao carregados para
+    # pegar probabilidade/severidade padrao.
+    step_items.link_catalog(db, [item for passo in passos for item in passo.items])
+    hazard_by_id = load_hazards(
+        db, (item.perigo_id for passo in passos for item in passo.items if item.kind == "hazard")
+    )
 
-    for passo in passos:
-        risks = _split_list(passo.riscos, origin="user", field="riscos")
-        raw_hazards = _split_list(passo.perigos, origin="user", field="perigos")
-        hazards_list = normalize_hazard_list(
-            raw_hazards, lookup=hazard_lookup, origin="user", field="perigos"
-        )
+    rows = [(passo, row) for passo in passos for row in build_risk_rows(passo.items, hazard_by_id)]
+    created = len(rows)
+    invalid = sum(row["risk_level"] == "invalid" for _, row in rows)
+
+    # Riscos iguais aos gravados (ex.: so a descricao do passo mudou): nada a
+    # reescrever, e o change_log nao recebe um delete + upsert por risco.
+    current = db.execute(
+        select(RiskItem.step_id, *[getattr(RiskItem, name) for name in _RISK_FIELDS])
+        .where(RiskItem.apr_id == apr_id)
+        .order_by(RiskItem.id)
+    ).all()
+    if [tuple(item) for item in current] == [
+        (passo.id, *[row[name] for name in _RISK_FIELDS]) for passo, row in rows
+    ]:
+        return {"created": created, "invalid": invalid}
 
-        for risk_description in risks:
-            if not risk_description:
-                continue
-
-            hazard_id = _resolve_hazard_id(risk_description, hazards_list, hazard_lookup)
-            hazard = hazard_by_id.get(hazard_id) if hazard_id else None
-            raw_probability = getattr(hazard, "default_probability", None) if hazard else None
-            raw_severity = getattr(hazard, "default_severity", None) if hazard else None
-            probability = _safe_int(raw_probability)
-            severity = _safe_int(raw_severity)
-            score, level = compute_risk_score(probability, severity)
-            if level == "invalid":
-                invalid += 1
-
-            db.add(
-                RiskItem(
-                    apr_id=apr_id,
-                    company_id=passo.company_id,
-                    step_id=passo.id,
-                    hazard_id=hazard_id,
-                    risk_description=risk_description,
-                    probability=probability,
-                    severity=severity,
-                    score=score,
-                    risk_level=level,
-                    updated_at=datetime.utcnow(),
-                )
+    db.execute(delete(RiskItem).where(RiskItem.apr_id == apr_id))
+    for passo, row in rows:
+        db.add(
+            RiskItem(
+                apr_id=apr_id,
+                company_id=passo.company_id,
+                step_id=passo.id,
+                updated_at=datetime.utcnow(),
+                **row,
             )
-            created += 1
+        )
 
     db.flush()
+    RISK_REBUILDS.inc()
     return {"created": created, "invalid": invalid}
 
 
@@ -6,12 +6,15 @@ from fastapi import APIRouter, Depends
 from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 
+from ai_quota import current_period, get_usage
 from auth import get_current_user, get_db
-from models import APR, Company, User
+from read_routing import get_read_db
+from models import APR, Company, Passo, PassoItem, User
 from plan_utils import get_plan_tier, normalize_plan_name
 import schemas
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/v1/account", tags=["Account"])
+router = APIRouter(prefix="/v1/account", tags=["Account"], route_class=ProfiledRoute)
 
 
 def _count_active_aprs(db: Session, company_id: int | None) -> int:
@@ -38,6 +41,7 @@ def obter_plano(
     plan_tier = get_plan_tier(plan_name)
     company_id = company.id if company else current_user.company_id
     active_aprs = _count_active_aprs(db, company_id)
+    period = current_period()
 
     return {
         "name": plan_name,
@@ -46,13 +50,16 @@ def obter_plano(
         "usage": {
             "active_aprs": active_aprs,
             "active_aprs_limit": plan_tier.limits.max_active_aprs,
+            "ai_generations": get_usage(db, company_id, period),
+            "ai_generations_limit": plan_tier.limits.ai_generations_per_month,
+            "ai_period": period,
         },
     }
 
 
 @router.get("/metrics", response_model=schemas.AccountMetrics)
 def obter_metricas(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     company = db.get(Company, current_user.company_id) if current_user.company_id else None
@@ -99,3 +106,32 @@ def obter_metricas(
         "aprs_active": aprs_active,
         "aprs_created_30d": aprs_created_30d,
     }
+
+
+@router.get("/analytics/epis", response_model=list[schemas.StepItemUsage])
+def epis_mais_usados(
+    limit: int = 10,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    if not current_user.company_id:
+        return []
+    limit = min(max(limit, 1), 100)
+    steps = func.count(PassoItem.id)
+    stmt = (
+        select(
+            PassoItem.label,
+            PassoItem.epi_id,
+            func.count(func.distinct(Passo.apr_id)).label("aprs"),
+            steps.label("steps"),
+        )
+        .join(Passo, Passo.id == PassoItem.passo_id)
+        .where(PassoItem.kind == "epi", Passo.company_id == current_user.company_id)
+        .group_by(PassoItem.epi_id, PassoItem.label)
+        .order_by(steps.desc(), PassoItem.label)
+        .limit(limit)
+    )
+    return [
+        {"label": row.label, "catalog_id": row.epi_id, "aprs": row.aprs, "steps": row.steps}
+        for row in db.execute(stmt).all()
+    ]
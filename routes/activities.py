@@ -1,15 +1,23 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 
+import http_cache
 import schemas
-from apr_flow import list_activities, get_activity_suggestions
+from apr_flow import activities_version, list_activities, get_activity_suggestions
 from auth import get_current_user
+from profiling import ProfiledRoute
 
 
-router = APIRouter(prefix="/v1/activities", tags=["Activities"])
+router = APIRouter(prefix="/v1/activities", tags=["Activities"], route_class=ProfiledRoute)
 
 
 @router.get("", response_model=list[schemas.ActivityOut])
-def listar_atividades(_user=Depends(get_current_user)):
+def listar_atividades(request: Request, response: Response, _user=Depends(get_current_user)):
+    # A lista so muda com a planilha: o ETag nao precisa abrir o arquivo.
+    etag = http_cache.make_etag("activities", activities_version())
+    cached = http_cache.not_modified(request.headers, etag)
+    if cached is not None:
+        return cached
+    response.headers.update(http_cache.cache_headers(etag))
     try:
         return list_activities()
     except ValueError as exc:
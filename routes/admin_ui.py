@@ -8,8 +8,9 @@ from api_errors import ApiError
 from database import SessionLocal
 from models import User
 from rbac import is_admin
+from profiling import ProfiledRoute
 
-router = APIRouter(tags=["Admin UI"])
+router = APIRouter(tags=["Admin UI"], route_class=ProfiledRoute)
 
 _TEMPLATE_PATH = Path(__file__).resolve().parent.parent / "templates" / "perigos_defaults.html"
 
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import json
 from datetime import datetime
 from typing import Any
 
@@ -10,13 +9,15 @@ from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from api_errors import ApiError
+from audit import record_event
 from auth import get_current_user, get_db
-from models import APR, APREvent, User
+from models import APR, User
 from rbac import can_write, normalize_role
 from status_utils import normalize_status
 from text_normalizer import normalize_text
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/aprs", tags=["APR MVP"])
+router = APIRouter(prefix="/aprs", tags=["APR MVP"], route_class=ProfiledRoute)
 
 _STORAGE_STATUS = {
     "draft": "rascunho",
@@ -107,21 +108,7 @@ def _ensure_write_access(user: User) -> None:
 
 
 def _add_event(db: Session, apr: APR, event: str, payload: dict[str, Any], actor: User) -> None:
-    with_actor = dict(payload)
-    with_actor["actor"] = {
-        "id": actor.id,
-        "email": actor.email,
-        "name": actor.name,
-        "role": normalize_role(actor.role),
-    }
-    db.add(
-        APREvent(
-            apr_id=apr.id,
-            company_id=apr.company_id,
-            event=event,
-            payload=json.dumps(with_actor, ensure_ascii=False),
-        )
-    )
+    record_event(db, apr.id, apr.company_id, event, payload, actor=actor)
 
 
 def _get_apr_or_404(apr_id: str, db: Session) -> APR:
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, lazyload
 from sqlalchemy import select, func, delete
+from contextlib import aclosing
 from datetime import datetime
 from uuid import uuid4
+import base64
 import json
 import logging
 import mimetypes
@@ -13,26 +17,48 @@ from pathlib import Path
 import shutil
 
 from database import SessionLocal
-from models import APR, Passo, APREvent, APRShare, User, RiskItem, Company
+from models import (
+    APR,
+    APREvent,
+    APRShare,
+    APRTemplate,
+    Company,
+    DANGEROUS_ENERGY_KEYS,
+    Passo,
+    RiskItem,
+    User,
+    dangerous_energy_checked,
+)
 import schemas
 from apr_flow import get_activity_suggestions
 from apr_documents import write_apr_pdf, validate_apr_for_pdf, PDF_TEMPLATE_VERSION
 from excel_contract import get_excel_hashes
+from image_preprocessing import ImageRejectedError, PreparedImage, prepare_image_for_ai
 from ai_suggestions import (
     generate_ai_steps_from_image,
+    stream_ai_steps_from_image,
     AIConfigError,
     AIResponseError,
     AITextInvalidEncodingError,
 )
-from api_errors import ApiError, missing_fields_error
+from ai_quota import AIQuotaExceededError, PendingAIQuota, flush_usage, needs_flush
+from api_errors import ApiError, ai_quota_error, missing_fields_error, plan_feature_error
 from text_normalizer import normalize_text, normalize_list
-from auth import get_current_user
-from plan_utils import get_plan_tier, normalize_plan_name
+from async_database import get_async_db
+from auth import get_current_user, get_current_user_async
+from plan_utils import PlanTier, get_plan_tier, normalize_plan_name
 from risk_engine import compute_risk_score, rebuild_risk_items_for_apr, list_risk_items_for_apr
 from status_utils import normalize_status
+from unit_of_work import async_unit_of_work, unit_of_work
+from read_routing import get_async_read_db, get_read_db, read_session_factory
+from audit import record_event
+from apr_duplication import duplicate_apr
+from apr_templates import apply_template
+import http_cache
 from rbac import can_write, normalize_role
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/v1/aprs", tags=["APR"])
+router = APIRouter(prefix="/v1/aprs", tags=["APR"], route_class=ProfiledRoute)
 logger = logging.getLogger(__name__)
 _EVIDENCE_DIR = Path("uploads") / "step_evidence"
 _STATUS_RASCUNHO = "rascunho"
@@ -54,6 +80,7 @@ class AIStepImage(BaseModel):
 
 class AIStepsImageResponse(BaseModel):
     steps: list[AIStepImage]
+    cached: bool = False
 
 
 class APRStatusUpdateRequest(BaseModel):
@@ -77,33 +104,17 @@ def _join_list(value, *, origin: str, field: str) -> str:
     return normalize_text(value, keep_newlines=False, origin=origin, field=field) or ""
 
 
-def _actor_payload(user: User | None) -> dict | None:
-    if not user:
-        return None
-    return {
-        "id": user.id,
-        "email": user.email,
-        "name": user.name,
-        "role": normalize_role(user.role),
-    }
-
-
 def _add_event(
-    db: Session,
+    db: Session | AsyncSession,
     apr_id: int,
     event: str,
     payload: dict | None,
     *,
     actor: User | None = None,
 ) -> None:
-    data_payload = payload.copy() if payload else {}
-    actor_data = _actor_payload(actor)
-    if actor_data:
-        data_payload["actor"] = actor_data
-    data = json.dumps(data_payload, ensure_ascii=False) if data_payload else None
-    apr = db.get(APR, apr_id)
-    company_id = apr.company_id if apr else None
-    db.add(APREvent(apr_id=apr_id, company_id=company_id, event=event, payload=data))
+    # _ensure_apr_access ja garantiu que a APR e da empresa do usuario.
+    company_id = actor.company_id if actor else None
+    record_event(db, apr_id, company_id, event, payload, actor=actor)
 
 
 def _is_missing(value: object) -> bool:
@@ -213,6 +224,31 @@ def _count_active_aprs(db: Session, company_id: int | None) -> int:
     return db.execute(stmt).scalar_one()
 
 
+def _company_plan(db: Session, user: User) -> tuple[str, PlanTier]:
+    company = db.get(Company, user.company_id) if user.company_id else None
+    plan_name = normalize_plan_name(company.plan_name if company else None)
+    return plan_name, get_plan_tier(plan_name)
+
+
+def _ensure_active_apr_slot(db: Session, user: User, plan_name: str, plan_tier: PlanTier) -> None:
+    max_active_aprs = plan_tier.limits.max_active_aprs
+    if max_active_aprs is not None and user.company_id:
+        active_count = _count_active_aprs(db, user.company_id)
+        if active_count >= max_active_aprs:
+            raise ApiError(
+                status_code=403,
+                code="plan_limit_reached",
+                message=f"Plano {plan_name.capitalize()} permite no maximo {max_active_aprs} APRs ativas. Atualize para o Plano Pro para criar novas APRs.",
+                field="plan",
+            )
+
+
+def _evidence_shared(db: Session, filename: str, passo_id: int) -> bool:
+    # APRs duplicadas com evidencia apontam para o mesmo arquivo.
+    stmt = select(Passo.id).where(Passo.evidence_filename == filename, Passo.id != passo_id).limit(1)
+    return db.execute(stmt).first() is not None
+
+
 def _normalize_status_label(value: str) -> tuple[str, str]:
     normalized = normalize_status(value)
     if normalized == "draft":
@@ -258,20 +294,8 @@ def criar_apr(
     _validate_required_apr_fields(payload)
     if not current_user.company_id:
         raise ApiError(status_code=403, code="forbidden", message="Usuario sem empresa vinculada", field="company_id")
-    company = db.get(Company, current_user.company_id) if current_user.company_id else None
-    plan_name = normalize_plan_name(company.plan_name if company else None)
-    plan_tier = get_plan_tier(plan_name)
-    max_active_aprs = plan_tier.limits.max_active_aprs
-    company_id_for_limit = company.id if company else current_user.company_id
-    if max_active_aprs is not None and company_id_for_limit:
-        active_count = _count_active_aprs(db, company_id_for_limit)
-        if active_count >= max_active_aprs:
-            raise ApiError(
-                status_code=403,
-                code="plan_limit_reached",
-                message=f"Plano {plan_name.capitalize()} permite no maximo {max_active_aprs} APRs ativas. Atualize para o Plano Pro para criar novas APRs.",
-                field="plan",
-            )
+    plan_name, plan_tier = _company_plan(db, current_user)
+    _ensure_active_apr_slot(db, current_user, plan_name, plan_tier)
     titulo = payload.activity_name or payload.titulo or "APR"
     risco = payload.risco or "indefinido"
     apr = APR(
@@ -290,52 +314,65 @@ def criar_apr(
     )
     if payload.dangerous_energies_checklist is not None:
         apr.dangerous_energies_checklist = payload.dangerous_energies_checklist
-    db.add(apr)
-    db.commit()
-    db.refresh(apr)
-    _add_event(
-        db,
-        apr.id,
-        "created",
-        {
-            "worksite": apr.worksite,
-            "sector": apr.sector,
-            "responsible": apr.responsible,
-            "date": apr.date.isoformat() if apr.date else None,
-            "activity_id": apr.activity_id,
-            "activity_name": apr.activity_name,
-        },
-        actor=current_user,
-    )
-    db.commit()
+    with unit_of_work(db):
+        db.add(apr)
+        db.flush()
+        _add_event(
+            db,
+            apr.id,
+            "created",
+            {
+                "worksite": apr.worksite,
+                "sector": apr.sector,
+                "responsible": apr.responsible,
+                "date": apr.date.isoformat() if apr.date else None,
+                "activity_id": apr.activity_id,
+                "activity_name": apr.activity_name,
+            },
+            actor=current_user,
+        )
     return apr
 
 
 @router.get("", response_model=schemas.PaginatedOut[schemas.APROut])
-def listar_aprs(
+async def listar_aprs(
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    energy: str | None = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     limit = min(max(limit, 1), 200)
     base = _scope_apr_query(select(APR), current_user)
-    total = db.execute(select(func.count()).select_from(base.subquery())).scalar_one()
-    items = db.execute(base.offset(skip).limit(limit)).scalars().all()
+    if energy:
+        if energy not in DANGEROUS_ENERGY_KEYS:
+            raise ApiError(status_code=400, code="validation_error", message="Energia invalida", field="energy")
+        base = base.where(dangerous_energy_checked(energy, db.get_bind().dialect.name))
+    total = (await db.execute(select(func.count()).select_from(base.subquery()))).scalar_one()
+    items = (await db.execute(base.offset(skip).limit(limit))).scalars().all()
     return {"items": items, "total": total, "skip": skip, "limit": limit}
 
 
 @router.get("/{apr_id}", response_model=schemas.APRDetail)
-def obter_apr(
+async def obter_apr(
     apr_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user_async),
 ):
-    apr = db.get(APR, apr_id)
-    if not apr:
+    # Validador antes de tudo: com If-None-Match valido responde 304 sem
+    # carregar passos/riscos nem serializar.
+    marker = (await db.execute(http_cache.apr_validator_stmt(apr_id))).one_or_none()
+    if marker is None:
         raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="apr_id")
-    _ensure_apr_access(apr, current_user)
-    return apr
+    _ensure_apr_access(marker, current_user)
+    etag = http_cache.apr_etag(marker)
+    cached = http_cache.not_modified(request.headers, etag)
+    if cached is not None:
+        return cached
+    response.headers.update(http_cache.cache_headers(etag))
+    return await db.get(APR, apr_id)
 
 
 @router.get("/{apr_id}/suggestions", response_model=schemas.ActivitySuggestions)
@@ -360,25 +397,28 @@ def sugerir_para_apr(
     return data
 
 
-@router.post("/{apr_id}/ai-steps", response_model=AIStepsImageResponse)
-def gerar_passos_por_imagem(
-    apr_id: int,
-    file: UploadFile | None = File(default=None),
-    descricao: str | None = Form(default=None),
-    max_steps: int = Form(default=6),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    _ensure_write_access(current_user)
+def _load_apr_for_ai(db: Session, apr_id: int, user: User) -> APR:
+    _ensure_write_access(user)
     apr = db.get(APR, apr_id)
     if not apr:
         raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="apr_id")
-    _ensure_apr_access(apr, current_user)
+    _ensure_apr_access(apr, user)
+    return apr
+
+
+def _record_ai_event(db: Session, apr_id: int, event: str, payload: dict, user: User) -> None:
+    _add_event(db, apr_id, event, payload, actor=user)
+    db.commit()
 
+
+async def _read_ai_step_input(
+    file: UploadFile | None,
+    descricao: str | None,
+    max_steps: int,
+) -> tuple[str | None, PreparedImage | None]:
     descricao = normalize_text(descricao, keep_newlines=True, origin="user", field="descricao")
 
-    image_bytes: bytes | None = None
-    image_mime: str | None = None
+    prepared: PreparedImage | None = None
     if file is not None:
         content_type = file.content_type or ""
         filename = os.path.basename(file.filename or "")
@@ -392,10 +432,10 @@ def gerar_passos_por_imagem(
                 field="file",
             )
         try:
-            image_bytes = file.file.read()
+            image_bytes = await file.read()
         finally:
             try:
-                file.file.close()
+                await file.close()
             except Exception:
                 pass
 
@@ -407,13 +447,12 @@ def gerar_passos_por_imagem(
                 field="file",
             )
 
-        if content_type.startswith("image/"):
-            image_mime = content_type
-        else:
-            guessed = mimetypes.guess_type(filename)[0]
-            image_mime = guessed or "image/jpeg"
+        try:
+            prepared = await run_in_threadpool(prepare_image_for_ai, image_bytes)
+        except ImageRejectedError as exc:
+            raise ApiError(status_code=400, code="invalid_file", message=str(exc), field="file")
 
-    if image_bytes is None and _is_missing(descricao):
+    if prepared is None and _is_missing(descricao):
         raise ApiError(
             status_code=400,
             code="missing_field",
@@ -429,13 +468,49 @@ def gerar_passos_por_imagem(
             field="max_steps",
         )
 
+    return descricao, prepared
+
+
+def _ai_image_event_payload(prepared: PreparedImage | None, count: int, cached: bool) -> dict:
+    return {
+        "count": count,
+        "has_image": prepared is not None,
+        "cached": cached,
+        "image_bytes": prepared.final_bytes if prepared else None,
+        "bytes_saved": prepared.bytes_saved if prepared else None,
+    }
+
+
+@router.post("/{apr_id}/ai-steps", response_model=AIStepsImageResponse)
+async def gerar_passos_por_imagem(
+    apr_id: int,
+    file: UploadFile | None = File(default=None),
+    descricao: str | None = Form(default=None),
+    max_steps: int = Form(default=6),
+    use_cache: bool = Form(default=True),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    # Handler async: a chamada a Gemini nao prende um worker do threadpool;
+    # o acesso ao banco (sincrono) continua indo para o threadpool.
+    await run_in_threadpool(_load_apr_for_ai, db, apr_id, current_user)
+
+    descricao, prepared = await _read_ai_step_input(file, descricao, max_steps)
+
+    # Cota reservada so sem cache (on_cache_miss): resposta em cache passa mesmo no limite.
+    quota = PendingAIQuota(db, current_user.company_id)
+    result = None
     try:
-        result = generate_ai_steps_from_image(
-            image_bytes=image_bytes,
-            image_mime=image_mime,
+        result = await generate_ai_steps_from_image(
+            image_bytes=prepared.data if prepared else None,
+            image_mime=prepared.mime if prepared else None,
             descricao=descricao,
             max_steps=max_steps,
+            use_cache=use_cache,
+            on_cache_miss=quota,
         )
+    except AIQuotaExceededError as exc:
+        raise ai_quota_error(str(exc))
     except AIConfigError as exc:
         raise ApiError(status_code=503, code="ai_not_configured", message=str(exc), field=None)
     except AITextInvalidEncodingError as exc:
@@ -456,19 +531,124 @@ def gerar_passos_por_imagem(
             message="Falha ao gerar passos com IA",
             field=None,
         )
+    finally:
+        # Resposta vinda do cache nao consome cota.
+        quota.finish(consumed=bool(result) and not result.get("cached"))
 
-    _add_event(
+    await run_in_threadpool(
+        _record_ai_event,
         db,
         apr_id,
         "ai_steps_image",
-        {"count": len(result.get("steps") or []), "has_image": bool(image_bytes)},
-        actor=current_user,
+        _ai_image_event_payload(prepared, len(result.get("steps") or []), bool(result.get("cached"))),
+        current_user,
     )
-    db.commit()
+    if needs_flush():
+        await run_in_threadpool(flush_usage)
 
     return result
 
 
+def _record_ai_stream_event(apr_id: int, payload: dict, user: User) -> None:
+    # O stream termina depois que a sessao da requisicao ja foi liberada.
+    db = SessionLocal()
+    try:
+        _record_ai_event(db, apr_id, "ai_steps_image", payload, user)
+    finally:
+        db.close()
+
+
+def _ndjson_line(event: dict) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@router.post("/{apr_id}/ai-steps/stream")
+async def gerar_passos_por_imagem_stream(
+    apr_id: int,
+    file: UploadFile | None = File(default=None),
+    descricao: str | None = Form(default=None),
+    max_steps: int = Form(default=6),
+    use_cache: bool = Form(default=True),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Mesma geracao de /ai-steps, mas devolve NDJSON: uma linha por passo validado."""
+    await run_in_threadpool(_load_apr_for_ai, db, apr_id, current_user)
+    descricao, prepared = await _read_ai_step_input(file, descricao, max_steps)
+    quota = PendingAIQuota(db, current_user.company_id)
+
+    async def events():
+        count = 0
+        cached = False
+        error: tuple[str, str] | None = None
+        try:
+            async with aclosing(
+                stream_ai_steps_from_image(
+                    image_bytes=prepared.data if prepared else None,
+                    image_mime=prepared.mime if prepared else None,
+                    descricao=descricao,
+                    max_steps=max_steps,
+                    use_cache=use_cache,
+                    on_cache_miss=quota,
+                )
+            ) as stream:
+                async for event in stream:
+                    if event["type"] == "step":
+                        count += 1
+                    elif event["type"] == "done":
+                        cached = bool(event.get("cached"))
+                    yield _ndjson_line(event)
+        except AIQuotaExceededError:
+            raise  # antes da primeira linha: vira 429 (ver abaixo)
+        except AIConfigError as exc:
+            error = ("ai_not_configured", str(exc))
+        except AITextInvalidEncodingError as exc:
+            error = ("AI_TEXT_INVALID_ENCODING", str(exc))
+        except AIResponseError as exc:
+            logger.warning("IA falhou para APR %s: %s", apr_id, exc)
+            error = ("ai_error", str(exc))
+        except Exception:
+            logger.exception("Erro inesperado ao gerar passos com IA")
+            error = ("ai_error", "Falha ao gerar passos com IA")
+        finally:
+            quota.finish(consumed=count > 0 and not cached)
+
+        if error is not None:
+            yield _ndjson_line({"type": "error", "code": error[0], "message": error[1], "count": count})
+        if count:
+            await run_in_threadpool(
+                _record_ai_stream_event,
+                apr_id,
+                {**_ai_image_event_payload(prepared, count, cached), "stream": True},
+                current_user,
+            )
+        if needs_flush():
+            await run_in_threadpool(flush_usage)
+
+    # Primeira linha antes de abrir a resposta: sem cache a cota e reservada
+    # antes da Gemini, e estourar o limite ainda sai como 429 (nao como linha de erro).
+    body = events()
+    try:
+        first = await anext(body)
+    except AIQuotaExceededError as exc:
+        raise ai_quota_error(str(exc))
+    except StopAsyncIteration:
+        first = None
+
+    async def lines():
+        async with aclosing(body):
+            if first is not None:
+                yield first
+            async for line in body:
+                yield line
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.patch("/{apr_id}", response_model=schemas.APROut)
 def atualizar_apr(
     apr_id: int,
@@ -512,9 +692,8 @@ def atualizar_apr(
         updates["activity_name"] = apr.activity_name
 
     if updates:
-        _add_event(db, apr.id, "updated", updates, actor=current_user)
-        db.commit()
-        db.refresh(apr)
+        with unit_of_work(db):
+            _add_event(db, apr.id, "updated", updates, actor=current_user)
     return apr
 
 
@@ -538,21 +717,19 @@ def atualizar_status_apr(
         return apr
 
     _validate_status_transition(current_normalized, next_normalized)
-    apr.status = next_label
-    db.commit()
-    db.refresh(apr)
-    _add_event(
-        db,
-        apr.id,
-        "status_changed",
-        {
-            "from": current_normalized,
-            "to": next_normalized,
-            "reason": payload.reason,
-        },
-        actor=current_user,
-    )
-    db.commit()
+    with unit_of_work(db):
+        apr.status = next_label
+        _add_event(
+            db,
+            apr.id,
+            "status_changed",
+            {
+                "from": current_normalized,
+                "to": next_normalized,
+                "reason": payload.reason,
+            },
+            actor=current_user,
+        )
     return apr
 
 
@@ -569,35 +746,74 @@ def excluir_apr(
     _ensure_apr_access(apr, current_user)
     current_normalized, _ = _normalize_status_label(apr.status or _STATUS_RASCUNHO)
     _validate_status_transition(current_normalized, "archived")
-    apr.status = _STATUS_ARQUIVADO
-    db.commit()
-    _add_event(
-        db,
-        apr.id,
-        "deleted",
-        {"mode": "soft_delete", "status": "archived"},
-        actor=current_user,
-    )
-    db.commit()
+    with unit_of_work(db):
+        apr.status = _STATUS_ARQUIVADO
+        _add_event(
+            db,
+            apr.id,
+            "deleted",
+            {"mode": "soft_delete", "status": "archived"},
+            actor=current_user,
+        )
     return {"status": "ok", "apr_id": apr.id, "archived": True}
 
 
-@router.post("/{apr_id}/passos", response_model=schemas.PassoOut)
-def adicionar_passo(
+@router.post("/{apr_id}/duplicate", response_model=schemas.APRDetail)
+def duplicar_apr(
     apr_id: int,
-    payload: schemas.PassoCreate,
+    payload: schemas.APRDuplicate | None = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     _ensure_write_access(current_user)
-    apr = db.get(APR, apr_id)
+    # Passos e riscos da origem nao sao carregados: a copia e feita no banco.
+    source = db.get(APR, apr_id, options=[lazyload("*")])
+    if not source:
+        raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="apr_id")
+    _ensure_apr_access(source, current_user)
+    plan_name, plan_tier = _company_plan(db, current_user)
+    if not plan_tier.features.duplicate_apr:
+        raise plan_feature_error(
+            f"Plano {plan_name.capitalize()} nao permite duplicar APRs. Atualize para o Plano Pro."
+        )
+    _ensure_active_apr_slot(db, current_user, plan_name, plan_tier)
+    include_evidence = bool(payload and payload.include_evidence)
+
+    with unit_of_work(db):
+        apr = duplicate_apr(
+            db,
+            source,
+            company_id=current_user.company_id,
+            user_id=current_user.id,
+            include_evidence=include_evidence,
+        )
+        _add_event(
+            db,
+            apr.id,
+            "duplicated",
+            {"source_apr_id": source.id, "include_evidence": include_evidence},
+            actor=current_user,
+        )
+        db.refresh(apr, attribute_names=["passos", "risk_items"])
+    return apr
+
+
+@router.post("/{apr_id}/passos", response_model=schemas.PassoOut)
+async def adicionar_passo(
+    apr_id: int,
+    payload: schemas.PassoCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    _ensure_write_access(current_user)
+    apr = await db.get(APR, apr_id)
     if not apr:
         raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="apr_id")
     _ensure_apr_access(apr, current_user)
     _ensure_editable(apr)
 
-    existe = db.execute(
-        select(Passo).where(Passo.apr_id == apr_id, Passo.ordem == payload.ordem)
+    existe = (
+        await db.execute(select(Passo.id).where(Passo.apr_id == apr_id, Passo.ordem == payload.ordem))
     ).scalar_one_or_none()
     if existe:
         raise ApiError(
@@ -618,44 +834,45 @@ def adicionar_passo(
         epis=payload.epis,
         normas=payload.normas,
     )
-    db.add(passo)
-    db.commit()
-    db.refresh(passo)
-    rebuild_risk_items_for_apr(db, apr_id)
-    _add_event(
-        db,
-        apr_id,
-        "step_added",
-        {"ordem": passo.ordem, "descricao": passo.descricao},
-        actor=current_user,
-    )
-    db.commit()
+    async with async_unit_of_work(db):
+        db.add(passo)
+        await db.flush()
+        await db.run_sync(rebuild_risk_items_for_apr, apr_id)
+        _add_event(
+            db,
+            apr_id,
+            "step_added",
+            {"ordem": passo.ordem, "descricao": passo.descricao},
+            actor=current_user,
+        )
     return passo
 
 
 @router.patch("/{apr_id}/passos/{passo_id}", response_model=schemas.PassoOut)
-def atualizar_passo(
+async def atualizar_passo(
     apr_id: int,
     passo_id: int,
     payload: schemas.PassoUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     _ensure_write_access(current_user)
-    passo = db.get(Passo, passo_id)
+    passo = await db.get(Passo, passo_id)
     if not passo or passo.apr_id != apr_id:
         raise ApiError(status_code=404, code="not_found", message="Passo nao encontrado", field="passo_id")
-    apr = db.get(APR, apr_id)
+    apr = await db.get(APR, apr_id)
     if apr:
         _ensure_apr_access(apr, current_user)
         _ensure_editable(apr)
 
     if payload.ordem is not None:
-        existe = db.execute(
-            select(Passo).where(
-                Passo.apr_id == apr_id,
-                Passo.ordem == payload.ordem,
-                Passo.id != passo_id,
+        existe = (
+            await db.execute(
+                select(Passo.id).where(
+                    Passo.apr_id == apr_id,
+                    Passo.ordem == payload.ordem,
+                    Passo.id != passo_id,
+                )
             )
         ).scalar_one_or_none()
         if existe:
@@ -680,34 +897,33 @@ def atualizar_passo(
     if payload.normas is not None:
         passo.normas = payload.normas
 
-    db.commit()
-    db.refresh(passo)
-    rebuild_risk_items_for_apr(db, apr_id)
-    _add_event(db, apr_id, "step_updated", {"passo_id": passo_id}, actor=current_user)
-    db.commit()
+    async with async_unit_of_work(db):
+        await db.flush()
+        await db.run_sync(rebuild_risk_items_for_apr, apr_id)
+        _add_event(db, apr_id, "step_updated", {"passo_id": passo_id}, actor=current_user)
     return passo
 
 
 @router.delete("/{apr_id}/passos/{passo_id}")
-def remover_passo(
+async def remover_passo(
     apr_id: int,
     passo_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     _ensure_write_access(current_user)
-    passo = db.get(Passo, passo_id)
+    passo = await db.get(Passo, passo_id)
     if not passo or passo.apr_id != apr_id:
         raise ApiError(status_code=404, code="not_found", message="Passo nao encontrado", field="passo_id")
-    apr = db.get(APR, apr_id)
+    apr = await db.get(APR, apr_id)
     if apr:
         _ensure_apr_access(apr, current_user)
         _ensure_editable(apr)
-    db.delete(passo)
-    db.commit()
-    rebuild_risk_items_for_apr(db, apr_id)
-    _add_event(db, apr_id, "step_removed", {"passo_id": passo_id}, actor=current_user)
-    db.commit()
+    async with async_unit_of_work(db):
+        await db.delete(passo)
+        await db.flush()
+        await db.run_sync(rebuild_risk_items_for_apr, apr_id)
+        _add_event(db, apr_id, "step_removed", {"passo_id": passo_id}, actor=current_user)
     return {"status": "ok"}
 
 
@@ -756,7 +972,7 @@ def adicionar_evidencia(
         except Exception:
             pass
 
-    if passo.evidence_filename:
+    if passo.evidence_filename and not _evidence_shared(db, passo.evidence_filename, passo_id):
         old_path = evidence_dir / passo.evidence_filename
         try:
             if old_path.exists():
@@ -764,20 +980,18 @@ def adicionar_evidencia(
         except Exception:
             logger.warning("Falha ao remover evidencia antiga do passo %s", passo_id)
 
-    passo.evidence_type = "image"
-    passo.evidence_filename = new_filename
-    passo.evidence_caption = normalize_text(caption, keep_newlines=True, origin="user", field="caption")
-    passo.evidence_uploaded_at = datetime.utcnow()
-
-    _add_event(
-        db,
-        apr_id,
-        "evidence_uploaded",
-        {"passo_id": passo_id, "filename": new_filename},
-        actor=current_user,
-    )
-    db.commit()
-    db.refresh(passo)
+    with unit_of_work(db):
+        passo.evidence_type = "image"
+        passo.evidence_filename = new_filename
+        passo.evidence_caption = normalize_text(caption, keep_newlines=True, origin="user", field="caption")
+        passo.evidence_uploaded_at = datetime.utcnow()
+        _add_event(
+            db,
+            apr_id,
+            "evidence_uploaded",
+            {"passo_id": passo_id, "filename": new_filename},
+            actor=current_user,
+        )
     return passo.technical_evidence
 
 
@@ -815,18 +1029,17 @@ def remover_evidencia(
 
     path = _EVIDENCE_DIR / passo.evidence_filename
     try:
-        if path.exists():
+        if path.exists() and not _evidence_shared(db, passo.evidence_filename, passo_id):
             path.unlink()
     except Exception:
         logger.warning("Falha ao remover arquivo de evidencia do passo %s", passo_id)
 
-    passo.evidence_type = None
-    passo.evidence_filename = None
-    passo.evidence_caption = None
-    passo.evidence_uploaded_at = None
-
-    _add_event(db, apr_id, "evidence_deleted", {"passo_id": passo_id}, actor=current_user)
-    db.commit()
+    with unit_of_work(db):
+        passo.evidence_type = None
+        passo.evidence_filename = None
+        passo.evidence_caption = None
+        passo.evidence_uploaded_at = None
+        _add_event(db, apr_id, "evidence_deleted", {"passo_id": passo_id}, actor=current_user)
     return {"status": "ok"}
 
 
@@ -877,18 +1090,18 @@ def adicionar_passos_em_lote(
         )
         db.add(passo)
 
-    db.commit()
-    rebuild_risk_items_for_apr(db, apr_id)
-    _add_event(
-        db,
-        apr_id,
-        "steps_bulk_added",
-        {"count": len(payload.items), "replace": payload.replace},
-        actor=current_user,
-    )
-    db.commit()
-
-    db.refresh(apr)
+    with unit_of_work(db):
+        db.flush()
+        rebuild_risk_items_for_apr(db, apr_id)
+        _add_event(
+            db,
+            apr_id,
+            "steps_bulk_added",
+            {"count": len(payload.items), "replace": payload.replace},
+            actor=current_user,
+        )
+        # So as colecoes mudaram; as colunas da APR continuam validas.
+        db.refresh(apr, attribute_names=["passos", "risk_items"])
     return apr
 
 
@@ -951,17 +1164,52 @@ def aplicar_atividade(
     if not apr.source_hashes:
         apr.source_hashes = json.dumps(get_excel_hashes(), ensure_ascii=False)
 
-    db.commit()
-    rebuild_risk_items_for_apr(db, apr_id)
-    _add_event(
-        db,
-        apr_id,
-        "activity_applied",
-        {"activity_id": activity_id, "steps": len(steps), "replace": payload.replace},
-        actor=current_user,
-    )
-    db.commit()
-    db.refresh(apr)
+    with unit_of_work(db):
+        db.flush()
+        rebuild_risk_items_for_apr(db, apr_id)
+        _add_event(
+            db,
+            apr_id,
+            "activity_applied",
+            {"activity_id": activity_id, "steps": len(steps), "replace": payload.replace},
+            actor=current_user,
+        )
+        db.refresh(apr, attribute_names=["passos", "risk_items"])
+    return apr
+
+
+@router.post("/{apr_id}/apply-template", response_model=schemas.APRDetail)
+def aplicar_modelo(
+    apr_id: int,
+    payload: schemas.APRTemplateApply,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    _ensure_write_access(current_user)
+    apr = db.get(APR, apr_id, options=[lazyload("*")])
+    if not apr:
+        raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="apr_id")
+    _ensure_apr_access(apr, current_user)
+    _ensure_editable(apr)
+    plan_name, plan_tier = _company_plan(db, current_user)
+    if not plan_tier.features.template_library:
+        raise plan_feature_error(
+            f"Plano {plan_name.capitalize()} nao inclui a biblioteca de modelos. Atualize para o Plano Pro."
+        )
+    template = db.get(APRTemplate, payload.template_id)
+    if not template or template.company_id != apr.company_id:
+        raise ApiError(status_code=404, code="not_found", message="Modelo nao encontrado", field="template_id")
+
+    with unit_of_work(db):
+        result = apply_template(db, apr, template, replace=payload.replace)
+        _add_event(
+            db,
+            apr_id,
+            "template_applied",
+            {"template_id": template.id, "steps": result["steps"], "replace": payload.replace},
+            actor=current_user,
+        )
+        db.refresh(apr, attribute_names=["passos", "risk_items"])
     return apr
 
 
@@ -1006,10 +1254,9 @@ def atualizar_risk_item(
                 message="Probabilidade e severidade devem estar entre 1 e 5 para gerar score valido",
                 field="risk_items",
             )
-        risk_item.score = score
-        risk_item.risk_level = level
-        db.commit()
-        db.refresh(risk_item)
+        with unit_of_work(db):
+            risk_item.score = score
+            risk_item.risk_level = level
 
     return risk_item
 
@@ -1042,65 +1289,125 @@ def finalizar_apr(
             field="responsible_confirm",
         )
 
-    passos = db.execute(select(Passo).where(Passo.apr_id == apr_id)).scalars().all()
-    rebuild_risk_items_for_apr(db, apr_id)
-    db.commit()
-    risk_items = list_risk_items_for_apr(db, apr_id)
+    with unit_of_work(db):
+        passos = db.execute(select(Passo).where(Passo.apr_id == apr_id)).scalars().all()
+        rebuild_risk_items_for_apr(db, apr_id)
+        risk_items = list_risk_items_for_apr(db, apr_id)
 
-    validate_apr_for_pdf(apr, passos, risk_items)
+        validate_apr_for_pdf(apr, passos, risk_items)
 
-    apr.status = "final"
-    apr.template_version = PDF_TEMPLATE_VERSION
-    _add_event(
-        db,
-        apr_id,
-        "finalized",
-        {
-            "responsible_confirm": normalized_responsible,
-            "position": payload.position,
-            "crea": payload.crea,
-        },
-        actor=current_user,
-    )
-    db.commit()
-    db.refresh(apr)
+        apr.status = "final"
+        apr.template_version = PDF_TEMPLATE_VERSION
+        _add_event(
+            db,
+            apr_id,
+            "finalized",
+            {
+                "responsible_confirm": normalized_responsible,
+                "position": payload.position,
+                "crea": payload.crea,
+            },
+            actor=current_user,
+        )
     return apr
 
 
+HISTORY_DEFAULT_LIMIT = 100
+HISTORY_MAX_LIMIT = 500
+_HISTORY_COLUMNS = (APREvent.id, APREvent.apr_id, APREvent.event, APREvent.payload, APREvent.criado_em)
+
+
+def _encode_history_cursor(criado_em: datetime, event_id: int) -> str:
+    raw = json.dumps([criado_em.isoformat(), event_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_history_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        criado_em, event_id = json.loads(raw)
+        return datetime.fromisoformat(criado_em), int(event_id)
+    except Exception:
+        raise ApiError(status_code=400, code="validation_error", message="Cursor invalido", field="cursor")
+
+
+def _history_event_out(row) -> dict:
+    payload = None
+    if row.payload:
+        try:
+            payload = json.loads(row.payload)
+        except Exception:
+            payload = {"raw": row.payload}
+    return {
+        "id": row.id,
+        "apr_id": row.apr_id,
+        "event": row.event,
+        "payload": payload,
+        "criado_em": row.criado_em,
+    }
+
+
+def _stream_history(stmt, session_factory):
+    # Sessao propria: o gerador roda depois que a dependencia ja fechou a dela.
+    db = session_factory()
+    try:
+        for row in db.execute(stmt.execution_options(yield_per=200)):
+            event = _history_event_out(row)
+            event["criado_em"] = row.criado_em.isoformat()
+            yield _ndjson_line(event)
+    finally:
+        db.close()
+
+
 @router.get("/{apr_id}/history", response_model=list[schemas.APREventOut])
 def listar_historico(
     apr_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    cursor: str | None = None,
+    limit: int | None = None,
+    event: list[str] | None = Query(default=None),
+    format: str = "json",
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
-    apr = db.get(APR, apr_id)
+    """Historico em ordem (criado_em, id), paginado por cursor.
+
+    O proximo cursor vem no header X-Next-Cursor. Com format=ndjson os eventos
+    sao codificados conforme chegam do banco e o limit so vale se informado.
+    """
+    apr = db.execute(select(APR.id, APR.company_id).where(APR.id == apr_id)).one_or_none()
     if not apr:
         raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="apr_id")
     _ensure_apr_access(apr, current_user)
-    eventos = (
-        db.execute(select(APREvent).where(APREvent.apr_id == apr_id).order_by(APREvent.criado_em))
-        .scalars()
-        .all()
-    )
-
-    saida = []
-    for ev in eventos:
-        payload = None
-        if ev.payload:
-            try:
-                payload = json.loads(ev.payload)
-            except Exception:
-                payload = {"raw": ev.payload}
-        saida.append(
-            {
-                "id": ev.id,
-                "apr_id": ev.apr_id,
-                "event": ev.event,
-                "payload": payload,
-                "criado_em": ev.criado_em,
-            }
+    if format not in {"json", "ndjson"}:
+        raise ApiError(status_code=400, code="validation_error", message="Formato invalido", field="format")
+
+    stmt = select(*_HISTORY_COLUMNS).where(APREvent.apr_id == apr_id)
+    if event:
+        stmt = stmt.where(APREvent.event.in_(event))
+    if cursor:
+        after_at, after_id = _decode_history_cursor(cursor)
+        stmt = stmt.where(
+            (APREvent.criado_em > after_at)
+            | ((APREvent.criado_em == after_at) & (APREvent.id > after_id))
+        )
+    stmt = stmt.order_by(APREvent.criado_em, APREvent.id)
+
+    if format == "ndjson":
+        if limit is not None:
+            stmt = stmt.limit(min(max(limit, 1), HISTORY_MAX_LIMIT))
+        return StreamingResponse(
+            _stream_history(stmt, read_session_factory(request)),
+            media_type="application/x-ndjson",
         )
-    return saida
+
+    limit = min(max(limit or HISTORY_DEFAULT_LIMIT, 1), HISTORY_MAX_LIMIT)
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_history_cursor(rows[-1].criado_em, rows[-1].id)
+    return [_history_event_out(row) for row in rows]
 
 
 @router.get("/{apr_id}/pdf")
@@ -1185,18 +1492,15 @@ def criar_compartilhamento(
     apr.template_version = PDF_TEMPLATE_VERSION
 
     share = APRShare(apr_id=apr_id, company_id=apr.company_id, token=token, filename=filename)
-    db.add(share)
-    db.commit()
-    db.refresh(share)
-
-    _add_event(
-        db,
-        apr_id,
-        "share_created",
-        {"token": token, "file": filename},
-        actor=current_user,
-    )
-    db.commit()
+    with unit_of_work(db):
+        db.add(share)
+        _add_event(
+            db,
+            apr_id,
+            "share_created",
+            {"token": token, "file": filename},
+            actor=current_user,
+        )
 
     return {
         "apr_id": apr_id,
@@ -18,9 +18,10 @@ from models import User, Company
 from plan_utils import DEFAULT_PLAN
 from rbac import VALID_ROLES, normalize_role
 from text_normalizer import normalize_text
+from profiling import ProfiledRoute
 
 
-router = APIRouter(prefix="/auth", tags=["Auth"])
+router = APIRouter(prefix="/auth", tags=["Auth"], route_class=ProfiledRoute)
 
 
 class AuthUserOut(BaseModel):
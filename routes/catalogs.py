@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.orm import Session
+
+import catalog_sync
+import http_cache
+from api_errors import ApiError
+from auth import get_current_user
+from compression import negotiate
+from json_response import JSON_MEDIA_TYPE
+from profiling import ProfiledRoute
+from read_routing import get_read_db
+
+
+router = APIRouter(prefix="/v1/catalogs", tags=["Catalogs"], route_class=ProfiledRoute)
+
+
+@router.get("/snapshot")
+def snapshot_catalogos(
+    request: Request,
+    db: Session = Depends(get_read_db),
+    _user=Depends(get_current_user),
+):
+    # So os contadores para o 304; o snapshot (dados + gzip) fica para o 200.
+    current = catalog_sync.current_version(db)
+    version = str(current)
+    etag = http_cache.make_etag("catalog-snapshot", version)
+    cached = http_cache.not_modified(request.headers, etag)
+    if cached is not None:
+        cached.headers["X-Catalog-Version"] = version
+        return cached
+    snapshot = catalog_sync.get_snapshot(db, current)
+    headers = {**http_cache.cache_headers(etag), "X-Catalog-Version": version, "Vary": "Accept-Encoding"}
+    # Ja comprimido uma vez por versao; o CompressionMiddleware nao mexe (tem Content-Encoding).
+    if negotiate(request.headers.get("accept-encoding"), brotli_available=False) == "gzip":
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=snapshot.gzip_body, media_type=JSON_MEDIA_TYPE, headers=headers)
+    return Response(content=snapshot.body, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+
+@router.get("/changes")
+def delta_catalogos(
+    since: str = Query(..., description="Versao recebida no snapshot ou no ultimo delta"),
+    db: Session = Depends(get_read_db),
+    _user=Depends(get_current_user),
+):
+    parsed = catalog_sync.parse_version(since)
+    if parsed is None:
+        raise ApiError(status_code=400, code="validation_error", message="Versao de catalogo invalida", field="since")
+    return catalog_sync.build_delta(db, parsed)
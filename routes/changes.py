@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+import change_feed
+from api_errors import ApiError
+from auth import get_current_user
+from models import User
+from profiling import ProfiledRoute
+from read_routing import get_read_db
+
+
+router = APIRouter(prefix="/v1/changes", tags=["Sync"], route_class=ProfiledRoute)
+
+
+@router.get("")
+def feed_de_mudancas(
+    cursor: int | None = Query(None, ge=0, description="Cursor devolvido pela leitura anterior"),
+    limit: int = change_feed.DEFAULT_LIMIT,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    if not current_user.company_id:
+        raise ApiError(status_code=403, code="forbidden", message="Usuario sem empresa", field="company_id")
+    return change_feed.read_feed(db, current_user.company_id, cursor, limit)
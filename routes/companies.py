@@ -12,8 +12,9 @@ from models import Company, User
 from plan_utils import normalize_plan_name
 from rbac import ROLE_ADMIN
 from text_normalizer import normalize_text
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/companies", tags=["Companies"])
+router = APIRouter(prefix="/companies", tags=["Companies"], route_class=ProfiledRoute)
 
 
 class CompanyCreateRequest(BaseModel):
@@ -8,10 +8,11 @@ from uuid import uuid4
 from database import SessionLocal
 from importar_excel import importar_epis, importar_perigos
 from auth import require_admin
+from profiling import ProfiledRoute
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/import", tags=["Importacao"])
+router = APIRouter(prefix="/import", tags=["Importacao"], route_class=ProfiledRoute)
 
 
 def get_db():
@@ -24,8 +24,9 @@ from invite_utils import (
 from models import Company, Invite, User
 from rbac import ROLE_ADMIN, VALID_ROLES, normalize_role
 from text_normalizer import normalize_text
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/invites", tags=["Invites"])
+router = APIRouter(prefix="/invites", tags=["Invites"], route_class=ProfiledRoute)
 
 
 class InviteCreateRequest(BaseModel):
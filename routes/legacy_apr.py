@@ -4,11 +4,12 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 
 from database import SessionLocal
-from models import APR, Passo, APREvent, EPI, Perigo, User
+from models import APR, Passo, EPI, Perigo, User
 import schemas
 from apr_documents import write_apr_pdf, validate_apr_for_pdf, PDF_TEMPLATE_VERSION
 from excel_contract import get_excel_hashes
@@ -18,15 +19,19 @@ from ai_suggestions import (
     AIResponseError,
     AITextInvalidEncodingError,
 )
-from api_errors import ApiError, missing_fields_error
+from ai_quota import AIQuotaExceededError, PendingAIQuota, flush_usage, needs_flush
+from api_errors import ApiError, ai_quota_error, missing_fields_error
+from audit import record_event
+from unit_of_work import unit_of_work
 from text_normalizer import normalize_text, normalize_list
 from auth import get_current_user
 from risk_engine import rebuild_risk_items_for_apr, list_risk_items_for_apr
 from status_utils import is_final_status
 from rbac import can_write, normalize_role
+from profiling import ProfiledRoute
 
 
-router = APIRouter(tags=["APR Legacy"])
+router = APIRouter(tags=["APR Legacy"], route_class=ProfiledRoute)
 logger = logging.getLogger(__name__)
 
 
@@ -58,10 +63,6 @@ def _join_list(value, field: str) -> str:
     return "; ".join(_split_list(value, field))
 
 
-def _add_event(db: Session, apr_id: int, event: str, payload: dict | None) -> None:
-    _add_event_with_actor(db, apr_id, event, payload, actor=None)
-
-
 def _add_event_with_actor(
     db: Session,
     apr_id: int,
@@ -70,17 +71,9 @@ def _add_event_with_actor(
     *,
     actor: User | None = None,
 ) -> None:
-    data_payload = payload.copy() if payload else {}
-    if actor:
-        data_payload["actor"] = {
-            "id": actor.id,
-            "email": actor.email,
-            "name": actor.name,
-            "role": normalize_role(actor.role),
-        }
-    apr = db.get(APR, apr_id)
-    company_id = apr.company_id if apr else None
-    db.add(APREvent(apr_id=apr_id, company_id=company_id, event=event, payload=json_dumps(data_payload)))
+    # Chamado sempre depois de _ensure_apr_access: a APR e da empresa do usuario.
+    company_id = actor.company_id if actor else None
+    record_event(db, apr_id, company_id, event, payload, actor=actor)
 
 
 def json_dumps(payload: dict | None) -> str | None:
@@ -127,11 +120,13 @@ class AIStepsRequest(BaseModel):
     energias: list[str] = Field(default_factory=list)
     dangerous_energies_checklist: schemas.DangerousEnergiesChecklist | None = None
     max_steps: int = Field(default=6, ge=1, le=12)
+    use_cache: bool = True
 
 
 class AIStepsResponse(BaseModel):
     passos: list[AIStep]
     source: str
+    cached: bool = False
 
 
 class CatalogItem(BaseModel):
@@ -227,25 +222,23 @@ def criar_apr_legacy(
     if payload.dangerous_energies_checklist is not None:
         apr.dangerous_energies_checklist = payload.dangerous_energies_checklist
     apr.source_hashes = json_dumps(get_excel_hashes())
-    db.add(apr)
-    db.commit()
-    db.refresh(apr)
-
-    _add_event_with_actor(
-        db,
-        apr.id,
-        "created_legacy",
-        {
-            "obra": apr.worksite,
-            "local": apr.sector,
-            "responsavel": apr.responsible,
-            "data": apr.date.isoformat() if apr.date else None,
-            "atividade_id": apr.activity_id,
-            "atividade_nome": apr.activity_name,
-        },
-        actor=current_user,
-    )
-    db.commit()
+    with unit_of_work(db):
+        db.add(apr)
+        db.flush()
+        _add_event_with_actor(
+            db,
+            apr.id,
+            "created_legacy",
+            {
+                "obra": apr.worksite,
+                "local": apr.sector,
+                "responsavel": apr.responsible,
+                "data": apr.date.isoformat() if apr.date else None,
+                "atividade_id": apr.activity_id,
+                "atividade_nome": apr.activity_name,
+            },
+            actor=current_user,
+        )
     return apr
 
 
@@ -293,54 +286,72 @@ def adicionar_itens_legacy(
         epis=_join_list(payload.epis, "epis"),
         normas=_join_list(payload.normas, "normas"),
     )
-    db.add(passo)
-    db.commit()
-    db.refresh(passo)
-    rebuild_risk_items_for_apr(db, apr_id)
+    with unit_of_work(db):
+        db.add(passo)
+        db.flush()
+        rebuild_risk_items_for_apr(db, apr_id)
+        _add_event_with_actor(
+            db,
+            apr_id,
+            "item_added_legacy",
+            {"ordem": ordem},
+            actor=current_user,
+        )
+    return passo
 
-    _add_event_with_actor(
-        db,
-        apr_id,
-        "item_added_legacy",
-        {"ordem": ordem},
-        actor=current_user,
-    )
+
+def _load_apr_for_ai(db: Session, apr_id: int, user: User) -> dict:
+    _ensure_write_access(user)
+    apr = db.get(APR, apr_id)
+    if not apr:
+        raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="apr_id")
+    _ensure_apr_access(apr, user)
+    return {
+        "atividade": apr.activity_name or apr.titulo or "",
+        "descricao": apr.descricao or "",
+        "contexto": {
+            "Obra": apr.worksite,
+            "Setor": apr.sector,
+            "Responsavel": apr.responsible,
+            "Data": apr.date.isoformat() if apr.date else None,
+            "Risco": apr.risco,
+        },
+    }
+
+
+def _record_ai_event(db: Session, apr_id: int, payload: dict, user: User) -> None:
+    _add_event_with_actor(db, apr_id, "ai_suggestions", payload, actor=user)
     db.commit()
-    return passo
 
 
 @router.post("/apr/{apr_id}/ia-sugestoes", response_model=AIStepsResponse)
-def sugerir_passos_com_ia(
+async def sugerir_passos_com_ia(
     apr_id: int,
     payload: AIStepsRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    _ensure_write_access(current_user)
-    apr = db.get(APR, apr_id)
-    if not apr:
-        raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="apr_id")
-    _ensure_apr_access(apr, current_user)
+    apr_data = await run_in_threadpool(_load_apr_for_ai, db, apr_id, current_user)
 
-    atividade = payload.atividade or apr.activity_name or apr.titulo or ""
-    descricao = payload.descricao or apr.descricao or ""
-    contexto = {
-        "Obra": apr.worksite,
-        "Setor": apr.sector,
-        "Responsavel": apr.responsible,
-        "Data": apr.date.isoformat() if apr.date else None,
-        "Risco": apr.risco,
-    }
+    atividade = payload.atividade or apr_data["atividade"]
+    descricao = payload.descricao or apr_data["descricao"]
 
+    # Cota reservada so sem cache (on_cache_miss): resposta em cache passa mesmo no limite.
+    quota = PendingAIQuota(db, current_user.company_id)
+    result = None
     try:
-        result = generate_ai_steps(
+        result = await generate_ai_steps(
             atividade=atividade,
             descricao=descricao,
             ferramentas=payload.ferramentas,
             energias=payload.energias,
-            contexto=contexto,
+            contexto=apr_data["contexto"],
             max_steps=payload.max_steps,
+            use_cache=payload.use_cache,
+            on_cache_miss=quota,
         )
+    except AIQuotaExceededError as exc:
+        raise ai_quota_error(str(exc))
     except AIConfigError as exc:
         raise ApiError(status_code=503, code="ai_not_configured", message=str(exc), field=None)
     except AITextInvalidEncodingError as exc:
@@ -361,15 +372,23 @@ def sugerir_passos_com_ia(
             message="Falha ao gerar passos com IA",
             field=None,
         )
+    finally:
+        # Resposta vinda do cache nao consome cota.
+        quota.finish(consumed=bool(result) and not result.get("cached"))
 
-    _add_event_with_actor(
+    await run_in_threadpool(
+        _record_ai_event,
         db,
         apr_id,
-        "ai_suggestions",
-        {"count": len(result.get("passos") or []), "source": result.get("source")},
-        actor=current_user,
+        {
+            "count": len(result.get("passos") or []),
+            "source": result.get("source"),
+            "cached": bool(result.get("cached")),
+        },
+        current_user,
     )
-    db.commit()
+    if needs_flush():
+        await run_in_threadpool(flush_usage)
 
     return result
 
@@ -6,8 +6,9 @@ from database import SessionLocal
 from models import EPI, Perigo
 import schemas
 from auth import get_current_user
+from profiling import ProfiledRoute
 
-router = APIRouter(tags=["Listagem"])
+router = APIRouter(tags=["Listagem"], route_class=ProfiledRoute)
 
 
 def get_db():
@@ -1,8 +1,9 @@
 from fastapi import APIRouter
 
 import schemas
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/api/seller", tags=["Seller Activation"])
+router = APIRouter(prefix="/api/seller", tags=["Seller Activation"], route_class=ProfiledRoute)
 
 
 def _calculate_progress(completed: int, total: int) -> int:
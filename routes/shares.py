@@ -6,15 +6,17 @@ from pathlib import Path
 import json
 
 from database import SessionLocal
-from models import APR, Passo, APRShare, APREvent
+from models import APR, Passo, APRShare
 from apr_documents import write_apr_pdf, validate_apr_for_pdf, PDF_TEMPLATE_VERSION
 from excel_contract import get_excel_hashes
 from api_errors import ApiError
+from audit import record_event
 from risk_engine import rebuild_risk_items_for_apr, list_risk_items_for_apr
 from status_utils import is_final_status
+from profiling import ProfiledRoute
 
 
-router = APIRouter(tags=["Share"])
+router = APIRouter(tags=["Share"], route_class=ProfiledRoute)
 
 
 def get_db():
@@ -25,13 +27,6 @@ def get_db():
         db.close()
 
 
-def _add_event(db: Session, apr_id: int, event: str, payload: dict | None) -> None:
-    data = json.dumps(payload, ensure_ascii=False) if payload else None
-    apr = db.get(APR, apr_id)
-    company_id = apr.company_id if apr else None
-    db.add(APREvent(apr_id=apr_id, company_id=company_id, event=event, payload=data))
-
-
 @router.get("/share/{token}")
 def baixar_compartilhado(token: str, db: Session = Depends(get_db)):
     share = db.execute(select(APRShare).where(APRShare.token == token)).scalar_one_or_none()
@@ -43,11 +38,15 @@ def baixar_compartilhado(token: str, db: Session = Depends(get_db)):
             field="token",
         )
 
-    apr = db.get(APR, share.apr_id)
-    if not apr:
+    # So status/empresa: carregar a APR inteira puxaria passos, riscos e eventos
+    # em todo acesso publico, mesmo quando o PDF ja existe em disco.
+    apr_row = db.execute(
+        select(APR.status, APR.company_id).where(APR.id == share.apr_id)
+    ).one_or_none()
+    if apr_row is None:
         raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="apr_id")
 
-    if not is_final_status(apr.status):
+    if not is_final_status(apr_row.status):
         raise ApiError(
             status_code=400,
             code="apr_not_final",
@@ -59,6 +58,7 @@ def baixar_compartilhado(token: str, db: Session = Depends(get_db)):
     path = base_dir / "exports" / share.filename
 
     if not path.exists():
+        apr = db.get(APR, share.apr_id)
         passos = db.execute(select(Passo).where(Passo.apr_id == share.apr_id)).scalars().all()
         rebuild_risk_items_for_apr(db, share.apr_id)
         db.commit()
@@ -73,7 +73,13 @@ def baixar_compartilhado(token: str, db: Session = Depends(get_db)):
         apr.template_version = PDF_TEMPLATE_VERSION
         db.commit()
 
-    _add_event(db, share.apr_id, "share_accessed", {"token": token})
+    record_event(
+        db,
+        share.apr_id,
+        share.company_id or apr_row.company_id,
+        "share_accessed",
+        {"token": token},
+    )
     db.commit()
 
     return FileResponse(
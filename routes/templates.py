@@ -0,0 +1,200 @@
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session, lazyload
+
+import apr_templates
+import http_cache
+import schemas
+from api_errors import ApiError, missing_fields_error, plan_feature_error, validation_error
+from auth import get_current_user
+from database import SessionLocal
+from models import APR, APRTemplate, Company, User
+from plan_utils import get_plan_tier, normalize_plan_name
+from profiling import ProfiledRoute
+from rbac import can_write, normalize_role
+from read_routing import get_read_db
+from unit_of_work import unit_of_work
+
+
+router = APIRouter(prefix="/v1/templates", tags=["Templates"], route_class=ProfiledRoute)
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _ensure_template_library(db: Session, user: User) -> None:
+    if not user.company_id:
+        raise ApiError(
+            status_code=403, code="forbidden", message="Usuario sem empresa vinculada", field="company_id"
+        )
+    company = db.get(Company, user.company_id)
+    plan_name = normalize_plan_name(company.plan_name if company else None)
+    if not get_plan_tier(plan_name).features.template_library:
+        raise plan_feature_error(
+            f"Plano {plan_name.capitalize()} nao inclui a biblioteca de modelos. Atualize para o Plano Pro."
+        )
+
+
+def _ensure_write_access(user: User) -> None:
+    if not can_write(normalize_role(user.role)):
+        raise ApiError(
+            status_code=403, code="forbidden", message="Perfil sem permissao de escrita", field="role"
+        )
+
+
+def _get_template(db: Session, template_id: int, user: User) -> APRTemplate:
+    template = db.get(APRTemplate, template_id)
+    if not template:
+        raise ApiError(status_code=404, code="not_found", message="Modelo nao encontrado", field="template_id")
+    if template.company_id != user.company_id:
+        raise ApiError(status_code=403, code="forbidden", message="Acesso negado", field="template_id")
+    return template
+
+
+def _ensure_unique_name(db: Session, company_id: int, name: str, template_id: int | None = None) -> None:
+    stmt = select(APRTemplate.id).where(APRTemplate.company_id == company_id, APRTemplate.name == name)
+    if template_id is not None:
+        stmt = stmt.where(APRTemplate.id != template_id)
+    if db.execute(stmt).first() is not None:
+        raise ApiError(
+            status_code=409, code="conflict", message="Ja existe um modelo com esse nome", field="name"
+        )
+
+
+def _required_name(value: str | None) -> str:
+    name = (value or "").strip()
+    if not name:
+        raise missing_fields_error(["name"])
+    return name
+
+
+def _energies(payload) -> dict | None:
+    checklist = payload.dangerous_energies_checklist
+    return checklist.model_dump() if checklist is not None else None
+
+
+@router.get("", response_model=list[schemas.APRTemplateSummary])
+def listar_modelos(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    _ensure_template_library(db, current_user)
+    marker = apr_templates.summary_marker(db, current_user.company_id)
+    etag = http_cache.make_etag("templates", current_user.company_id, *marker)
+    cached = http_cache.not_modified(request.headers, etag)
+    if cached is not None:
+        return cached
+    response.headers.update(http_cache.cache_headers(etag))
+    return apr_templates.list_summaries(db, current_user.company_id)
+
+
+@router.post("", response_model=schemas.APRTemplateOut)
+def criar_modelo(
+    payload: schemas.APRTemplateCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    _ensure_write_access(current_user)
+    _ensure_template_library(db, current_user)
+    name = _required_name(payload.name)
+    _ensure_unique_name(db, current_user.company_id, name)
+
+    activity_id, activity_name = payload.activity_id, payload.activity_name
+    energies = _energies(payload)
+    if payload.source_apr_id is not None:
+        apr = db.get(APR, payload.source_apr_id, options=[lazyload("*")])
+        if not apr:
+            raise ApiError(status_code=404, code="not_found", message="APR nao encontrada", field="source_apr_id")
+        if apr.company_id != current_user.company_id:
+            raise ApiError(status_code=403, code="forbidden", message="Acesso negado", field="source_apr_id")
+        steps = apr_templates.steps_from_apr(db, apr.id)
+        activity_id = activity_id or apr.activity_id
+        activity_name = activity_name or apr.activity_name
+        if energies is None and apr.dangerous_energies_checklist_json is not None:
+            energies = apr.dangerous_energies_checklist
+    else:
+        steps = apr_templates.steps_from_input(payload.steps)
+    if not steps:
+        raise validation_error("Modelo precisa de ao menos um passo", field="steps")
+
+    template = APRTemplate(
+        company_id=current_user.company_id,
+        created_by=current_user.id,
+        name=name,
+        description=payload.description,
+        activity_id=activity_id,
+        activity_name=activity_name,
+    )
+    apr_templates.store_compiled(template, apr_templates.compile_template(db, steps, energies))
+    with unit_of_work(db):
+        db.add(template)
+        db.flush()
+    return apr_templates.template_out(template)
+
+
+@router.get("/{template_id}", response_model=schemas.APRTemplateOut)
+def obter_modelo(
+    template_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    _ensure_template_library(db, current_user)
+    return apr_templates.template_out(_get_template(db, template_id, current_user))
+
+
+@router.patch("/{template_id}", response_model=schemas.APRTemplateOut)
+def atualizar_modelo(
+    template_id: int,
+    payload: schemas.APRTemplateUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    _ensure_write_access(current_user)
+    _ensure_template_library(db, current_user)
+    template = _get_template(db, template_id, current_user)
+
+    if payload.name is not None:
+        name = _required_name(payload.name)
+        _ensure_unique_name(db, template.company_id, name, template.id)
+        template.name = name
+    if payload.description is not None:
+        template.description = payload.description
+    if payload.activity_id is not None:
+        template.activity_id = payload.activity_id
+    if payload.activity_name is not None:
+        template.activity_name = payload.activity_name
+
+    compiled = template.compiled or {}
+    energies = _energies(payload) if payload.dangerous_energies_checklist is not None else compiled.get("energies")
+    if payload.steps is not None:
+        steps = apr_templates.steps_from_input(payload.steps)
+        if not steps:
+            raise validation_error("Modelo precisa de ao menos um passo", field="steps")
+        apr_templates.store_compiled(template, apr_templates.compile_template(db, steps, energies))
+    elif energies != compiled.get("energies"):
+        apr_templates.store_compiled(template, {**compiled, "energies": energies})
+
+    with unit_of_work(db):
+        db.flush()
+    return apr_templates.template_out(template)
+
+
+@router.delete("/{template_id}", response_model=dict)
+def excluir_modelo(
+    template_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    _ensure_write_access(current_user)
+    _ensure_template_library(db, current_user)
+    template = _get_template(db, template_id, current_user)
+    with unit_of_work(db):
+        db.delete(template)
+    return {"status": "ok", "template_id": template_id}
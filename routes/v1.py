@@ -1,17 +1,24 @@
 ﻿from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi import Request, Response
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse
 from sqlalchemy import select, func
 
-from database import SessionLocal
+import ai_cache
+from database import SessionLocal, get_pools_metrics
+from image_preprocessing import get_image_stats
 from models import EPI, Perigo
 from excel_contract import get_contract_cached, RISK_MATRIX
-from api_errors import validation_error
+from api_errors import ApiError, validation_error
+from json_response import UTF8JSONResponse
 import schemas
-from auth import get_current_user, require_admin
+from read_routing import get_async_read_db
+from auth import get_current_user, get_current_user_async, require_admin
+import profiling
+import http_cache
 
-router = APIRouter(prefix="/v1", tags=["v1"])
+router = APIRouter(prefix="/v1", tags=["v1"], route_class=profiling.ProfiledRoute)
 
 
 def get_db():
@@ -34,46 +41,64 @@ def obter_contrato_excel(request: Request, _user=Depends(get_current_user)):
     contract, headers, not_modified = get_contract_cached(request.headers)
     if not_modified:
         return Response(status_code=304, headers=headers)
-    return JSONResponse(content=contract, headers=headers)
+    return UTF8JSONResponse(content=contract, headers=headers)
 
 
 # -------- LISTAGEM (com paginação + search) --------
 @router.get("/epis", response_model=schemas.PaginatedEPIOut)
-def listar_epis(
+async def listar_epis(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 50,
     search: str | None = None,
-    db: Session = Depends(get_db),
-    _user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db),
+    _user=Depends(get_current_user_async),
 ):
+    version = (await db.execute(http_cache.catalog_version_stmt("epis"))).scalar_one_or_none()
+    etag = http_cache.catalog_etag("epis", version)
+    cached = http_cache.not_modified(request.headers, etag)
+    if cached is not None:
+        return cached
+    response.headers.update(http_cache.cache_headers(etag))
+
     limit = min(max(limit, 1), 200)
 
     base = select(EPI)
     if search:
         base = base.where(EPI.epi.ilike(f"%{search}%"))
 
-    total = db.execute(select(func.count()).select_from(base.subquery())).scalar_one()
-    items = db.execute(base.offset(skip).limit(limit)).scalars().all()
+    total = (await db.execute(select(func.count()).select_from(base.subquery()))).scalar_one()
+    items = (await db.execute(base.offset(skip).limit(limit))).scalars().all()
 
     return {"items": items, "total": total, "skip": skip, "limit": limit}
 
 
 @router.get("/perigos", response_model=schemas.PaginatedPerigoOut)
-def listar_perigos(
+async def listar_perigos(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 50,
     search: str | None = None,
-    db: Session = Depends(get_db),
-    _user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db),
+    _user=Depends(get_current_user_async),
 ):
+    version = (await db.execute(http_cache.catalog_version_stmt("perigos"))).scalar_one_or_none()
+    etag = http_cache.catalog_etag("perigos", version)
+    cached = http_cache.not_modified(request.headers, etag)
+    if cached is not None:
+        return cached
+    response.headers.update(http_cache.cache_headers(etag))
+
     limit = min(max(limit, 1), 200)
 
     base = select(Perigo)
     if search:
         base = base.where(Perigo.perigo.ilike(f"%{search}%"))
 
-    total = db.execute(select(func.count()).select_from(base.subquery())).scalar_one()
-    items = db.execute(base.offset(skip).limit(limit)).scalars().all()
+    total = (await db.execute(select(func.count()).select_from(base.subquery()))).scalar_one()
+    items = (await db.execute(base.offset(skip).limit(limit))).scalars().all()
 
     return {"items": items, "total": total, "skip": skip, "limit": limit}
 
@@ -150,3 +175,47 @@ def atualizar_perigo(
         db.refresh(obj)
 
     return obj
+
+
+# -------- BANCO --------
+@router.get("/db/pool/stats")
+def estatisticas_pool_banco(_admin=Depends(require_admin)):
+    return get_pools_metrics()
+
+
+# -------- CACHE DE IA --------
+@router.get("/ai/cache/stats")
+def estatisticas_cache_ia(_admin=Depends(require_admin)):
+    return ai_cache.get_cache_stats()
+
+
+@router.get("/ai/images/stats")
+def estatisticas_imagens_ia(_admin=Depends(require_admin)):
+    return get_image_stats()
+
+
+@router.delete("/ai/cache")
+def limpar_cache_ia(_admin=Depends(require_admin)):
+    return {"removed": ai_cache.clear_cache()}
+
+
+# -------- PROFILING --------
+@router.get("/profiles")
+def listar_perfis(_admin=Depends(require_admin)):
+    return {"items": profiling.list_profiles(), "keep": profiling.profile_keep()}
+
+
+@router.get("/profiles/{profile_id}")
+def obter_perfil(profile_id: str, _admin=Depends(require_admin)):
+    meta = profiling.load_profile(profile_id)
+    if not meta:
+        raise ApiError(status_code=404, code="not_found", message="Perfil nao encontrado", field="profile_id")
+    return meta
+
+
+@router.get("/profiles/{profile_id}/pstats")
+def baixar_perfil(profile_id: str, _admin=Depends(require_admin)):
+    path = profiling.profile_stats_path(profile_id)
+    if not path:
+        raise ApiError(status_code=404, code="not_found", message="Perfil nao encontrado", field="profile_id")
+    return FileResponse(path=str(path), media_type="application/octet-stream", filename=path.name)
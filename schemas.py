@@ -1,7 +1,7 @@
 ﻿from datetime import datetime
 from pydantic import BaseModel, Field, field_validator, ConfigDict
 from datetime import date as dt_date
-from typing import Optional, List, Generic, TypeVar
+from typing import Optional, List, Generic, TypeVar, Union
 
 from text_normalizer import normalize_text
 
@@ -285,6 +285,89 @@ class ActivityApply(NormalizedUserModel):
     replace: bool = True
 
 
+class APRDuplicate(NormalizedUserModel):
+    include_evidence: bool = False
+
+
+# ---------- MODELOS DE APR ----------
+class TemplateRiskIn(NormalizedUserModel):
+    description: str
+    probability: Optional[int] = None
+    severity: Optional[int] = None
+
+
+class TemplateStepIn(NormalizedUserModel):
+    step_order: int = Field(..., ge=1)
+    description: str
+    hazards: List[str] = []
+    # Texto do risco, ou objeto com probabilidade/severidade que substituem o padrao do
+    # perigo na APR criada (so ate o proximo rebuild dos riscos, como um PATCH manual).
+    risks: List[Union[str, TemplateRiskIn]] = []
+    measures: List[str] = []
+    epis: List[str] = []
+    regulations: List[str] = []
+
+
+class APRTemplateCreate(NormalizedUserModel):
+    name: str
+    description: Optional[str] = None
+    activity_id: Optional[str] = None
+    activity_name: Optional[str] = None
+    dangerous_energies_checklist: Optional[DangerousEnergiesChecklist] = None
+    steps: List[TemplateStepIn] = []
+    # Alternativa a steps: copia passos e riscos (com os scores) de uma APR existente.
+    source_apr_id: Optional[int] = None
+
+
+class APRTemplateUpdate(NormalizedUserModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    activity_id: Optional[str] = None
+    activity_name: Optional[str] = None
+    dangerous_energies_checklist: Optional[DangerousEnergiesChecklist] = None
+    steps: Optional[List[TemplateStepIn]] = None
+
+
+class APRTemplateSummary(NormalizedModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    activity_id: Optional[str] = None
+    activity_name: Optional[str] = None
+    step_count: int
+    risk_count: int
+    updated_at: datetime
+
+
+class TemplateRiskOut(NormalizedModel):
+    risk_description: str
+    hazard_id: Optional[int] = None
+    probability: int
+    severity: int
+    manual: bool = False
+
+
+class TemplateStepOut(NormalizedModel):
+    ordem: int
+    descricao: str
+    perigos: str
+    riscos: str
+    medidas_controle: str
+    epis: str
+    normas: str
+    risks: List[TemplateRiskOut] = []
+
+
+class APRTemplateOut(APRTemplateSummary):
+    dangerous_energies_checklist: Optional[DangerousEnergiesChecklist] = None
+    steps: List[TemplateStepOut] = []
+
+
+class APRTemplateApply(NormalizedUserModel):
+    template_id: int
+    replace: bool = True
+
+
 class APREventOut(NormalizedModel):
     id: int
     apr_id: int
@@ -320,6 +403,9 @@ class PlanFeature(NormalizedModel):
 class PlanUsage(NormalizedModel):
     active_aprs: int
     active_aprs_limit: int | None
+    ai_generations: int = 0
+    ai_generations_limit: int | None = None
+    ai_period: Optional[str] = None
 
 
 class PlanSummary(NormalizedModel):
@@ -340,6 +426,13 @@ class AccountMetrics(NormalizedModel):
     aprs_created_30d: int
 
 
+class StepItemUsage(NormalizedModel):
+    label: str
+    catalog_id: Optional[int] = None
+    aprs: int
+    steps: int
+
+
 class SellerActivationChecklistItem(NormalizedUserModel):
     __origin__ = "seller_activation"
 
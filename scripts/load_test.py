@@ -0,0 +1,107 @@
+"""Teste de carga das rotas quentes (auth + APR + catalogo).
+
+Sobe a concorrencia em degraus e reporta RPS, p50/p95 e erros de cada degrau.
+O "RPS maximo sustentavel" e o maior RPS de um degrau com p95 dentro do
+orcamento e taxa de erro abaixo de 1%. Para comparar antes/depois, rode contra
+dois servidores (ou duas revisoes) com os mesmos parametros:
+
+    python scripts/load_test.py --base-url http://127.0.0.1:8000 --token TOKEN --apr-id 1
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _worker(client: httpx.AsyncClient, paths: list[str], deadline: float, latencies: list, errors: list):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        latencies.append((time.perf_counter() - started) * 1000)
+        if not ok:
+            errors.append(path)
+
+
+async def run_step(base_url: str, headers: dict, paths: list[str], concurrency: int, seconds: float) -> dict:
+    latencies: list[float] = []
+    errors: list[str] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + seconds
+        await asyncio.gather(
+            *(_worker(client, paths, deadline, latencies, errors) for _ in range(concurrency))
+        )
+        elapsed = time.perf_counter() - started
+    total = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else 0.0,
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "error_rate": round(len(errors) / total, 4) if total else 1.0,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", required=True, help="Bearer token ou X-API-Token")
+    parser.add_argument("--apr-id", type=int, required=True)
+    parser.add_argument("--levels", default="8,16,32,64,128", help="Degraus de concorrencia")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duracao de cada degrau")
+    parser.add_argument("--p95-budget-ms", type=float, default=250.0)
+    parser.add_argument("--json", action="store_true", help="Imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"}
+    paths = [
+        "/v1/aprs?limit=20",
+        f"/v1/aprs/{args.apr_id}",
+        "/v1/epis?limit=50",
+        "/v1/perigos?limit=50",
+    ]
+    steps = []
+    for level in (int(value) for value in args.levels.split(",") if value.strip()):
+        step = await run_step(args.base_url, headers, paths, level, args.seconds)
+        steps.append(step)
+        if not args.json:
+            print(
+                f"c={step['concurrency']:>4} rps={step['rps']:>8} p50={step['p50_ms']:>7}ms "
+                f"p95={step['p95_ms']:>7}ms erros={step['error_rate']:.2%}"
+            )
+
+    sustainable = [
+        step for step in steps if step["p95_ms"] <= args.p95_budget_ms and step["error_rate"] < 0.01
+    ]
+    best = max(sustainable, key=lambda step: step["rps"], default=None)
+    result = {"steps": steps, "max_sustainable_rps": best["rps"] if best else 0.0}
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"RPS maximo sustentavel (p95 <= {args.p95_budget_ms:.0f}ms): {result['max_sustainable_rps']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""Mede o cold start do worker: import do app, startup e primeira /health.
+
+Cada rodada e um processo novo (sem cache de modulos). Informa tambem a
+memoria residente e se pandas/ReportLab foram carregados antes de servir:
+
+    python scripts/startup_time.py --runs 5
+    python scripts/startup_time.py --runs 5 --json > startup.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("pandas", "reportlab", "openpyxl")
+
+_PROBE = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    ready = time.perf_counter()
+    status = client.get("/health").status_code
+    served = time.perf_counter()
+    heavy = sorted(name for name in HEAVY if name in sys.modules)
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "first_health_ms": (served - ready) * 1000,
+    "total_ms": (served - started) * 1000,
+    "health_status": status,
+    "max_rss_mb": rss_kb / 1024,
+    "heavy_loaded_before_first_request": heavy,
+}))
+"""
+
+
+def run_once(database_url: str, warm_up: bool) -> dict:
+    env = dict(os.environ, DATABASE_URL=database_url, APP_WARMUP="true" if warm_up else "false")
+    code = f"HEAVY = {HEAVY_MODULES!r}\n" + _PROBE
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=300
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", default="sqlite:///./startup_probe.db")
+    parser.add_argument("--warm-up", action="store_true", help="Liga APP_WARMUP nas rodadas")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    # A primeira rodada popula o banco; as seguintes medem o caso comum (catalogo pronto).
+    run_once(args.database_url, args.warm_up)
+    runs = [run_once(args.database_url, args.warm_up) for _ in range(args.runs)]
+    summary = {
+        key: round(statistics.median(run[key] for run in runs), 1)
+        for key in ("import_ms", "startup_ms", "first_health_ms", "total_ms", "max_rss_mb")
+    }
+    summary["heavy_loaded_before_first_request"] = runs[-1]["heavy_loaded_before_first_request"]
+    if args.json:
+        print(json.dumps({"runs": runs, "median": summary}, indent=2))
+        return
+    for key, value in summary.items():
+        print(f"{key:<36} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Listeners globais de Session, registrados num lugar so.
+
+Cada modulo expoe os seus em SESSION_LISTENERS; a ordem aqui e a de execucao
+dentro do mesmo evento (o before_flush do catalogo marca a versao pendente
+antes de step_items decidir se pode usar o cache de lookups).
+"""
+from __future__ import annotations
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import audit
+import change_feed
+import http_cache
+import step_items
+
+_MODULES = (http_cache, step_items, change_feed, audit)
+
+
+def register_listeners() -> None:
+    """Registra os listeners; idempotente (main, scripts e testes podem chamar)."""
+    for module in _MODULES:
+        for name, fn in module.SESSION_LISTENERS:
+            if not event.contains(Session, name, fn):
+                event.listen(Session, name, fn)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import re
+import threading
+
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session
+
+from entity_normalizer import normalized_key
+from http_cache import catalog_changes_pending
+from models import EPI, CatalogVersion, Passo, PassoItem, Perigo
+from text_normalizer import normalize_text
+
+# Campo texto do passo -> tipo do item. Perigos e riscos podem ter virgula no
+# texto livre, entao so ";" separa; listas curtas aceitam ";" ou ",".
+STEP_ITEM_FIELDS = {
+    "perigos": ("hazard", re.compile(r";")),
+    "riscos": ("risk", re.compile(r";")),
+    "medidas_controle": ("control", re.compile(r"[;,]")),
+    "epis": ("epi", re.compile(r"[;,]")),
+    "normas": ("norm", re.compile(r"[;,]")),
+}
+
+
+def split_step_field(field: str, value: str | None) -> list[str]:
+    _, separator = STEP_ITEM_FIELDS[field]
+    text = normalize_text(value, keep_newlines=False, origin="user", field=field) or ""
+    if not text:
+        return []
+    items: list[str] = []
+    for part in separator.split(text):
+        item = normalize_text(part, keep_newlines=False, origin="user", field=field) or ""
+        if item:
+            items.append(item)
+    return items
+
+
+def _catalog_lookup(db: Session, column, id_column) -> dict[str, tuple[int, str]]:
+    lookup: dict[str, tuple[int, str]] = {}
+    for row_id, name in db.execute(select(id_column, column)).all():
+        key = normalized_key(name)
+        if key:
+            lookup[key] = (row_id, name)
+    return lookup
+
+
+Lookups = tuple[dict[str, tuple[int, str]], dict[str, tuple[int, str]]]
+
+# Catalogo inteiro por processo, valido enquanto os contadores de catalog_versions
+# nao mudam: o flush de um passo so le os dois contadores.
+_lookups: tuple[tuple[int, int], Lookups] | None = None
+_lookups_lock = threading.Lock()
+
+
+def _load_lookups(db: Session) -> Lookups:
+    return _catalog_lookup(db, Perigo.perigo, Perigo.id), _catalog_lookup(db, EPI.epi, EPI.id)
+
+
+def catalog_lookups(db: Session) -> Lookups:
+    """Perigos e EPIs do catalogo por chave normalizada, para build_step_items."""
+    global _lookups
+    if catalog_changes_pending(db):
+        # Catalogo alterado nesta transacao: a versao ainda nao vale para os outros.
+        return _load_lookups(db)
+    # Contadores antes dos dados: no pior caso o cache guarda dados mais novos que a chave.
+    counters = dict(
+        db.execute(
+            select(CatalogVersion.name, CatalogVersion.version).where(CatalogVersion.name.in_(("epis", "perigos")))
+        ).all()
+    )
+    key = (counters.get("epis", 0), counters.get("perigos", 0))
+    cached = _lookups
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with _lookups_lock:
+        if _lookups is None or _lookups[0] != key:
+            _lookups = (key, _load_lookups(db))
+        return _lookups[1]
+
+
+def clear_catalog_lookups() -> None:
+    global _lookups
+    with _lookups_lock:
+        _lookups = None
+
+
+def build_step_items(
+    passo: Passo,
+    *,
+    hazards: dict[str, tuple[int, str]],
+    epis: dict[str, tuple[int, str]],
+    fields=STEP_ITEM_FIELDS,
+) -> list[PassoItem]:
+    items: list[PassoItem] = []
+    for field in fields:
+        kind, _ = STEP_ITEM_FIELDS[field]
+        seen: set[str] = set()
+        position = 0
+        for label in split_step_field(field, getattr(passo, field)):
+            perigo_id = epi_id = None
+            if kind == "hazard" and normalized_key(label) in hazards:
+                perigo_id, label = hazards[normalized_key(label)]
+            elif kind == "epi" and normalized_key(label) in epis:
+                epi_id, label = epis[normalized_key(label)]
+            if kind == "hazard":
+                if label in seen:
+                    continue
+                seen.add(label)
+            items.append(
+                PassoItem(kind=kind, position=position, label=label, perigo_id=perigo_id, epi_id=epi_id)
+            )
+            position += 1
+    return items
+
+
+def link_catalog(db: Session, items) -> None:
+    """Liga ao catalogo itens de perigo/EPI ainda sem id.
+
+    O vinculo e feito quando o texto do passo muda; um perigo/EPI cadastrado
+    depois (ex.: importacao do Excel) so chega aos passos antigos por aqui,
+    chamado no rebuild dos riscos.
+    """
+    pending = [
+        item
+        for item in items
+        if (item.kind == "hazard" and item.perigo_id is None) or (item.kind == "epi" and item.epi_id is None)
+    ]
+    if not pending:
+        return
+    hazards, epis = catalog_lookups(db)
+    for item in pending:
+        if item.kind == "hazard" and normalized_key(item.label) in hazards:
+            item.perigo_id, item.label = hazards[normalized_key(item.label)]
+        elif item.kind == "epi" and normalized_key(item.label) in epis:
+            item.epi_id, item.label = epis[normalized_key(item.label)]
+
+
+def _changed_fields(passo: Passo) -> list[str]:
+    state = inspect(passo)
+    if state.pending or state.transient:
+        return list(STEP_ITEM_FIELDS)
+    return [field for field in STEP_ITEM_FIELDS if state.attrs[field].history.has_changes()]
+
+
+def _sync_step_items(session: Session, flush_context, instances) -> None:
+    changed = [
+        (obj, fields)
+        for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Passo) and (fields := _changed_fields(obj))
+    ]
+    if not changed:
+        return
+    with session.no_autoflush:
+        lookups = None
+        for passo, fields in changed:
+            # So perigos/epis consultam o catalogo; os demais itens do passo ficam como estao.
+            if lookups is None and ("perigos" in fields or "epis" in fields):
+                lookups = catalog_lookups(session)
+            hazards, epis = lookups or ({}, {})
+            kinds = {STEP_ITEM_FIELDS[field][0] for field in fields}
+            kept = [item for item in passo.items if item.kind not in kinds]
+            passo.items = kept + build_step_items(passo, hazards=hazards, epis=epis, fields=fields)
+
+
+SESSION_LISTENERS = (("before_flush", _sync_step_items),)
@@ -1,5 +1,13 @@
+import json
 import os
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from uuid import uuid4
+
+import pytest
 
 DB_PATH = Path("test_app.db")
 DB_URL = "sqlite:///./test_app.db"
@@ -9,11 +17,213 @@ ADMIN_PASSWORD = "Integration123!"
 os.environ.setdefault("DATABASE_URL", DB_URL)
 os.environ.setdefault("ADMIN_EMAIL", ADMIN_EMAIL)
 os.environ.setdefault("ADMIN_PASSWORD", ADMIN_PASSWORD)
+os.environ.setdefault("SQL_QUERY_BUDGET", "40")
+# Sem warm-up em background: os testes nao concorrem com a sincronizacao do catalogo.
+os.environ.setdefault("APP_WARMUP", "false")
 
 if DB_PATH.exists():
     DB_PATH.unlink()
 
 
+_STEPS_TEXT = json.dumps(
+    {
+        "steps": [
+            {
+                "step_order": 1,
+                "description": "Isolar a area de trabalho",
+                "hazard": "Queda de materiais",
+                "consequences": "Lesoes por impacto",
+                "safeguards": "Sinalizar e isolar o perimetro",
+                "epis": ["Capacete"],
+            },
+            {
+                "step_order": 2,
+                "description": "Remover a luminaria danificada",
+                "hazard": "Contato com partes energizadas",
+                "consequences": "Choque eletrico",
+                "safeguards": "Desenergizar e bloquear o circuito",
+                "epis": ["Luvas isolantes", "Oculos de protecao"],
+            },
+        ]
+    }
+)
+
+
+class _FakeGemini:
+    def __init__(self) -> None:
+        self.requests: list[dict] = []
+        self.fail_next: list[int] = []
+        self.delay = 0.0
+        self.stream_chunk_size = 40
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.client_ports: set[int] = set()
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    fake.requests.append({"path": self.path, "body": body})
+                    fake.client_ports.add(self.client_address[1])
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                    status = fake.fail_next.pop(0) if fake.fail_next else 200
+                try:
+                    if fake.delay:
+                        time.sleep(fake.delay)
+                    if status == 200 and ":streamGenerateContent" in self.path:
+                        self._send_stream()
+                        return
+                    if status != 200:
+                        payload = json.dumps({"error": {"message": f"fake {status}"}}).encode()
+                    else:
+                        payload = json.dumps(
+                            {"candidates": [{"content": {"parts": [{"text": _STEPS_TEXT}]}}]}
+                        ).encode()
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def _send_stream(self):
+                # Fatia o JSON em pedacos pequenos, como a Gemini faz no SSE.
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for start in range(0, len(_STEPS_TEXT), fake.stream_chunk_size):
+                    piece = _STEPS_TEXT[start : start + fake.stream_chunk_size]
+                    chunk = {"candidates": [{"content": {"parts": [{"text": piece}]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode())
+                    self.wfile.flush()
+                self.close_connection = True
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    fake = _FakeGemini()
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("GEMINI_API_URL", fake.url)
+    monkeypatch.setenv("GEMINI_BACKOFF_BASE", "0.01")
+    yield fake
+    fake.close()
+
+
+class _QueryRecorder:
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def reset(self) -> None:
+        self.statements.clear()
+
+
+@pytest.fixture
+def sql_queries():
+    """Conta os statements executados (todas as engines) durante o teste."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    recorder = _QueryRecorder()
+    event.listen(Engine, "after_cursor_execute", recorder)
+    yield recorder
+    event.remove(Engine, "after_cursor_execute", recorder)
+
+
+class _AprFactory:
+    """Empresa nova (admin com token) e APR criadas pela API, como um cliente faria."""
+
+    def company(self, client, *, plan: str | None = None) -> dict[str, str]:
+        suffix = uuid4().hex[:8]
+        email = f"empresa.{suffix}@example.com"
+        response = client.post(
+            "/companies",
+            json={
+                "name": f"Empresa Teste {suffix}",
+                "admin_email": email,
+                "admin_password": "Senha1234",
+                "admin_name": "Admin",
+            },
+        )
+        assert response.status_code == 200, response.text
+        if plan is not None:
+            from sqlalchemy import select, update
+
+            from database import SessionLocal
+            from models import Company, User
+
+            db = SessionLocal()
+            try:
+                company_id = db.execute(select(User.company_id).where(User.email == email)).scalar_one()
+                db.execute(update(Company).where(Company.id == company_id).values(plan_name=plan))
+                db.commit()
+            finally:
+                db.close()
+        return {"Authorization": f"Bearer {response.json()['token']}"}
+
+    def apr(self, client, headers: dict[str, str], **fields) -> int:
+        payload = {
+            "worksite": "Obra Teste",
+            "sector": "Setor",
+            "responsible": "Tecnico",
+            "date": date.today().isoformat(),
+            "activity_id": "act-teste",
+            "activity_name": "Atividade",
+            "titulo": "APR Teste",
+            "risco": "Baixo",
+            "descricao": "Teste",
+            **fields,
+        }
+        response = client.post("/v1/aprs", json=payload, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+
+@pytest.fixture
+def apr_factory():
+    """company(client, plan=...) devolve os headers do admin; apr(client, headers, **campos) o id."""
+    return _AprFactory()
+
+
+@pytest.fixture(autouse=True)
+def _query_budget_guard():
+    """Falha o teste se alguma request passar de SQL_QUERY_BUDGET queries."""
+    from query_stats import BUDGET_VIOLATIONS
+
+    BUDGET_VIOLATIONS.clear()
+    yield
+    violations = list(BUDGET_VIOLATIONS)
+    BUDGET_VIOLATIONS.clear()
+    assert not violations, f"requests acima do orcamento de queries: {violations}"
+
+
 def pytest_sessionfinish(session, exitstatus):
     if DB_PATH.exists():
         try:
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import os
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+import ai_cache
+from database import SessionLocal
+from main import app
+from models import AICacheEntry, User
+
+
+ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", "integration@example.com")
+
+
+def _get_admin_token() -> str:
+    db = SessionLocal()
+    try:
+        user = db.execute(select(User).where(User.email == ADMIN_EMAIL)).scalar_one_or_none()
+        if not user:
+            raise AssertionError("Admin user not seeded")
+        return user.api_token
+    finally:
+        db.close()
+
+
+def test_ai_steps_are_served_from_cache(fake_gemini, apr_factory):
+    with TestClient(app) as client:
+        headers = {"X-API-Token": _get_admin_token()}
+        apr_id = apr_factory.apr(client, headers)
+        descricao = f"Troca de luminaria {uuid4().hex[:8]}"
+
+        first = client.post(f"/v1/aprs/{apr_id}/ai-steps", data={"descricao": descricao}, headers=headers)
+        assert first.status_code == 200, first.text
+        assert first.json()["cached"] is False
+
+        # Mesmo conteudo com caixa/espacos diferentes reaproveita a entrada.
+        second = client.post(
+            f"/v1/aprs/{apr_id}/ai-steps",
+            data={"descricao": f"  {descricao.upper()} "},
+            headers=headers,
+        )
+        assert second.status_code == 200, second.text
+        assert second.json()["cached"] is True
+        assert second.json()["steps"] == first.json()["steps"]
+        assert len(fake_gemini.requests) == 1
+
+        bypass = client.post(
+            f"/v1/aprs/{apr_id}/ai-steps",
+            data={"descricao": descricao, "use_cache": "false"},
+            headers=headers,
+        )
+        assert bypass.status_code == 200, bypass.text
+        assert bypass.json()["cached"] is False
+        assert len(fake_gemini.requests) == 2
+
+        stats = client.get("/v1/ai/cache/stats", headers=headers)
+        assert stats.status_code == 200, stats.text
+        body = stats.json()
+        assert body["hits"] >= 1
+        assert body["bypassed"] >= 1
+        assert body["entries"] >= 1
+
+
+def test_ai_cache_evicts_least_recently_used(monkeypatch):
+    with TestClient(app):
+        ai_cache.clear_cache()
+        monkeypatch.setenv("AI_CACHE_MAX_ENTRIES", "2")
+        for idx in range(3):
+            ai_cache.store(f"key-{idx}", kind="steps", model="m", result={"passos": [idx]})
+        assert ai_cache.get_cached("key-0") is None
+        assert ai_cache.get_cached("key-2") == {"passos": [2]}
+
+        db = SessionLocal()
+        try:
+            keys = set(db.execute(select(AICacheEntry.cache_key)).scalars())
+        finally:
+            db.close()
+        assert keys == {"key-1", "key-2"}
+        ai_cache.clear_cache()
+
+
+def test_ai_cache_expired_entries_are_ignored(monkeypatch):
+    with TestClient(app):
+        monkeypatch.setenv("AI_CACHE_TTL_SECONDS", "1")
+        ai_cache.store("key-expired", kind="steps", model="m", result={"passos": []})
+        db = SessionLocal()
+        try:
+            entry = db.execute(
+                select(AICacheEntry).where(AICacheEntry.cache_key == "key-expired")
+            ).scalar_one()
+            entry.expires_at = entry.created_at
+            db.commit()
+        finally:
+            db.close()
+        assert ai_cache.get_cached("key-expired") is None
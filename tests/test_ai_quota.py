@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+import ai_quota
+from database import SessionLocal
+from main import app
+from models import AIUsage, User
+
+
+def test_ai_quota_blocks_free_plan_after_limit(fake_gemini, apr_factory):
+    suffix = uuid4().hex[:8]
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+
+        for idx in range(3):
+            response = client.post(
+                f"/v1/aprs/{apr_id}/ai-steps",
+                data={"descricao": f"Pintura de fachada {suffix} etapa {idx}"},
+                headers=headers,
+            )
+            assert response.status_code == 200, response.text
+            if idx == 0:
+                # Resposta em cache nao conta como nova geracao.
+                cached = client.post(
+                    f"/v1/aprs/{apr_id}/ai-steps",
+                    data={"descricao": f"Pintura de fachada {suffix} etapa 0"},
+                    headers=headers,
+                )
+                assert cached.status_code == 200, cached.text
+                assert cached.json()["cached"] is True
+
+        blocked = client.post(
+            f"/apr/{apr_id}/ia-sugestoes",
+            json={"atividade": "Pintura", "descricao": "Outra etapa"},
+            headers=headers,
+        )
+        assert blocked.status_code == 429, blocked.text
+        assert blocked.json()["code"] == "ai_quota_exceeded"
+        assert len(fake_gemini.requests) == 3
+
+        # No limite, o que ja esta em cache continua sendo servido (sem reservar cota).
+        cached = client.post(
+            f"/v1/aprs/{apr_id}/ai-steps",
+            data={"descricao": f"Pintura de fachada {suffix} etapa 1"},
+            headers=headers,
+        )
+        assert cached.status_code == 200, cached.text
+        assert cached.json()["cached"] is True
+        streamed = client.post(
+            f"/v1/aprs/{apr_id}/ai-steps/stream",
+            data={"descricao": f"Pintura de fachada {suffix} etapa 2"},
+            headers=headers,
+        )
+        assert streamed.status_code == 200, streamed.text
+        assert '"cached": true' in streamed.text
+        blocked_stream = client.post(
+            f"/v1/aprs/{apr_id}/ai-steps/stream",
+            data={"descricao": f"Pintura de fachada {suffix} etapa nova"},
+            headers=headers,
+        )
+        assert blocked_stream.status_code == 429, blocked_stream.text
+        assert blocked_stream.json()["code"] == "ai_quota_exceeded"
+        assert len(fake_gemini.requests) == 3
+
+        plan = client.get("/v1/account/plan", headers=headers)
+        assert plan.status_code == 200, plan.text
+        usage = plan.json()["usage"]
+        assert usage["ai_generations"] == 3
+        assert usage["ai_generations_limit"] == 3
+        assert usage["ai_period"] == ai_quota.current_period()
+        company_id = client.get("/auth/me", headers=headers).json()["company_id"]
+
+    # O shutdown do app grava o que estava acumulado em memoria.
+    db = SessionLocal()
+    try:
+        stored = db.execute(
+            select(AIUsage.count).where(
+                AIUsage.company_id == company_id,
+                AIUsage.period == ai_quota.current_period(),
+            )
+        ).scalar_one()
+    finally:
+        db.close()
+    assert stored == 3
+
+
+def test_ai_usage_flush_accumulates_increments():
+    with TestClient(app):
+        db = SessionLocal()
+        try:
+            company_id = db.execute(select(User.company_id).limit(1)).scalar_one()
+            before = ai_quota.get_usage(db, company_id, "2000-01")
+            for _ in range(2):
+                with ai_quota._LOCK:
+                    key = (company_id, "2000-01")
+                    ai_quota._PENDING[key] = ai_quota._PENDING.get(key, 0) + 1
+                assert ai_quota.flush_usage() == 1
+            assert ai_quota.get_usage(db, company_id, "2000-01") == before + 2
+        finally:
+            db.close()
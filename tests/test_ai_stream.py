@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+import ai_suggestions
+from main import app
+
+
+def test_step_extractor_handles_split_chunks():
+    extractor = ai_suggestions._StepStreamExtractor()
+    text = '```json\n{"steps":[{"description":"a \\"}\\" b","epis":["x"]},{"description":"c"}]}\n```'
+    found = []
+    for idx in range(0, len(text), 3):
+        found.extend(extractor.feed(text[idx : idx + 3]))
+    assert found == [{"description": 'a "}" b', "epis": ["x"]}, {"description": "c"}]
+
+
+def test_stream_generator_yields_validated_steps(fake_gemini):
+    async def run():
+        events = []
+        async for event in ai_suggestions.stream_ai_steps_from_image(
+            image_bytes=None,
+            image_mime=None,
+            descricao=f"Troca de luminaria {uuid4().hex[:8]}",
+            max_steps=6,
+            use_cache=False,
+        ):
+            events.append(event)
+        return events
+
+    events = asyncio.run(run())
+    assert [event["type"] for event in events] == ["step", "step", "done"]
+    assert events[1]["step"]["step_order"] == 2
+    assert events[1]["step"]["epis"] == ["Luvas isolantes", "Oculos de protecao"]
+    assert events[-1] == {"type": "done", "count": 2, "cached": False}
+    assert fake_gemini.requests[0]["path"].split("?")[0].endswith(":streamGenerateContent")
+
+
+def test_stream_endpoint_returns_ndjson_and_uses_cache(fake_gemini, apr_factory):
+    with TestClient(app) as client:
+        # Empresa nova por teste: cada uma tem a propria cota de IA do plano free.
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        descricao = f"Manutencao de quadro {uuid4().hex[:8]}"
+
+        response = client.post(
+            f"/v1/aprs/{apr_id}/ai-steps/stream",
+            data={"descricao": descricao, "max_steps": "1"},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines() if line]
+        assert [line["type"] for line in lines] == ["step", "done"]
+        assert lines[0]["step"]["description"] == "Isolar a area de trabalho"
+
+        again = client.post(
+            f"/v1/aprs/{apr_id}/ai-steps/stream",
+            data={"descricao": descricao, "max_steps": "1"},
+            headers=headers,
+        )
+        lines = [json.loads(line) for line in again.text.splitlines() if line]
+        assert lines[-1] == {"type": "done", "count": 1, "cached": True}
+        assert len(fake_gemini.requests) == 1
+
+
+def test_stream_endpoint_reports_errors_inline(fake_gemini, apr_factory):
+    fake_gemini.fail_next = [400]
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        response = client.post(
+            f"/v1/aprs/{apr_id}/ai-steps/stream",
+            data={"descricao": f"Solda em altura {uuid4().hex[:8]}"},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        lines = [json.loads(line) for line in response.text.splitlines() if line]
+        assert lines == [{"type": "error", "code": "ai_error", "message": "fake 400", "count": 0}]
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from database import SessionLocal
+from main import app
+from models import APR, Passo, PassoItem
+from risk_engine import rebuild_risk_items_for_apr
+
+
+def _create_apr(client: TestClient, headers: dict[str, str], apr_factory, steps: int) -> int:
+    apr_id = apr_factory.apr(client, headers, activity_name="Montagem")
+    # Passos direto na sessao: no SQLite o ORM insere linha a linha e a carga
+    # estouraria o orcamento de queries de uma request.
+    db = SessionLocal()
+    try:
+        company_id = db.get(APR, apr_id).company_id
+        for ordem in range(1, steps + 1):
+            db.add(
+                Passo(
+                    apr_id=apr_id,
+                    company_id=company_id,
+                    ordem=ordem,
+                    descricao=f"Passo {ordem}",
+                    perigos="Queda",
+                    riscos=f"Queda: lesao {ordem}; Corte {ordem}",
+                    medidas_controle="Linha de vida",
+                    epis="Capacete",
+                )
+            )
+        db.flush()
+        rebuild_risk_items_for_apr(db, apr_id)
+        db.commit()
+    finally:
+        db.close()
+    return apr_id
+
+
+def _item_count(apr_id: int) -> int:
+    db = SessionLocal()
+    try:
+        stmt = select(func.count()).select_from(PassoItem).join(Passo).where(Passo.apr_id == apr_id)
+        return db.execute(stmt).scalar_one()
+    finally:
+        db.close()
+
+
+def test_duplicate_requires_plan_feature(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client, plan="free")
+        apr_id = _create_apr(client, headers, apr_factory, steps=1)
+        response = client.post(f"/v1/aprs/{apr_id}/duplicate", headers=headers)
+        assert response.status_code == 403
+        assert response.json()["code"] == "plan_feature_unavailable"
+
+
+def test_duplicate_copies_steps_and_manual_scores_in_one_request(sql_queries, monkeypatch, apr_factory):
+    monkeypatch.setenv("CHANGE_FEED_SETTLE_SECONDS", "0")
+    with TestClient(app) as client:
+        headers = apr_factory.company(client, plan="pro")
+        apr_id = _create_apr(client, headers, apr_factory, steps=50)
+        source = client.get(f"/v1/aprs/{apr_id}", headers=headers).json()
+        manual = source["risk_items"][3]
+        patched = client.patch(
+            f"/v1/aprs/{apr_id}/risk-items/{manual['id']}",
+            json={"probability": 4, "severity": 5},
+            headers=headers,
+        )
+        assert patched.status_code == 200, patched.text
+
+        cursor = client.get("/v1/changes", headers=headers).json()["cursor"]
+
+        sql_queries.reset()
+        response = client.post(f"/v1/aprs/{apr_id}/duplicate", headers=headers)
+        assert response.status_code == 200, response.text
+        # Nao cresce com o numero de passos.
+        assert sql_queries.count < 20
+
+        copy = response.json()
+        assert copy["id"] != apr_id
+        assert copy["status"] == "rascunho"
+        assert copy["activity_name"] == "Montagem"
+        assert [p["ordem"] for p in copy["passos"]] == list(range(1, 51))
+        assert {p["apr_id"] for p in copy["passos"]} == {copy["id"]}
+        assert [r["risk_description"] for r in copy["risk_items"]] == [
+            r["risk_description"] for r in source["risk_items"]
+        ]
+        step_ids = {p["id"] for p in copy["passos"]}
+        assert {r["step_id"] for r in copy["risk_items"]} <= step_ids
+        copied_manual = copy["risk_items"][3]
+        assert (copied_manual["probability"], copied_manual["severity"]) == (4, 5)
+        assert copied_manual["score"] == patched.json()["score"]
+        assert _item_count(copy["id"]) == _item_count(apr_id)
+
+        # INSERT ... SELECT fica fora do flush, mas os filhos entram no feed.
+        feed = client.get("/v1/changes", params={"cursor": cursor, "limit": 1000}, headers=headers).json()
+        synced = {(c["entity"], c["id"]) for c in feed["changes"] if c["op"] == "upsert"}
+        assert ("apr", copy["id"]) in synced
+        assert {("passo", passo_id) for passo_id in step_ids} <= synced
+        assert {("risk_item", r["id"]) for r in copy["risk_items"]} <= synced
+
+        # Origem intacta.
+        assert len(client.get(f"/v1/aprs/{apr_id}", headers=headers).json()["passos"]) == 50
+
+
+def test_duplicate_shares_evidence_files_until_last_reference(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client, plan="pro")
+        apr_id = _create_apr(client, headers, apr_factory, steps=1)
+        passo_id = client.get(f"/v1/aprs/{apr_id}", headers=headers).json()["passos"][0]["id"]
+        uploaded = client.post(
+            f"/v1/aprs/{apr_id}/passos/{passo_id}/evidencia",
+            files={"file": ("foto.png", b"\x89PNG fake", "image/png")},
+            headers=headers,
+        )
+        assert uploaded.status_code == 200, uploaded.text
+
+        without = client.post(f"/v1/aprs/{apr_id}/duplicate", headers=headers).json()
+        assert without["passos"][0]["technical_evidence"] is None
+
+        copy = client.post(
+            f"/v1/aprs/{apr_id}/duplicate", json={"include_evidence": True}, headers=headers
+        ).json()
+        copy_passo = copy["passos"][0]
+        assert copy_passo["technical_evidence"]["url"] == (
+            f"/v1/aprs/{copy['id']}/passos/{copy_passo['id']}/evidencia"
+        )
+
+        removed = client.delete(f"/v1/aprs/{apr_id}/passos/{passo_id}/evidencia", headers=headers)
+        assert removed.status_code == 200
+        # A copia ainda referencia o arquivo.
+        download = client.get(f"/v1/aprs/{copy['id']}/passos/{copy_passo['id']}/evidencia", headers=headers)
+        assert download.status_code == 200
+        assert download.content == b"\x89PNG fake"
+
+        client.delete(f"/v1/aprs/{copy['id']}/passos/{copy_passo['id']}/evidencia", headers=headers)
+        gone = client.get(f"/v1/aprs/{copy['id']}/passos/{copy_passo['id']}/evidencia", headers=headers)
+        assert gone.status_code == 404
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from database import SessionLocal
+from main import app
+from models import APREvent
+
+
+def _seed_share_events(apr_id: int, count: int) -> None:
+    base = datetime(2026, 1, 1)
+    db = SessionLocal()
+    try:
+        db.execute(
+            insert(APREvent),
+            [
+                {
+                    "apr_id": apr_id,
+                    "event": "share_accessed",
+                    "payload": json.dumps({"n": n}),
+                    # Pares com o mesmo instante exercitam o desempate por id.
+                    "criado_em": base + timedelta(seconds=n // 2),
+                }
+                for n in range(count)
+            ],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_history_cursor_pagination_and_event_filter(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        _seed_share_events(apr_id, 25)
+
+        seen: list[int] = []
+        cursor = None
+        pages = 0
+        while True:
+            params = {"limit": 10, "event": "share_accessed"}
+            if cursor:
+                params["cursor"] = cursor
+            page = client.get(f"/v1/aprs/{apr_id}/history", params=params, headers=headers)
+            assert page.status_code == 200, page.text
+            seen.extend(item["payload"]["n"] for item in page.json())
+            pages += 1
+            cursor = page.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        assert pages == 3
+        assert seen == list(range(25))
+
+        created_only = client.get(
+            f"/v1/aprs/{apr_id}/history", params={"event": "created"}, headers=headers
+        )
+        assert [item["event"] for item in created_only.json()] == ["created"]
+
+        invalid = client.get(f"/v1/aprs/{apr_id}/history", params={"cursor": "???"}, headers=headers)
+        assert invalid.status_code == 400, invalid.text
+        assert invalid.json()["field"] == "cursor"
+
+
+def test_history_ndjson_stream(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        _seed_share_events(apr_id, 30)
+
+        response = client.get(
+            f"/v1/aprs/{apr_id}/history",
+            params={"format": "ndjson", "event": "share_accessed"},
+            headers=headers,
+        )
+
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert [line["payload"]["n"] for line in lines] == list(range(30))
+    assert "X-Next-Cursor" not in response.headers
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from main import app
+from models import APR
+
+
+def test_list_filters_by_checked_energy_in_database(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        electrical_id = apr_factory.apr(
+            client, headers, dangerous_energies_checklist={"electrical": True, "thermal": True}
+        )
+        apr_factory.apr(client, headers, dangerous_energies_checklist={"mechanical": True})
+
+        filtered = client.get("/v1/aprs", params={"energy": "electrical"}, headers=headers)
+        assert filtered.status_code == 200, filtered.text
+        assert filtered.json()["total"] == 1
+        item = filtered.json()["items"][0]
+        assert item["id"] == electrical_id
+
+        invalid = client.get("/v1/aprs", params={"energy": "nuclear"}, headers=headers)
+        assert invalid.status_code == 400, invalid.text
+        assert invalid.json()["field"] == "energy"
+
+
+def test_decoded_values_are_cached_until_reassigned():
+    apr = APR(titulo="Cache", risco="Baixo")
+    apr.hazards = [{"name": "queda"}, "ignorado"]
+
+    first = apr.hazards
+    assert first == [{"name": "queda"}]
+    assert apr.hazards is first
+
+    apr.hazards = [{"name": "choque"}]
+    assert apr.hazards == [{"name": "choque"}]
+
+    apr.dangerous_energies_checklist = '{"electrical": 1}'
+    assert apr.dangerous_energies_checklist["electrical"] is True
+    assert apr.dangerous_energies_checklist is apr.dangerous_energies_checklist
+    assert apr.controls == []
+
+
+def test_migration_normalizes_legacy_json_text_on_any_dialect():
+    path = Path(__file__).resolve().parents[1] / "alembic" / "versions" / "a7b8c9d0e1f2_apr_json_columns.py"
+    spec = importlib.util.spec_from_file_location("migration_apr_json_columns", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE aprs (id INTEGER PRIMARY KEY, hazards TEXT, controls TEXT, "
+                "dangerous_energies_checklist TEXT)"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO aprs VALUES (1, '', '[\"ok\"]', ''), (2, '{quebrado', NULL, 'sim'), "
+                "(3, '[]', '  ', '{\"electrical\": true}')"
+            )
+        )
+        names = [name for name, _ in migration.JSON_COLUMNS]
+        assert migration.normalize_legacy_json(conn, names) == 6
+        rows = conn.execute(text("SELECT * FROM aprs ORDER BY id")).all()
+    assert rows == [
+        (1, "[]", '["ok"]', None),
+        (2, "[]", "[]", None),
+        (3, "[]", "[]", '{"electrical": true}'),
+    ]
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from database import SessionLocal
+from main import app
+from models import Perigo
+
+
+def _steps(count: int) -> list[dict]:
+    return [
+        {
+            "step_order": ordem,
+            "description": f"Passo {ordem}",
+            "hazards": ["Altura"],
+            "risks": [f"Queda {ordem}", {"description": f"Impacto {ordem}", "probability": 2, "severity": 4}],
+            "measures": ["Linha de vida"],
+            "epis": ["Capacete"],
+        }
+        for ordem in range(1, count + 1)
+    ]
+
+
+def test_templates_require_plan_feature(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client, plan="free")
+        listed = client.get("/v1/templates", headers=headers)
+        assert listed.status_code == 403
+        assert listed.json()["code"] == "plan_feature_unavailable"
+        apr_id = apr_factory.apr(client, headers)
+        applied = client.post(f"/v1/aprs/{apr_id}/apply-template", json={"template_id": 1}, headers=headers)
+        assert applied.status_code == 403
+
+
+def test_template_crud_and_listing_etag(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client, plan="pro")
+        created = client.post(
+            "/v1/templates",
+            json={
+                "name": "Trabalho em altura",
+                "activity_name": "Montagem de andaime",
+                "dangerous_energies_checklist": {"gravitational_potential": True},
+                "steps": list(reversed(_steps(3))),
+            },
+            headers=headers,
+        )
+        assert created.status_code == 200, created.text
+        template = created.json()
+        assert (template["step_count"], template["risk_count"]) == (3, 6)
+        assert [step["ordem"] for step in template["steps"]] == [1, 2, 3]
+        assert template["steps"][0]["riscos"] == "Queda 1; Impacto 1"
+        manual = template["steps"][0]["risks"][1]
+        assert (manual["probability"], manual["severity"], manual["manual"]) == (2, 4, True)
+        assert template["dangerous_energies_checklist"]["gravitational_potential"] is True
+
+        duplicate = client.post(
+            "/v1/templates", json={"name": "Trabalho em altura", "steps": _steps(1)}, headers=headers
+        )
+        assert duplicate.status_code == 409
+
+        listed = client.get("/v1/templates", headers=headers)
+        assert listed.status_code == 200
+        assert [item["name"] for item in listed.json()] == ["Trabalho em altura"]
+        assert "steps" not in listed.json()[0]
+        cached = client.get("/v1/templates", headers={**headers, "If-None-Match": listed.headers["etag"]})
+        assert cached.status_code == 304
+
+        patched = client.patch(
+            f"/v1/templates/{template['id']}",
+            json={"name": "Altura", "steps": _steps(1)},
+            headers=headers,
+        )
+        assert patched.status_code == 200, patched.text
+        assert (patched.json()["name"], patched.json()["step_count"]) == ("Altura", 1)
+        # Energias mantidas quando o PATCH nao as envia.
+        assert patched.json()["dangerous_energies_checklist"]["gravitational_potential"] is True
+        relisted = client.get("/v1/templates", headers={**headers, "If-None-Match": listed.headers["etag"]})
+        assert relisted.status_code == 200
+        assert relisted.json()[0]["step_count"] == 1
+
+        other = apr_factory.company(client, plan="pro")
+        assert client.get(f"/v1/templates/{template['id']}", headers=other).status_code == 403
+        assert client.get("/v1/templates", headers=other).json() == []
+
+        assert client.delete(f"/v1/templates/{template['id']}", headers=headers).status_code == 200
+        assert client.get(f"/v1/templates/{template['id']}", headers=headers).status_code == 404
+
+
+def test_apply_template_bulk_inserts_steps_and_scores(sql_queries, apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client, plan="pro")
+        template = client.post(
+            "/v1/templates",
+            json={
+                "name": "Vinte passos",
+                "activity_id": "act-tpl",
+                "activity_name": "Atividade do modelo",
+                "steps": _steps(20),
+            },
+            headers=headers,
+        ).json()
+        apr_id = apr_factory.apr(client, headers)
+
+        sql_queries.reset()
+        applied = client.post(
+            f"/v1/aprs/{apr_id}/apply-template", json={"template_id": template["id"]}, headers=headers
+        )
+        assert applied.status_code == 200, applied.text
+        # Lotes: nao cresce com o numero de passos.
+        assert sql_queries.count < 25
+
+        apr = applied.json()
+        assert apr["activity_name"] == "Atividade do modelo"
+        assert [p["ordem"] for p in apr["passos"]] == list(range(1, 21))
+        assert len(apr["risk_items"]) == 40
+        impact = [r for r in apr["risk_items"] if r["risk_description"] == "Impacto 1"][0]
+        assert (impact["probability"], impact["severity"], impact["score"]) == (2, 4, 8)
+        assert impact["risk_level"] != "invalid"
+
+        appended = client.post(
+            f"/v1/aprs/{apr_id}/apply-template",
+            json={"template_id": template["id"], "replace": False},
+            headers=headers,
+        ).json()
+        assert [p["ordem"] for p in appended["passos"]] == list(range(1, 41))
+        assert len(appended["risk_items"]) == 80
+
+        replaced = client.post(
+            f"/v1/aprs/{apr_id}/apply-template", json={"template_id": template["id"]}, headers=headers
+        ).json()
+        assert len(replaced["passos"]) == 20
+        assert len(replaced["risk_items"]) == 40
+
+
+
+def test_template_scores_are_initial_values_until_risk_rebuild(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client, plan="pro")
+        template = client.post("/v1/templates", json={"name": "Um passo", "steps": _steps(1)}, headers=headers).json()
+        apr_id = apr_factory.apr(client, headers)
+        apr = client.post(
+            f"/v1/aprs/{apr_id}/apply-template", json={"template_id": template["id"]}, headers=headers
+        ).json()
+        passo_id = apr["passos"][0]["id"]
+
+        patched = client.patch(
+            f"/v1/aprs/{apr_id}/passos/{passo_id}", json={"descricao": "Passo editado"}, headers=headers
+        )
+        assert patched.status_code == 200, patched.text
+        detail = client.get(f"/v1/aprs/{apr_id}", headers=headers).json()
+        risks = {r["risk_description"]: r for r in detail["risk_items"]}
+        # Mesmo perigo, mesmo padrao do catalogo: o 2x4 do modelo nao sobrevive ao rebuild.
+        assert (risks["Impacto 1"]["probability"], risks["Impacto 1"]["severity"]) == (
+            risks["Queda 1"]["probability"],
+            risks["Queda 1"]["severity"],
+        )
+
+def test_template_from_apr_keeps_scores_and_recompiles_on_catalog_change(apr_factory):
+    hazard_name = f"Perigo modelo {uuid4().hex[:6]}"
+    with TestClient(app) as client:
+        headers = apr_factory.company(client, plan="pro")
+        source_id = apr_factory.apr(client, headers)
+        step = client.post(
+            f"/v1/aprs/{source_id}/passos",
+            json={"ordem": 1, "descricao": "Soldar", "perigos": hazard_name, "riscos": "Queimadura"},
+            headers=headers,
+        )
+        assert step.status_code == 200, step.text
+        risk_id = client.get(f"/v1/aprs/{source_id}", headers=headers).json()["risk_items"][0]["id"]
+        client.patch(
+            f"/v1/aprs/{source_id}/risk-items/{risk_id}", json={"probability": 3, "severity": 3}, headers=headers
+        )
+
+        from_apr = client.post(
+            "/v1/templates", json={"name": "Da APR", "source_apr_id": source_id}, headers=headers
+        )
+        assert from_apr.status_code == 200, from_apr.text
+        risk = from_apr.json()["steps"][0]["risks"][0]
+        assert (risk["probability"], risk["severity"], risk["manual"]) == (3, 3, True)
+
+        plain = client.post(
+            "/v1/templates",
+            json={
+                "name": "Catalogo",
+                "steps": [
+                    {"step_order": 1, "description": "Soldar", "hazards": [hazard_name], "risks": ["Queimadura"]}
+                ],
+            },
+            headers=headers,
+        ).json()
+        assert plain["steps"][0]["risks"][0]["hazard_id"] is None
+
+        db = SessionLocal()
+        try:
+            perigo = Perigo(perigo=hazard_name, default_probability=2, default_severity=3)
+            db.add(perigo)
+            db.commit()
+            perigo_id = perigo.id
+        finally:
+            db.close()
+
+        apr_id = apr_factory.apr(client, headers)
+        applied = client.post(
+            f"/v1/aprs/{apr_id}/apply-template", json={"template_id": plain["id"]}, headers=headers
+        )
+        assert applied.status_code == 200, applied.text
+        risk_item = applied.json()["risk_items"][0]
+        assert (risk_item["hazard_id"], risk_item["probability"], risk_item["severity"]) == (perigo_id, 2, 3)
+        # Recompilado e regravado: a proxima aplicacao ja usa o documento novo.
+        recompiled = client.get(f"/v1/templates/{plain['id']}", headers=headers).json()
+        assert recompiled["steps"][0]["risks"][0]["hazard_id"] == perigo_id
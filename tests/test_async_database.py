@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import asyncio
+from uuid import uuid4
+
+import httpx
+from fastapi.testclient import TestClient
+
+from async_database import to_async_url
+from main import app
+
+
+def test_async_url_swaps_driver_and_ssl_parameter():
+    assert to_async_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert (
+        to_async_url("postgresql+psycopg2://u:p@db.example.com:5432/apr?sslmode=require")
+        == "postgresql+asyncpg://u:p@db.example.com:5432/apr?ssl=require"
+    )
+
+
+def test_concurrent_async_reads_share_one_session_per_request():
+    with TestClient(app) as client:
+        suffix = uuid4().hex[:8]
+        company = client.post(
+            "/companies",
+            json={
+                "name": f"Empresa Async {suffix}",
+                "admin_email": f"async.{suffix}@example.com",
+                "admin_password": "Senha1234",
+                "admin_name": "Admin",
+            },
+        )
+        assert company.status_code == 200, company.text
+        headers = {"Authorization": f"Bearer {company.json()['token']}"}
+
+        async def _burst() -> list[int]:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as http:
+                # Mais requests simultaneas que o pool (5 + 10): com duas
+                # sessoes por request isso travaria ate o pool_timeout.
+                responses = await asyncio.wait_for(
+                    asyncio.gather(*(http.get("/v1/aprs") for _ in range(40))), timeout=20
+                )
+            return [response.status_code for response in responses]
+
+        statuses = asyncio.run(_burst())
+
+    assert statuses == [200] * 40
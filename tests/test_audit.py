@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+
+from audit import record_event
+from database import SessionLocal, engine
+from main import app
+from models import APR, APREvent, APRShare
+
+EXPORTS_DIR = Path(__file__).resolve().parent.parent / "exports"
+
+
+def _capture_statements():
+    statements: list[str] = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", _before)
+
+
+def test_events_are_buffered_and_inserted_in_one_batch(apr_factory):
+    with TestClient(app) as client:
+        apr_id = apr_factory.apr(client, apr_factory.company(client))
+    db = SessionLocal()
+    try:
+        apr = db.get(APR, apr_id)
+        company_id = apr.company_id
+        marker = uuid4().hex
+
+        statements, stop = _capture_statements()
+        try:
+            record_event(db, apr_id, company_id, "audit_test", {"marker": marker, "n": 1})
+            record_event(db, apr_id, company_id, "audit_test", {"marker": marker, "n": 2})
+            db.commit()
+        finally:
+            stop()
+
+        inserts = [s for s in statements if s.lstrip().upper().startswith("INSERT INTO APR_EVENTS")]
+        assert len(inserts) == 1
+        assert not [s for s in statements if "FROM aprs" in s]
+
+        rows = db.execute(
+            select(APREvent).where(APREvent.event == "audit_test", APREvent.payload.contains(marker))
+        ).scalars().all()
+        assert sorted(json.loads(row.payload)["n"] for row in rows) == [1, 2]
+        assert {row.company_id for row in rows} == {company_id}
+
+        record_event(db, apr_id, company_id, "audit_discarded", {"marker": marker})
+        db.rollback()
+        db.commit()
+        assert not db.execute(
+            select(APREvent).where(APREvent.event == "audit_discarded", APREvent.payload.contains(marker))
+        ).scalars().all()
+    finally:
+        db.close()
+
+
+def test_share_access_records_event_without_loading_apr(apr_factory):
+    token = uuid4().hex
+    filename = f"audit_{token}.pdf"
+    with TestClient(app) as client:
+        apr_id = apr_factory.apr(client, apr_factory.company(client))
+
+        db = SessionLocal()
+        try:
+            apr = db.get(APR, apr_id)
+            apr.status = "final"
+            company_id = apr.company_id
+            db.add(APRShare(apr_id=apr_id, company_id=company_id, token=token, filename=filename))
+            db.commit()
+        finally:
+            db.close()
+
+        EXPORTS_DIR.mkdir(exist_ok=True)
+        pdf_path = EXPORTS_DIR / filename
+        pdf_path.write_bytes(b"%PDF-1.4 teste")
+        statements, stop = _capture_statements()
+        try:
+            response = client.get(f"/share/{token}")
+        finally:
+            stop()
+            pdf_path.unlink(missing_ok=True)
+
+    assert response.status_code == 200, response.text
+    assert not [s for s in statements if "FROM passos" in s or "FROM apr_events" in s]
+
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(APREvent).where(APREvent.apr_id == apr_id, APREvent.event == "share_accessed")
+        ).scalars().all()
+    finally:
+        db.close()
+    assert len(rows) == 1
+    assert rows[0].company_id == company_id
+    assert json.loads(rows[0].payload) == {"token": token}
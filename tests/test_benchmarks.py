@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from benchmarks.compare import compare_results
+from benchmarks.datagen import DatasetSpec, hazard_name
+from benchmarks.runner import SCENARIOS, run_benchmarks
+from database import SessionLocal
+from main import app
+
+SMALL = DatasetSpec(
+    companies=2,
+    users_per_company=1,
+    aprs_per_company=4,
+    steps_per_apr=3,
+    evidence_ratio=0.0,
+    hazards=40,
+    epis=20,
+)
+
+
+def test_runner_emits_json_results_for_hot_paths():
+    scenarios = ["auth_resolution", "apr_detail", "step_update", "finalize", "catalog_search"]
+    with TestClient(app) as client:
+        result = run_benchmarks(client, SessionLocal, SMALL, scenarios=scenarios, iterations=2, warmup=1)
+
+    assert result["meta"]["dataset"]["hazards"] == 40
+    assert result["meta"]["database"] == "sqlite"
+    assert set(result["results"]) == set(scenarios)
+    for name, stats in result["results"].items():
+        assert stats["errors"] == 0, (name, stats["first_error"])
+        assert stats["iterations"] == 2
+        assert stats["p95_ms"] >= stats["p50_ms"] > 0
+        assert stats["queries"] and stats["queries"] > 0
+
+
+def test_all_documented_scenarios_are_registered():
+    assert {
+        "auth_resolution",
+        "apr_detail",
+        "step_add",
+        "step_update",
+        "finalize",
+        "pdf_render",
+        "activity_suggestions",
+        "catalog_search",
+        "excel_import",
+        "apr_detail_200",
+        "apr_serialize_200",
+        "apr_serialize_200_dict",
+        "apr_serialize_200_stdlib",
+    } <= set(SCENARIOS)
+    # Largura fixa: o casamento risco -> perigo por substring nao pode ser ambiguo.
+    assert hazard_name(1) not in hazard_name(10)
+
+
+def _result(**scenarios) -> dict:
+    return {"results": scenarios}
+
+
+def test_compare_flags_latency_query_and_error_regressions():
+    baseline = _result(
+        detail={"p50_ms": 10.0, "queries": 6, "errors": 0},
+        search={"p50_ms": 5.0, "queries": 3, "errors": 0},
+        auth={"p50_ms": 2.0, "queries": 2, "errors": 0},
+        pdf={"p50_ms": 80.0, "queries": 60, "errors": 0},
+    )
+    current = _result(
+        detail={"p50_ms": 13.0, "queries": 6, "errors": 0},
+        search={"p50_ms": 5.1, "queries": 4, "errors": 0},
+        auth={"p50_ms": 2.6, "queries": 2, "errors": 0},
+        pdf={"p50_ms": 70.0, "queries": 60, "errors": 2},
+    )
+
+    by_name = {item.scenario: item for item in compare_results(baseline, current, threshold=0.2)}
+
+    assert by_name["detail"].regression
+    assert by_name["search"].regression and "queries" in by_name["search"].reason
+    # +30% mas abaixo do piso de ruido (1ms).
+    assert not by_name["auth"].regression
+    assert by_name["pdf"].regression and "erros" in by_name["pdf"].reason
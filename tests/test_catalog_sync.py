@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import os
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+import catalog_sync
+from database import SessionLocal
+from main import app
+from models import EPI, User
+
+ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", "integration@example.com")
+
+
+def _admin_headers() -> dict[str, str]:
+    db = SessionLocal()
+    try:
+        token = db.execute(select(User.api_token).where(User.email == ADMIN_EMAIL)).scalar_one()
+    finally:
+        db.close()
+    return {"X-API-Token": token}
+
+
+def test_parse_version():
+    assert str(catalog_sync.parse_version("3.7.ab12cd34")) == "3.7.ab12cd34"
+    assert catalog_sync.parse_version("3.7") is None
+    assert catalog_sync.parse_version("x.7.ab") is None
+    assert catalog_sync.parse_version("-1.7.ab") is None
+    assert catalog_sync.parse_version(None) is None
+
+
+def test_snapshot_is_prebuilt_gzip_and_revalidates(monkeypatch):
+    with TestClient(app) as client:
+        headers = _admin_headers()
+        response = client.get("/v1/catalogs/snapshot", headers={**headers, "Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"] == "application/json; charset=utf-8"
+        document = response.json()
+        assert document["version"] == response.headers["x-catalog-version"]
+        catalogs = document["catalogs"]
+        assert set(catalogs) == {"epis", "hazards", "activities"}
+        assert catalogs["epis"]["items"] and catalogs["hazards"]["items"]
+        assert {"id", "name"} <= set(catalogs["epis"]["items"][0])
+        activity = catalogs["activities"]["items"][0]
+        assert {"id", "name", "steps"} <= set(activity)
+
+        plain = client.get("/v1/catalogs/snapshot", headers={**headers, "Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        assert plain.json() == document
+
+        # O 304 sai so dos contadores, sem montar o snapshot.
+        def _no_snapshot(*args, **kwargs):
+            raise AssertionError("snapshot montado para um 304")
+
+        monkeypatch.setattr(catalog_sync, "get_snapshot", _no_snapshot)
+        cached = client.get(
+            "/v1/catalogs/snapshot", headers={**headers, "If-None-Match": response.headers["etag"]}
+        )
+        assert cached.status_code == 304
+        assert cached.headers["x-catalog-version"] == document["version"]
+
+
+def test_delta_returns_upserts_and_tombstones_since_version():
+    with TestClient(app) as client:
+        headers = _admin_headers()
+        version = client.get("/v1/catalogs/snapshot", headers=headers).headers["x-catalog-version"]
+
+        empty = client.get("/v1/catalogs/changes", params={"since": version}, headers=headers).json()
+        assert empty["version"] == version
+        assert empty["full_sync_required"] is False
+        assert empty["catalogs"]["epis"] == {"upserts": [], "deleted": []}
+        assert empty["catalogs"]["activities"] is None
+
+        name = f"EPI offline {uuid4().hex[:8]}"
+        db = SessionLocal()
+        try:
+            epi = EPI(epi=name)
+            db.add(epi)
+            db.commit()
+            epi_id = epi.id
+        finally:
+            db.close()
+
+        delta = client.get("/v1/catalogs/changes", params={"since": version}, headers=headers).json()
+        assert delta["version"] != version
+        assert [item["name"] for item in delta["catalogs"]["epis"]["upserts"]] == [name]
+        assert delta["catalogs"]["hazards"] == {"upserts": [], "deleted": []}
+
+        after_insert = delta["version"]
+        db = SessionLocal()
+        try:
+            db.delete(db.get(EPI, epi_id))
+            db.commit()
+        finally:
+            db.close()
+        removed = client.get("/v1/catalogs/changes", params={"since": after_insert}, headers=headers).json()
+        assert removed["catalogs"]["epis"] == {"upserts": [], "deleted": [epi_id]}
+
+        # Snapshot novo reflete a versao nova.
+        snapshot = client.get("/v1/catalogs/snapshot", headers=headers)
+        assert snapshot.headers["x-catalog-version"] == removed["version"]
+        assert epi_id not in {item["id"] for item in snapshot.json()["catalogs"]["epis"]["items"]}
+
+
+def test_delta_rejects_invalid_and_future_versions():
+    with TestClient(app) as client:
+        headers = _admin_headers()
+        invalid = client.get("/v1/catalogs/changes", params={"since": "abc"}, headers=headers)
+        assert invalid.status_code == 400
+        assert invalid.json()["field"] == "since"
+
+        future = client.get("/v1/catalogs/changes", params={"since": "999999.0.ab"}, headers=headers).json()
+        assert future["full_sync_required"] is True
+        assert future["catalogs"] is None
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+
+import change_feed
+from database import SessionLocal
+from main import app
+from models import ChangeLogEntry
+
+
+def _feed(client: TestClient, headers: dict[str, str], **params) -> dict:
+    response = client.get("/v1/changes", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _by_entity(feed: dict) -> dict[str, list[dict]]:
+    grouped: dict[str, list[dict]] = {}
+    for change in feed["changes"]:
+        grouped.setdefault(change["entity"], []).append(change)
+    return grouped
+
+
+def test_feed_returns_upserts_and_tombstones_per_company(monkeypatch, apr_factory):
+    monkeypatch.setenv("CHANGE_FEED_SETTLE_SECONDS", "0")
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        other = apr_factory.company(client)
+
+        start = _feed(client, headers)
+        assert start["full_sync_required"] is True
+        cursor = start["cursor"]
+        other_cursor = _feed(client, other)["cursor"]
+
+        apr_id = apr_factory.apr(client, headers, activity_name="Feed")
+        step = client.post(
+            f"/v1/aprs/{apr_id}/passos",
+            json={
+                "ordem": 1,
+                "descricao": "Passo",
+                "perigos": "Queda",
+                "riscos": "Queda: lesao; Queda: corte",
+                "epis": "Capacete",
+            },
+            headers=headers,
+        )
+        assert step.status_code == 200, step.text
+        passo_id = step.json()["id"]
+
+        created = _feed(client, headers, cursor=cursor)
+        assert created["full_sync_required"] is False
+        assert created["cursor"] > cursor
+        grouped = _by_entity(created)
+        assert [(c["id"], c["op"]) for c in grouped["apr"]] == [(apr_id, "upsert")]
+        assert grouped["apr"][0]["data"]["activity_name"] == "Feed"
+        assert [(c["id"], c["op"]) for c in grouped["passo"]] == [(passo_id, "upsert")]
+        old_risks = {c["id"] for c in grouped["risk_item"] if c["op"] == "upsert"}
+        assert len(old_risks) == 2
+        assert all(c["apr_id"] == apr_id for c in created["changes"])
+
+        # Editar o passo reconstroi os riscos: o que sobrou vira tombstone.
+        cursor = created["cursor"]
+        patched = client.patch(
+            f"/v1/aprs/{apr_id}/passos/{passo_id}", json={"riscos": "Queda: fratura"}, headers=headers
+        )
+        assert patched.status_code == 200, patched.text
+        grouped = _by_entity(_feed(client, headers, cursor=cursor))
+        assert grouped["passo"][0]["data"]["riscos"] == "Queda: fratura"
+        risks = grouped["risk_item"]
+        assert [c["data"]["risk_description"] for c in risks if c["op"] == "upsert"] == ["Queda: fratura"]
+        assert [c["op"] for c in risks].count("delete") == 1
+
+        # Sem mudanca nos riscos: o rebuild nao reescreve nada.
+        cursor = _feed(client, headers, cursor=cursor)["cursor"]
+        renamed = client.patch(
+            f"/v1/aprs/{apr_id}/passos/{passo_id}", json={"descricao": "Passo renomeado"}, headers=headers
+        )
+        assert renamed.status_code == 200, renamed.text
+        grouped = _by_entity(_feed(client, headers, cursor=cursor))
+        assert [(c["id"], c["op"]) for c in grouped["passo"]] == [(passo_id, "upsert")]
+        assert "risk_item" not in grouped
+
+        cursor = _feed(client, headers, cursor=cursor)["cursor"]
+        deleted = client.delete(f"/v1/aprs/{apr_id}/passos/{passo_id}", headers=headers)
+        assert deleted.status_code in (200, 204), deleted.text
+        grouped = _by_entity(_feed(client, headers, cursor=cursor))
+        assert [(c["id"], c["op"], c["data"]) for c in grouped["passo"]] == [(passo_id, "delete", None)]
+
+        # Outra empresa nao ve nada disso.
+        assert _feed(client, other, cursor=other_cursor)["changes"] == []
+
+
+def test_feed_pages_and_waits_for_settle_window(monkeypatch, apr_factory):
+    monkeypatch.setenv("CHANGE_FEED_SETTLE_SECONDS", "0")
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        cursor = _feed(client, headers)["cursor"]
+        for _ in range(3):
+            apr_factory.apr(client, headers)
+
+        first = _feed(client, headers, cursor=cursor, limit=2)
+        assert first["has_more"] is True
+        assert len(first["changes"]) == 2
+        second = _feed(client, headers, cursor=first["cursor"], limit=2)
+        assert second["has_more"] is False
+        assert len(second["changes"]) == 1
+
+        monkeypatch.setenv("CHANGE_FEED_SETTLE_SECONDS", "3600")
+        apr_factory.apr(client, headers)
+        settling = _feed(client, headers, cursor=second["cursor"])
+        assert settling["changes"] == []
+        assert settling["cursor"] == second["cursor"]
+
+
+def test_bulk_delete_takes_ids_from_returning(sql_queries, apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        passo_id = client.post(
+            f"/v1/aprs/{apr_id}/passos",
+            json={"ordem": 1, "descricao": "Passo", "perigos": "Queda", "riscos": "Queda: lesao"},
+            headers=headers,
+        ).json()["id"]
+        sql_queries.reset()
+        patched = client.patch(
+            f"/v1/aprs/{apr_id}/passos/{passo_id}", json={"riscos": "Queda: fratura"}, headers=headers
+        )
+        assert patched.status_code == 200, patched.text
+
+    deletes = [s for s in sql_queries.statements if s.lstrip().upper().startswith("DELETE FROM RISK_ITEMS")]
+    assert deletes and all("RETURNING" in s.upper() for s in deletes)
+    # Sem SELECT dos riscos so para registrar o delete.
+    selects = [s for s in sql_queries.statements if s.upper().startswith("SELECT RISK_ITEMS.ID, RISK_ITEMS.APR_ID")]
+    assert selects == []
+
+
+def test_pruned_change_log_asks_stale_cursors_for_full_sync(monkeypatch, apr_factory):
+    monkeypatch.setenv("CHANGE_FEED_SETTLE_SECONDS", "0")
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        stale = _feed(client, headers)["cursor"]
+        for _ in range(3):
+            apr_factory.apr(client, headers)
+        company_id = client.get("/auth/me", headers=headers).json()["company_id"]
+
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(ChangeLogEntry)
+                .where(ChangeLogEntry.company_id == company_id)
+                .values(created_at=datetime.utcnow() - timedelta(days=40))
+            )
+            assert change_feed.prune_change_log(db, days=30) == 2
+            db.commit()
+            ops = db.execute(
+                select(ChangeLogEntry.op).where(ChangeLogEntry.company_id == company_id)
+            ).scalars().all()
+        finally:
+            db.close()
+        assert ops == [change_feed.PRUNED]
+
+        behind = _feed(client, headers, cursor=stale)
+        assert behind["full_sync_required"] is True
+        assert behind["changes"] == []
+
+        apr_id = apr_factory.apr(client, headers)
+        caught_up = _feed(client, headers, cursor=behind["cursor"])
+        assert caught_up["full_sync_required"] is False
+        assert [(c["entity"], c["id"]) for c in caught_up["changes"]] == [("apr", apr_id)]
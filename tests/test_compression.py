@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import logging
+import zlib
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, is_compressible, negotiate
+from main import app
+
+
+def _run(middleware: CompressionMiddleware, accept_encoding: str = "gzip") -> list[dict]:
+    sent: list[dict] = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", accept_encoding.encode("latin-1"))],
+    }
+    asyncio.run(middleware(scope, receive, send))
+    return sent
+
+
+def _app(chunks: list[bytes], content_type: bytes = b"application/json", extra_headers=()):
+    async def inner(scope, receive, send):
+        headers = [(b"content-type", content_type), *extra_headers]
+        if len(chunks) == 1:
+            headers.append((b"content-length", str(len(chunks[0])).encode("ascii")))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for n, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": n < len(chunks) - 1})
+
+    return inner
+
+
+def _headers(message: dict) -> dict[str, str]:
+    return {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in message["headers"]}
+
+
+def test_negotiate_respects_quality_and_brotli_availability():
+    assert negotiate("gzip, deflate, br", brotli_available=True) == "br"
+    assert negotiate("gzip, deflate, br", brotli_available=False) == "gzip"
+    assert negotiate("br;q=0.5, gzip", brotli_available=True) == "gzip"
+    assert negotiate("gzip;q=0, identity") is None
+    assert negotiate("*", brotli_available=False) == "gzip"
+    assert negotiate("") is None
+    assert is_compressible("application/json; charset=utf-8")
+    assert not is_compressible("application/pdf")
+    assert not is_compressible("image/jpeg")
+
+
+def test_compresses_above_threshold_and_skips_small_or_binary_bodies():
+    body = b'{"passos": [' + b",".join(b'{"descricao": "Passo %d"}' % n for n in range(200)) + b"]}"
+    start, message = _run(CompressionMiddleware(_app([body]), minimum_size=500))
+    headers = _headers(start)
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(message["body"]) < len(body)
+    assert gzip.decompress(message["body"]) == body
+
+    start, message = _run(CompressionMiddleware(_app([b'{"ok": true}']), minimum_size=500))
+    assert "content-encoding" not in _headers(start)
+    assert message["body"] == b'{"ok": true}'
+
+    pdf = b"%PDF-1.4" + b"0" * 5000
+    start, message = _run(CompressionMiddleware(_app([pdf], b"application/pdf"), minimum_size=500))
+    assert "content-encoding" not in _headers(start)
+    assert message["body"] == pdf
+
+    start, _ = _run(
+        CompressionMiddleware(_app([body], extra_headers=[(b"cache-control", b"no-transform")]), minimum_size=500)
+    )
+    assert "content-encoding" not in _headers(start)
+
+    start, _ = _run(CompressionMiddleware(_app([body]), minimum_size=500), accept_encoding="identity")
+    assert "content-encoding" not in _headers(start)
+
+
+def test_streaming_chunks_are_flushed_as_they_arrive():
+    lines = [b'{"type": "event", "n": %d}\n' % n for n in range(3)]
+    sent = _run(CompressionMiddleware(_app(lines, b"application/x-ndjson"), minimum_size=10))
+    start, *bodies = sent
+    headers = _headers(start)
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert [message["more_body"] for message in bodies] == [True, True, False]
+
+    decoder = zlib.decompressobj(31)
+    # Cada pedaco ja decodifica sozinho: o cliente nao espera o fim do stream.
+    assert decoder.decompress(bodies[0]["body"]) == lines[0]
+    assert decoder.decompress(bodies[1]["body"]) == lines[1]
+    assert decoder.decompress(bodies[2]["body"]) + decoder.flush() == lines[2]
+
+
+def test_api_responses_are_compressed_and_logged(caplog):
+    with TestClient(app) as client:
+        suffix = uuid4().hex[:8]
+        created = client.post(
+            "/companies",
+            json={
+                "name": f"Empresa Gzip {suffix}",
+                "admin_email": f"gzip.{suffix}@example.com",
+                "admin_password": "Senha1234",
+                "admin_name": "Admin",
+            },
+        )
+        assert created.status_code == 200, created.text
+        headers = {"Authorization": f"Bearer {created.json()['token']}"}
+
+        with caplog.at_level(logging.INFO, logger="main"):
+            response = client.get("/v1/contract", headers={**headers, "Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"] == "application/json; charset=utf-8"
+        assert response.json()
+
+        plain = client.get("/v1/contract", headers={**headers, "Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        assert plain.json() == response.json()
+
+    line = next(record.getMessage() for record in caplog.records if "route=/v1/contract" in record.getMessage())
+    fields = dict(part.split("=", 1) for part in line.split() if "=" in part)
+    assert fields["encoding"] == "gzip"
+    assert int(fields["bytes"]) < int(fields["raw_bytes"]) == len(plain.content)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+import ai_suggestions
+from gemini_client import GeminiClient, GeminiHTTPError
+
+
+def test_client_reuses_pooled_connection(fake_gemini):
+    client = GeminiClient()
+
+    async def run():
+        try:
+            for _ in range(3):
+                await client.generate_content({"contents": []})
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert len(fake_gemini.requests) == 3
+    assert fake_gemini.requests[0]["path"].endswith(":generateContent")
+    assert len(fake_gemini.client_ports) == 1
+
+
+def test_client_retries_retryable_status(fake_gemini, monkeypatch):
+    monkeypatch.setenv("GEMINI_HTTP_ATTEMPTS", "3")
+    fake_gemini.fail_next = [503, 429]
+    client = GeminiClient()
+
+    async def run():
+        try:
+            return await client.generate_content({"contents": []})
+        finally:
+            await client.aclose()
+
+    result = asyncio.run(run())
+    assert result["candidates"]
+    assert len(fake_gemini.requests) == 3
+
+
+def test_client_does_not_retry_client_errors(fake_gemini):
+    fake_gemini.fail_next = [400]
+    client = GeminiClient()
+
+    async def run():
+        try:
+            await client.generate_content({"contents": []})
+        finally:
+            await client.aclose()
+
+    with pytest.raises(GeminiHTTPError) as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.status_code == 400
+    assert len(fake_gemini.requests) == 1
+
+
+def test_client_limits_concurrent_calls(fake_gemini, monkeypatch):
+    monkeypatch.setenv("GEMINI_MAX_CONCURRENCY", "2")
+    fake_gemini.delay = 0.1
+    client = GeminiClient()
+
+    async def run():
+        try:
+            await asyncio.gather(*(client.generate_content({"contents": []}) for _ in range(6)))
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert len(fake_gemini.requests) == 6
+    assert fake_gemini.max_in_flight <= 2
+
+
+def test_generate_ai_steps_from_image_uses_async_client(fake_gemini):
+    result = asyncio.run(
+        ai_suggestions.generate_ai_steps_from_image(
+            image_bytes=None,
+            image_mime=None,
+            descricao="Troca de lampada em escada",
+            max_steps=3,
+            use_cache=False,
+        )
+    )
+    assert result["steps"][0]["hazard"] == "Queda de materiais"
+    assert result["steps"][0]["epis"] == ["Capacete"]
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import os
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from database import SessionLocal
+from http_cache import etag_matches, make_etag
+from main import app
+from models import EPI, User
+
+ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", "integration@example.com")
+
+
+def _admin_headers() -> dict[str, str]:
+    db = SessionLocal()
+    try:
+        token = db.execute(select(User.api_token).where(User.email == ADMIN_EMAIL)).scalar_one()
+    finally:
+        db.close()
+    return {"X-API-Token": token}
+
+
+def _revalidate(client: TestClient, url: str, headers: dict[str, str], etag: str):
+    return client.get(url, headers={**headers, "If-None-Match": etag})
+
+
+def test_etag_matching_rules():
+    etag = make_etag("apr", 1, "2026-01-01")
+    assert etag.startswith('W/"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(etag[2:], etag)
+    assert etag_matches(f'"outro", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('W/"outro"', etag)
+    assert not etag_matches(None, etag)
+    assert make_etag("apr", 1, "2026-01-02") != etag
+
+
+def test_apr_detail_revalidates_without_loading_children(sql_queries, apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        url = f"/v1/aprs/{apr_id}"
+        step = client.post(
+            f"{url}/passos",
+            json={"ordem": 1, "descricao": "Passo", "perigos": "Queda", "riscos": "Queda: lesao", "epis": "Capacete"},
+            headers=headers,
+        )
+        assert step.status_code == 200, step.text
+        passo_id = step.json()["id"]
+
+        first = client.get(url, headers=headers)
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "private, no-cache"
+
+        sql_queries.reset()
+        cached = _revalidate(client, url, headers, etag)
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+        # Token + validador; passos, itens e riscos nao sao carregados.
+        assert sql_queries.count == 2
+        assert not any("passos.descricao" in statement for statement in sql_queries.statements)
+
+        # Outra empresa nao descobre nada pelo ETag.
+        other = apr_factory.company(client)
+        assert _revalidate(client, url, other, etag).status_code == 403
+
+        # Filho alterado (passo) muda o validador.
+        patched = client.patch(f"{url}/passos/{passo_id}", json={"descricao": "Passo revisado"}, headers=headers)
+        assert patched.status_code == 200, patched.text
+        changed = _revalidate(client, url, headers, etag)
+        assert changed.status_code == 200
+        assert changed.json()["passos"][0]["descricao"] == "Passo revisado"
+        assert changed.headers["etag"] != etag
+
+        etag = changed.headers["etag"]
+        deleted = client.delete(f"{url}/passos/{passo_id}", headers=headers)
+        assert deleted.status_code in (200, 204), deleted.text
+        after_delete = _revalidate(client, url, headers, etag)
+        assert after_delete.status_code == 200
+        assert after_delete.json()["passos"] == []
+
+
+def test_catalog_lists_use_version_counter():
+    with TestClient(app) as client:
+        headers = _admin_headers()
+        epis = client.get("/v1/epis", headers=headers)
+        perigos = client.get("/v1/perigos", headers=headers, params={"limit": 1})
+        assert epis.status_code == perigos.status_code == 200
+        epis_etag, perigos_etag = epis.headers["etag"], perigos.headers["etag"]
+        assert _revalidate(client, "/v1/epis", headers, epis_etag).status_code == 304
+
+        perigo = perigos.json()["items"][0]
+        probability = 2 if perigo["default_probability"] == 1 else 1
+        patched = client.patch(
+            f"/v1/perigos/{perigo['id']}", json={"default_probability": probability}, headers=headers
+        )
+        assert patched.status_code == 200, patched.text
+        assert _revalidate(client, "/v1/perigos?limit=1", headers, perigos_etag).status_code == 200
+        assert _revalidate(client, "/v1/epis", headers, epis_etag).status_code == 304
+
+        db = SessionLocal()
+        try:
+            db.add(EPI(epi=f"EPI ETag {uuid4().hex[:8]}"))
+            db.commit()
+        finally:
+            db.close()
+        assert _revalidate(client, "/v1/epis", headers, epis_etag).status_code == 200
+
+
+def test_activities_etag_follows_spreadsheet():
+    with TestClient(app) as client:
+        headers = _admin_headers()
+        first = client.get("/v1/activities", headers=headers)
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        assert _revalidate(client, "/v1/activities", headers, etag).status_code == 304
+        assert _revalidate(client, "/v1/activities", headers, 'W/"velho"').status_code == 200
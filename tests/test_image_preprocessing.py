@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import io
+
+import pytest
+from PIL import Image
+
+from image_preprocessing import (
+    ImageRejectedError,
+    detect_image_format,
+    get_image_stats,
+    prepare_image_for_ai,
+)
+
+
+def _jpeg_with_exif(size: tuple[int, int]) -> bytes:
+    image = Image.effect_noise(size, 60).convert("RGB")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: girar 90 graus
+    exif[0x010F] = "Fabricante Teste"
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=98, exif=exif)
+    return out.getvalue()
+
+
+def test_large_jpeg_is_resized_rotated_and_stripped(monkeypatch):
+    monkeypatch.setenv("AI_IMAGE_MAX_DIMENSION", "512")
+    raw = _jpeg_with_exif((2000, 1000))
+    before = get_image_stats()
+
+    prepared = prepare_image_for_ai(raw)
+
+    assert prepared.mime == "image/jpeg"
+    assert prepared.resized is True
+    # EXIF orientation 6 troca largura e altura.
+    assert (prepared.width, prepared.height) == (256, 512)
+    assert prepared.bytes_saved > 0
+    with Image.open(io.BytesIO(prepared.data)) as result:
+        assert not result.getexif()
+        assert max(result.size) <= 512
+
+    after = get_image_stats()
+    assert after["processed"] == before["processed"] + 1
+    assert after["bytes_saved"] - before["bytes_saved"] == prepared.bytes_saved
+
+
+def test_png_with_alpha_keeps_transparency():
+    image = Image.new("RGBA", (64, 64), (255, 0, 0, 0))
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+
+    prepared = prepare_image_for_ai(out.getvalue())
+
+    assert prepared.mime == "image/png"
+    assert prepared.resized is False
+
+
+def test_non_image_content_is_rejected_by_magic_bytes():
+    assert detect_image_format(b"%PDF-1.7 fake") is None
+    with pytest.raises(ImageRejectedError):
+        prepare_image_for_ai(b"<html>not an image</html>")
+    with pytest.raises(ImageRejectedError):
+        prepare_image_for_ai(b"\xff\xd8\xff" + b"\x00" * 32)
+
+
+def test_small_image_keeps_original_bytes_unless_it_has_metadata():
+    out = io.BytesIO()
+    Image.effect_noise((200, 100), 60).convert("RGB").save(out, format="JPEG", quality=40)
+    raw = out.getvalue()
+
+    prepared = prepare_image_for_ai(raw)
+
+    assert prepared.data == raw
+    assert (prepared.mime, prepared.resized) == ("image/jpeg", False)
+    assert (prepared.width, prepared.height) == (200, 100)
+
+    with_exif = _jpeg_with_exif((200, 100))
+    stripped = prepare_image_for_ai(with_exif)
+    assert stripped.data != with_exif
+    with Image.open(io.BytesIO(stripped.data)) as result:
+        assert not result.getexif()
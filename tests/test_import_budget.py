@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("pandas", "reportlab", "openpyxl")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+print(json.dumps({
+    "import_ms": (time.perf_counter() - started) * 1000,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def _probe() -> dict:
+    env = dict(os.environ, APP_WARMUP="false")
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_app_import_skips_heavy_dependencies_and_stays_within_budget():
+    data = _probe()
+
+    # pandas/ReportLab so carregam na primeira importacao, atividade ou PDF.
+    assert data["loaded"] == []
+    # Orcamento folgado (maquina de CI); hoje fica perto de 1s.
+    budget_ms = float(os.environ.get("IMPORT_BUDGET_MS", "4000"))
+    assert data["import_ms"] < budget_ms, data
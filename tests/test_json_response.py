@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import json
+
+from fastapi.testclient import TestClient
+
+from json_response import JSON_MEDIA_TYPE, UTF8JSONResponse, dumps
+from main import app
+
+
+def test_dumps_matches_stdlib_output():
+    content = {"titulo": "Operação em altura", "ids": [1, 2], "score": 1.5, "vazio": None, 3: "chave int"}
+    assert json.loads(dumps(content)) == {"titulo": "Operação em altura", "ids": [1, 2], "score": 1.5, "vazio": None, "3": "chave int"}
+    # UTF-8 direto, sem escapes \\uXXXX.
+    assert "Operação".encode("utf-8") in dumps(content)
+    response = UTF8JSONResponse({"ok": True})
+    assert response.headers["content-type"] == JSON_MEDIA_TYPE
+
+
+def test_json_routes_declare_utf8_charset(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(
+            client, headers, activity_name="Elétrica", titulo="APR Elétrica", descricao="Serialização"
+        )
+
+        responses = {
+            # response_model (pydantic dump_json)
+            "detail": client.get(f"/v1/aprs/{apr_id}", headers=headers),
+            # dict sem response_model (UTF8JSONResponse)
+            "health": client.get("/v1/health"),
+            # exception handlers
+            "not_found": client.get("/v1/aprs/999999999", headers=headers),
+            "unauthorized": client.get("/auth/me"),
+            "validation": client.post("/companies", json={}),
+        }
+        for name, response in responses.items():
+            assert response.headers["content-type"] == JSON_MEDIA_TYPE, name
+
+        assert responses["detail"].json()["activity_name"] == "Elétrica"
+        assert "Elétrica".encode("utf-8") in responses["detail"].content
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from main import app
+from metrics import REGISTRY
+
+
+def _sample(name: str, labels: dict) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_request_metrics_use_route_template_not_raw_path():
+    labels = {"method": "GET", "route": "/v1/aprs/{apr_id}", "status": "401"}
+    before = _sample("http_requests_total", labels)
+
+    with TestClient(app) as client:
+        client.get("/v1/aprs/123456")
+        client.get("/v1/aprs/654321")
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert _sample("http_requests_total", labels) == before + 2
+    assert _sample("http_request_duration_seconds_count", {"method": "GET", "route": "/v1/aprs/{apr_id}"}) >= 2
+    body = response.text
+    assert "/v1/aprs/123456" not in body
+    assert 'route="/v1/aprs/{apr_id}"' in body
+    assert "http_requests_in_flight" in body
+    assert "process_cpu_seconds_total" in body or "python_info" in body
+
+
+def test_unknown_paths_share_one_label():
+    labels = {"method": "GET", "route": "unmatched", "status": "404"}
+    before = _sample("http_requests_total", labels)
+
+    with TestClient(app) as client:
+        client.get("/nao-existe/1")
+        client.get("/nao-existe/2")
+
+    assert _sample("http_requests_total", labels) == before + 2
+
+
+def test_metrics_endpoint_requires_token_when_configured(monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "scrape-secret")
+
+    with TestClient(app) as client:
+        missing = client.get("/metrics")
+        wrong = client.get("/metrics", headers={"Authorization": "Bearer outro"})
+        ok = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+
+    assert missing.status_code == 401
+    assert wrong.status_code == 403
+    assert ok.status_code == 200
+    assert "http_requests_total" in ok.text
+
+
+def test_cache_events_are_exported():
+    from ai_cache import _bump
+
+    before = _sample("cache_events_total", {"cache": "ai", "result": "hit"})
+    _bump("hits")
+    assert _sample("cache_events_total", {"cache": "ai", "result": "hit"}) == before + 1
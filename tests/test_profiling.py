@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import os
+import pstats
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+import profiling
+from database import SessionLocal
+from main import app
+from models import User
+
+ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", "integration@example.com")
+
+
+def _admin_headers() -> dict[str, str]:
+    db = SessionLocal()
+    try:
+        token = db.execute(select(User.api_token).where(User.email == ADMIN_EMAIL)).scalar_one()
+    finally:
+        db.close()
+    return {"X-API-Token": token}
+
+
+@pytest.fixture
+def profile_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_RATE_LIMIT_PER_MINUTE", "50")
+    profiling.rate_limiter.reset()
+    yield tmp_path
+    profiling.rate_limiter.reset()
+
+
+def test_admin_can_profile_sync_handler_and_fetch_result(profile_env):
+    with TestClient(app) as client:
+        headers = _admin_headers()
+        response = client.get("/v1/db/pool/stats", headers={**headers, "X-Profile": "1"})
+        assert response.status_code == 200
+        profile_id = response.headers["x-profile-id"]
+
+        listed = client.get("/v1/profiles", headers=headers)
+        detail = client.get(f"/v1/profiles/{profile_id}", headers=headers)
+        raw = client.get(f"/v1/profiles/{profile_id}/pstats", headers=headers)
+
+    assert [item["id"] for item in listed.json()["items"]] == [profile_id]
+    meta = detail.json()
+    assert meta["route"] == "/v1/db/pool/stats"
+    assert meta["status"] == 200
+    # O perfil foi ligado na thread do threadpool que rodou o handler sync.
+    assert "estatisticas_pool_banco" in meta["summary"]
+    assert raw.status_code == 200
+    stats_file = profile_env / "downloaded.pstats"
+    stats_file.write_bytes(raw.content)
+    assert pstats.Stats(str(stats_file)).total_calls > 0
+
+
+def test_request_without_admin_credentials_is_not_profiled(profile_env):
+    with TestClient(app) as client:
+        invalid = client.get("/auth/me", headers={"Authorization": "Bearer invalido", "X-Profile": "1"})
+        anonymous = client.get("/v1/activities", headers={"X-Profile": "1"})
+
+    assert invalid.status_code == 401
+    assert "x-profile-id" not in invalid.headers
+    assert "x-profile-id" not in anonymous.headers
+    assert list(profile_env.glob("*.json")) == []
+
+
+def test_profiling_is_rate_limited(profile_env, monkeypatch):
+    monkeypatch.setenv("PROFILE_RATE_LIMIT_PER_MINUTE", "1")
+    with TestClient(app) as client:
+        headers = {**_admin_headers(), "X-Profile": "1"}
+        first = client.get("/auth/me", headers=headers)
+        second = client.get("/auth/me", headers=headers)
+
+    assert "x-profile-id" in first.headers
+    assert second.status_code == 200
+    assert "x-profile-id" not in second.headers
+    assert second.headers["x-profile-status"] == "rate_limited"
+
+
+def test_ring_buffer_keeps_last_profiles(profile_env, monkeypatch):
+    monkeypatch.setenv("PROFILE_KEEP", "2")
+    with TestClient(app) as client:
+        headers = {**_admin_headers(), "X-Profile": "1"}
+        ids = [client.get("/auth/me", headers=headers).headers["x-profile-id"] for _ in range(3)]
+
+    kept = sorted(path.stem for path in profile_env.glob("*.json"))
+    assert kept == sorted(ids[1:])
+    assert sorted(path.stem for path in profile_env.glob("*.pstats")) == kept
+
+
+def test_profile_ids_cannot_escape_profile_dir(profile_env):
+    assert profiling.load_profile("../secrets") is None
+    assert profiling.profile_stats_path("..") is None
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import logging
+
+from fastapi.testclient import TestClient
+
+import query_stats
+from main import app
+
+
+def _create_apr(client: TestClient, headers: dict[str, str], apr_factory) -> int:
+    apr_id = apr_factory.apr(client, headers)
+    step = client.post(
+        f"/v1/aprs/{apr_id}/passos",
+        json={"ordem": 1, "descricao": "Passo", "perigos": "Queda", "riscos": "Lesao", "epis": "Capacete"},
+        headers=headers,
+    )
+    assert step.status_code == 200, step.text
+    return apr_id
+
+
+def _server_timing_queries(response) -> int:
+    header = response.headers["server-timing"]
+    assert header.startswith("db;dur=")
+    return int(header.split('desc="', 1)[1].split(" ", 1)[0])
+
+
+def test_server_timing_reports_request_queries(sql_queries, apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        sql_queries.reset()
+        response = client.get("/auth/me", headers=headers)
+
+    assert response.status_code == 200
+    assert _server_timing_queries(response) == sql_queries.count
+
+
+def test_authentication_does_not_load_user_collections(sql_queries, apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        for _ in range(3):
+            _create_apr(client, headers, apr_factory)
+        sql_queries.reset()
+        response = client.get("/auth/me", headers=headers)
+
+    assert response.status_code == 200
+    # Usuario + empresa; antes as APRs (com passos e itens) vinham junto.
+    assert sql_queries.count <= 3, sql_queries.statements
+
+
+def test_apr_list_and_detail_query_count_does_not_grow_with_data(sql_queries, apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = _create_apr(client, headers, apr_factory)
+        sql_queries.reset()
+        client.get("/v1/aprs?limit=20", headers=headers)
+        list_one = sql_queries.count
+        sql_queries.reset()
+        client.get(f"/v1/aprs/{apr_id}", headers=headers)
+        detail_one = sql_queries.count
+
+        for _ in range(4):
+            _create_apr(client, headers, apr_factory)
+        sql_queries.reset()
+        client.get("/v1/aprs?limit=20", headers=headers)
+        list_many = sql_queries.count
+        sql_queries.reset()
+        client.get(f"/v1/aprs/{apr_id}", headers=headers)
+        detail_many = sql_queries.count
+
+    assert list_many == list_one
+    assert detail_many == detail_one
+    assert detail_one <= 8
+
+
+def test_budget_and_repeated_selects_are_flagged(monkeypatch, caplog):
+    monkeypatch.setenv("SQL_QUERY_BUDGET", "3")
+    stats = query_stats.QueryStats()
+    for _ in range(query_stats.N_PLUS_ONE_THRESHOLD):
+        stats.add("SELECT passos.id FROM passos WHERE passos.apr_id = ?", 0.1)
+
+    with caplog.at_level(logging.WARNING, logger="query_stats"):
+        exceeded = query_stats.check_budget(stats, method="GET", route="/v1/aprs")
+
+    assert exceeded is True
+    assert "possivel N+1" in caplog.text
+    assert query_stats.BUDGET_VIOLATIONS[-1]["queries"] == query_stats.N_PLUS_ONE_THRESHOLD
+    query_stats.BUDGET_VIOLATIONS.clear()
+
+
+def test_repeated_inserts_are_not_reported_as_n_plus_one():
+    stats = query_stats.QueryStats()
+    for _ in range(10):
+        stats.add("INSERT INTO passo_items (passo_id) VALUES (?)", 0.1)
+
+    assert stats.repeated() == []
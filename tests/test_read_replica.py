@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import async_database
+import database
+from main import app
+from models import EPI
+
+
+def _use_replica(monkeypatch, tmp_path, marker: str) -> None:
+    path = tmp_path / "replica.db"
+    engine = create_engine(f"sqlite:///{path}")
+    database.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with factory() as db:
+        db.add(EPI(epi=f"EPI so na replica {marker}"))
+        db.commit()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    monkeypatch.setattr(database, "ReplicaSessionLocal", factory)
+    monkeypatch.setattr(
+        async_database,
+        "AsyncReplicaSessionLocal",
+        async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False),
+    )
+
+
+def _epis_found(client: TestClient, headers: dict[str, str], marker: str) -> int:
+    response = client.get("/v1/epis", params={"search": marker}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["total"]
+
+
+def test_reads_use_replica_until_client_writes(tmp_path, monkeypatch, apr_factory):
+    marker = uuid4().hex[:8]
+    with TestClient(app) as client:
+        writer = apr_factory.company(client)
+        reader = apr_factory.company(client)
+        _use_replica(monkeypatch, tmp_path, marker)
+        monkeypatch.setenv("DB_REPLICA_PIN_SECONDS", "60")
+
+        assert _epis_found(client, writer, marker) == 1
+        assert _epis_found(client, {**reader, "X-Read-Consistency": "strong"}, marker) == 0
+
+        apr_id = apr_factory.apr(client, writer)
+
+        # Quem escreveu le do primario (ve a propria APR); os demais seguem na replica.
+        assert _epis_found(client, writer, marker) == 0
+        detail = client.get(f"/v1/aprs/{apr_id}", headers=writer)
+        assert detail.status_code == 200, detail.text
+        assert _epis_found(client, reader, marker) == 1
+
+
+def test_failed_writes_do_not_pin(tmp_path, monkeypatch, apr_factory):
+    marker = uuid4().hex[:8]
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        _use_replica(monkeypatch, tmp_path, marker)
+
+        rejected = client.post("/v1/aprs", json={}, headers=headers)
+        assert rejected.status_code >= 400
+
+        assert _epis_found(client, headers, marker) == 1
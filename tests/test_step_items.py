@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+import step_items
+from database import SessionLocal, engine
+from main import app
+from models import EPI, Perigo, PassoItem, RiskItem
+
+
+def _seed_catalog(suffix: str) -> tuple[int, int, str, str]:
+    hazard_name = f"Queda de altura {suffix}"
+    epi_name = f"Cinto paraquedista {suffix}"
+    db = SessionLocal()
+    try:
+        perigo = Perigo(perigo=hazard_name, default_probability=3, default_severity=4)
+        epi = EPI(epi=epi_name)
+        db.add_all([perigo, epi])
+        db.commit()
+        return perigo.id, epi.id, hazard_name, epi_name
+    finally:
+        db.close()
+
+
+def _items(passo_id: int) -> list[tuple[str, int, str, int | None, int | None]]:
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(PassoItem.kind, PassoItem.position, PassoItem.label, PassoItem.perigo_id, PassoItem.epi_id)
+            .where(PassoItem.passo_id == passo_id)
+            .order_by(PassoItem.kind, PassoItem.position)
+        ).all()
+        return [tuple(row) for row in rows]
+    finally:
+        db.close()
+
+
+def _item_ids(passo_id: int) -> dict[str, int]:
+    db = SessionLocal()
+    try:
+        return dict(db.execute(select(PassoItem.kind, PassoItem.id).where(PassoItem.passo_id == passo_id)).all())
+    finally:
+        db.close()
+
+
+def test_step_items_follow_step_fields_and_link_catalog(apr_factory):
+    with TestClient(app) as client:
+        perigo_id, epi_id, hazard_name, epi_name = _seed_catalog(uuid4().hex[:8])
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        step = client.post(
+            f"/v1/aprs/{apr_id}/passos",
+            json={
+                "ordem": 1,
+                "descricao": "Montar andaime",
+                "perigos": f"{hazard_name.upper()}; Ruido",
+                "riscos": "Fratura por queda",
+                "medidas_controle": "Linha de vida, isolamento",
+                "epis": f"{epi_name}; Luvas",
+                "normas": "NR-35",
+            },
+            headers=headers,
+        )
+        assert step.status_code == 200, step.text
+        passo_id = step.json()["id"]
+
+        assert _items(passo_id) == [
+            ("control", 0, "Linha de vida", None, None),
+            ("control", 1, "isolamento", None, None),
+            ("epi", 0, epi_name, None, epi_id),
+            ("epi", 1, "Luvas", None, None),
+            ("hazard", 0, hazard_name, perigo_id, None),
+            ("hazard", 1, "Ruido", None, None),
+            ("norm", 0, "NR-35", None, None),
+            ("risk", 0, "Fratura por queda", None, None),
+        ]
+
+        db = SessionLocal()
+        try:
+            risk = db.execute(select(RiskItem).where(RiskItem.step_id == passo_id)).scalar_one()
+        finally:
+            db.close()
+        assert (risk.hazard_id, risk.probability, risk.severity) == (perigo_id, 3, 4)
+
+        second_apr = apr_factory.apr(client, headers)
+        client.post(
+            f"/v1/aprs/{second_apr}/passos",
+            json={"ordem": 1, "descricao": "Subir escada", "epis": epi_name},
+            headers=headers,
+        )
+
+        updated = client.patch(
+            f"/v1/aprs/{apr_id}/passos/{passo_id}",
+            json={"epis": "Luvas; Oculos"},
+            headers=headers,
+        )
+        assert updated.status_code == 200, updated.text
+        assert [item for item in _items(passo_id) if item[0] == "epi"] == [
+            ("epi", 0, "Luvas", None, None),
+            ("epi", 1, "Oculos", None, None),
+        ]
+
+        client.patch(
+            f"/v1/aprs/{apr_id}/passos/{passo_id}",
+            json={"epis": f"{epi_name}; Luvas"},
+            headers=headers,
+        )
+        top = client.get("/v1/account/analytics/epis", headers=headers)
+
+    assert top.status_code == 200, top.text
+    assert top.json()[0] == {"label": epi_name, "catalog_id": epi_id, "aprs": 2, "steps": 2}
+    assert {"label": "Luvas", "catalog_id": None, "aprs": 1, "steps": 1} in top.json()
+
+
+def test_catalog_lookups_cached_until_catalog_version_changes():
+    step_items.clear_catalog_lookups()
+    suffix = uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        first = step_items.catalog_lookups(db)
+        assert step_items.catalog_lookups(db) is first
+    finally:
+        db.close()
+
+    _, epi_id, _, epi_name = _seed_catalog(suffix)
+    db = SessionLocal()
+    try:
+        hazards, epis = step_items.catalog_lookups(db)
+        assert (hazards, epis) is not first
+        assert epis[epi_name.lower()] == (epi_id, epi_name)
+    finally:
+        db.close()
+
+
+def test_step_update_rebuilds_only_changed_fields(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        step = client.post(
+            f"/v1/aprs/{apr_id}/passos",
+            json={"ordem": 1, "descricao": "Cortar", "perigos": "Corte", "riscos": "Lesao", "epis": "Luvas"},
+            headers=headers,
+        )
+        passo_id = step.json()["id"]
+        before = _item_ids(passo_id)
+
+        updated = client.patch(
+            f"/v1/aprs/{apr_id}/passos/{passo_id}", json={"riscos": "Lesao grave"}, headers=headers
+        )
+        assert updated.status_code == 200, updated.text
+        after = _item_ids(passo_id)
+        # Perigos e EPIs nao mudaram: as mesmas linhas continuam.
+        assert (after["hazard"], after["epi"]) == (before["hazard"], before["epi"])
+        assert ("risk", 0, "Lesao grave", None, None) in _items(passo_id)
+
+
+def _passo_items_migration():
+    path = Path(__file__).resolve().parents[1] / "alembic" / "versions" / "b8c9d0e1f2a3_add_passo_items.py"
+    spec = importlib.util.spec_from_file_location("migration_passo_items", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_backfill_matches_runtime_step_items(apr_factory):
+    # A migracao tem copia congelada das regras; se as regras do app mudarem,
+    # este teste mostra a divergencia (a revisao antiga continua como esta).
+    perigo_id, epi_id, hazard_name, epi_name = _seed_catalog(uuid4().hex[:8])
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        step = client.post(
+            f"/v1/aprs/{apr_id}/passos",
+            json={
+                "ordem": 1,
+                "descricao": "Montar andaime",
+                # Acentos, espacos e perigos repetidos (dentro e fora do catalogo).
+                "perigos": f"  {hazard_name.lower()} ;Ruído; ruído;Ruído ; {hazard_name}",
+                "riscos": "Fratura,  por queda; ;Corte",
+                "medidas_controle": "Linha de vida,isolamento;  Sinalização",
+                "epis": f"{epi_name.upper()}, Luvas;Luvas",
+                "normas": "NR-35; NR-18",
+            },
+            headers=headers,
+        )
+        assert step.status_code == 200, step.text
+        passo_id = step.json()["id"]
+
+    runtime = _items(passo_id)
+    with engine.connect() as connection:
+        backfill = [
+            tuple(row[name] for name in ("kind", "position", "label", "perigo_id", "epi_id"))
+            for row in _passo_items_migration().step_item_rows(connection)
+            if row["passo_id"] == passo_id
+        ]
+    assert sorted(backfill) == runtime
+    assert ("hazard", 0, hazard_name, perigo_id, None) in runtime
+    assert ("epi", 0, epi_name, None, epi_id) in runtime
+
+
+def test_hazard_imported_after_step_is_linked_on_rebuild(tmp_path, apr_factory):
+    import pandas as pd
+
+    from importar_excel import importar_perigos
+
+    hazard_name = f"Perigo importado {uuid4().hex[:8]}"
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        step = client.post(
+            f"/v1/aprs/{apr_id}/passos",
+            json={"ordem": 1, "descricao": "Soldar", "perigos": hazard_name.upper(), "riscos": "Queimadura"},
+            headers=headers,
+        )
+        passo_id = step.json()["id"]
+        assert ("hazard", 0, hazard_name.upper(), None, None) in _items(passo_id)
+
+        path = tmp_path / "perigos.xlsx"
+        pd.DataFrame([{"id": 1, "perigo": hazard_name}]).to_excel(path, index=False)
+        db = SessionLocal()
+        try:
+            assert importar_perigos(db, str(path))["perigos_inseridos"] == 1
+            perigo = db.execute(select(Perigo).where(Perigo.perigo == hazard_name)).scalar_one()
+            perigo.default_probability, perigo.default_severity = 2, 3
+            db.commit()
+            perigo_id = perigo.id
+        finally:
+            db.close()
+
+        # O texto dos perigos nao muda: o vinculo vem do rebuild dos riscos.
+        updated = client.patch(
+            f"/v1/aprs/{apr_id}/passos/{passo_id}", json={"descricao": "Soldar chapa"}, headers=headers
+        )
+        assert updated.status_code == 200, updated.text
+
+    assert ("hazard", 0, hazard_name, perigo_id, None) in _items(passo_id)
+    db = SessionLocal()
+    try:
+        risk = db.execute(select(RiskItem).where(RiskItem.step_id == passo_id)).scalar_one()
+    finally:
+        db.close()
+    assert (risk.hazard_id, risk.probability, risk.severity) == (perigo_id, 2, 3)
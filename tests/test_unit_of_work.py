@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from api_errors import ApiError
+from database import SessionLocal
+from main import app
+from models import APREvent, EPI, Passo, RiskItem
+from unit_of_work import unit_of_work
+
+
+@contextmanager
+def _count_commits():
+    commits: list[int] = []
+
+    def _on_commit(session):
+        commits.append(1)
+
+    event.listen(Session, "after_commit", _on_commit)
+    try:
+        yield commits
+    finally:
+        event.remove(Session, "after_commit", _on_commit)
+
+
+def test_step_mutations_commit_once_with_risk_items_and_event(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        with _count_commits() as commits:
+            apr_id = apr_factory.apr(client, headers)
+        assert len(commits) == 1
+
+        with _count_commits() as commits:
+            step = client.post(
+                f"/v1/aprs/{apr_id}/passos",
+                json={"ordem": 1, "descricao": "Subir na escada", "riscos": "Queda; Torcao"},
+                headers=headers,
+            )
+        assert step.status_code == 200, step.text
+        assert len(commits) == 1
+        passo_id = step.json()["id"]
+
+        with _count_commits() as commits:
+            updated = client.patch(
+                f"/v1/aprs/{apr_id}/passos/{passo_id}",
+                json={"riscos": "Queda"},
+                headers=headers,
+            )
+        assert updated.status_code == 200, updated.text
+        assert updated.json()["riscos"] == "Queda"
+        assert len(commits) == 1
+
+        with _count_commits() as commits:
+            bulk = client.post(
+                f"/v1/aprs/{apr_id}/steps/bulk",
+                json={"items": [{"step_order": 2, "description": "Descer", "risks": ["Escorregao"]}]},
+                headers=headers,
+            )
+        assert bulk.status_code == 200, bulk.text
+        assert len(commits) == 1
+        assert [p["ordem"] for p in bulk.json()["passos"]] == [1, 2]
+        assert len(bulk.json()["risk_items"]) == 2
+
+    db = SessionLocal()
+    try:
+        risk_count = len(db.execute(select(RiskItem).where(RiskItem.apr_id == apr_id)).scalars().all())
+        events = db.execute(select(APREvent.event).where(APREvent.apr_id == apr_id)).scalars().all()
+    finally:
+        db.close()
+    assert risk_count == 2
+    assert events.count("step_added") == 1
+    assert events.count("steps_bulk_added") == 1
+
+
+def test_conflicting_step_leaves_nothing_behind(apr_factory):
+    with TestClient(app) as client:
+        headers = apr_factory.company(client)
+        apr_id = apr_factory.apr(client, headers)
+        bulk = client.post(
+            f"/v1/aprs/{apr_id}/steps/bulk",
+            json={
+                "items": [
+                    {"step_order": 1, "description": "Passo A"},
+                    {"step_order": 1, "description": "Passo B"},
+                ]
+            },
+            headers=headers,
+        )
+        assert bulk.status_code == 409, bulk.text
+
+    db = SessionLocal()
+    try:
+        assert not db.execute(select(Passo).where(Passo.apr_id == apr_id)).scalars().all()
+    finally:
+        db.close()
+
+
+def test_unit_of_work_rolls_back_on_error():
+    name = f"EPI UoW {uuid4().hex[:8]}"
+    db = SessionLocal()
+    try:
+        with pytest.raises(ApiError):
+            with unit_of_work(db):
+                db.add(EPI(epi=name))
+                db.flush()
+                raise ApiError(status_code=400, code="validation_error", message="falha")
+        assert db.expire_on_commit is True
+        assert db.execute(select(EPI).where(EPI.epi == name)).scalar_one_or_none() is None
+    finally:
+        db.close()
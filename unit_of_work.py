@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+
+@contextmanager
+def unit_of_work(db: Session) -> Iterator[Session]:
+    """Executa mutacao, reconciliacao de risco e evento numa unica transacao.
+
+    O bloco deve usar db.flush() quando precisar de ids ou de linhas visiveis para
+    consultas seguintes; o commit acontece uma vez na saida e qualquer excecao
+    (inclusive ApiError) desfaz tudo. Durante o commit expire_on_commit fica
+    desligado, entao os objetos devolvidos pela rota continuam carregados sem um
+    SELECT extra por atributo.
+    """
+    previous = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.expire_on_commit = previous
+
+
+@asynccontextmanager
+async def async_unit_of_work(db: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """Versao asyncio de unit_of_work (a sessao ja nasce com expire_on_commit=False)."""
+    try:
+        yield db
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise